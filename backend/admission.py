@@ -0,0 +1,177 @@
+"""Допуск запросов: лимиты частоты на клиента и сброс нагрузки при перегрузке.
+
+Проверки идут до маршрутизации и до обращения к БД, отказ стоит микросекунды:
+- 503 с Retry-After, если запросов в обработке слишком много или соединения
+  из пула в последнее время выдаются слишком медленно;
+- 429 с Retry-After, если у пользователя (sub из JWT) или у IP кончились токены
+  в ведре; дорогие маршруты (bcrypt, генерация пользователей, поиск) расходуют
+  отдельное, более строгое ведро.
+"""
+import math
+import os
+from abc import ABC, abstractmethod
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import orjson
+from jose import JWTError, jwt
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from metrics import REGISTRY, recent_pool_wait
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes")
+# Ведра токенов: скорость пополнения (запросов в секунду) и ёмкость (допустимый всплеск)
+RATE_LIMIT_USER_PER_SECOND = float(os.getenv("RATE_LIMIT_USER_PER_SECOND", "20"))
+RATE_LIMIT_USER_BURST = float(os.getenv("RATE_LIMIT_USER_BURST", "60"))
+RATE_LIMIT_IP_PER_SECOND = float(os.getenv("RATE_LIMIT_IP_PER_SECOND", "50"))
+RATE_LIMIT_IP_BURST = float(os.getenv("RATE_LIMIT_IP_BURST", "150"))
+RATE_LIMIT_EXPENSIVE_PER_SECOND = float(os.getenv("RATE_LIMIT_EXPENSIVE_PER_SECOND", "0.5"))
+RATE_LIMIT_EXPENSIVE_BURST = float(os.getenv("RATE_LIMIT_EXPENSIVE_BURST", "10"))
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+# Сброс нагрузки: максимум запросов в обработке и недавнего ожидания соединения из пула (0 — выключено)
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "256"))
+ADMISSION_MAX_POOL_WAIT_MS = float(os.getenv("ADMISSION_MAX_POOL_WAIT_MS", "250"))
+# Брать IP клиента из X-Forwarded-For (только за своим прокси)
+ADMISSION_TRUST_FORWARDED = os.getenv("ADMISSION_TRUST_FORWARDED", "false").lower() in ("1", "true", "yes")
+
+# Служебные маршруты и долгие SSE-соединения не лимитируются и не занимают слоты
+EXEMPT_PATHS = ("/metrics", "/stats/", "/docs", "/openapi.json", "/users/posts/stream")
+
+admission_rejected_total = REGISTRY.counter(
+    "admission_rejected_total", "Requests rejected before routing", ("reason",))
+
+
+class RateLimitStore(ABC):
+    """Хранилище вёдер токенов. Асинхронный интерфейс — чтобы можно было подключить
+    общее для всех воркеров хранилище (например, Redis со скриптом на ведро)."""
+
+    @abstractmethod
+    async def take(self, key: Tuple, rate: float, burst: float, cost: float = 1.0) -> float:
+        """Списывает cost токенов; 0 — разрешено, иначе через сколько секунд повторить."""
+
+
+class MemoryRateLimitStore(RateLimitStore):
+    """Вёдра в памяти процесса, LRU по числу ключей. Лимит действует на каждый воркер отдельно."""
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[Tuple, Tuple[float, float]]" = OrderedDict()
+
+    async def take(self, key: Tuple, rate: float, burst: float, cost: float = 1.0) -> float:
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            tokens = burst
+        else:
+            tokens, updated = bucket
+            tokens = min(burst, tokens + (now - updated) * rate)
+            self._buckets.move_to_end(key)
+        if tokens >= cost:
+            self._buckets[key] = (tokens - cost, now)
+            retry_after = 0.0
+        else:
+            self._buckets[key] = (tokens, now)
+            retry_after = (cost - tokens) / rate if rate > 0 else 60.0
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return retry_after
+
+
+def is_expensive(method: str, path: str, query_string: bytes) -> bool:
+    # bcrypt при входе и регистрации, пачка пользователей, массовая генерация, поиск
+    if method == "POST" and path in ("/users/", "/users/login", "/users/random", "/users/seed"):
+        return True
+    return method == "GET" and path == "/users/" and b"search=" in query_string
+
+
+class AdmissionMiddleware:
+    def __init__(
+        self,
+        app: ASGIApp,
+        store: Optional[RateLimitStore] = None,
+        rate_limit_enabled: bool = RATE_LIMIT_ENABLED,
+        max_in_flight: int = ADMISSION_MAX_IN_FLIGHT,
+        max_pool_wait_ms: float = ADMISSION_MAX_POOL_WAIT_MS,
+    ):
+        self.app = app
+        self.store = store or MemoryRateLimitStore()
+        self.rate_limit_enabled = rate_limit_enabled
+        self.max_in_flight = max_in_flight
+        self.max_pool_wait = max_pool_wait_ms / 1000
+        self.in_flight = 0
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["method"] == "OPTIONS" or scope["path"].startswith(EXEMPT_PATHS):
+            await self.app(scope, receive, send)
+            return
+
+        if self.max_in_flight and self.in_flight >= self.max_in_flight:
+            await self._reject(send, 503, "shed_in_flight", "Server is overloaded, try again later", 1)
+            return
+        if self.max_pool_wait and recent_pool_wait() > self.max_pool_wait:
+            await self._reject(send, 503, "shed_pool_wait", "Server is overloaded, try again later", 1)
+            return
+
+        if self.rate_limit_enabled:
+            retry_after = await self._take_tokens(scope)
+            if retry_after:
+                await self._reject(send, 429, "rate_limited", "Too many requests", retry_after)
+                return
+
+        self.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.in_flight -= 1
+
+    async def _take_tokens(self, scope: Scope) -> float:
+        ip, token = self._client(scope)
+        user = self._user(token) if token else None
+        if is_expensive(scope["method"], scope["path"], scope["query_string"]):
+            # Своё ведро на каждый дорогой маршрут; ключ — пользователь, а без токена — IP
+            retry_after = await self.store.take(
+                ("expensive", scope["path"], user or ip), RATE_LIMIT_EXPENSIVE_PER_SECOND, RATE_LIMIT_EXPENSIVE_BURST)
+            if retry_after:
+                return retry_after
+        if user is not None:
+            retry_after = await self.store.take(("user", user), RATE_LIMIT_USER_PER_SECOND, RATE_LIMIT_USER_BURST)
+            if retry_after:
+                return retry_after
+        return await self.store.take(("ip", ip), RATE_LIMIT_IP_PER_SECOND, RATE_LIMIT_IP_BURST)
+
+    def _client(self, scope: Scope) -> Tuple[str, Optional[str]]:
+        ip = scope["client"][0] if scope.get("client") else "unknown"
+        token = None
+        for name, value in scope["headers"]:
+            if name == b"authorization":
+                scheme, _, credentials = value.decode("latin-1").partition(" ")
+                if scheme.lower() == "bearer" and credentials:
+                    token = credentials
+            elif name == b"x-forwarded-for" and ADMISSION_TRUST_FORWARDED:
+                ip = value.decode("latin-1").split(",")[0].strip() or ip
+        return ip, token
+
+    @staticmethod
+    def _user(token: str) -> Optional[str]:
+        # Подпись здесь не проверяется (это сделает маршрут): поддельный sub даёт лишь
+        # отдельное ведро, а запрос всё равно расходует ведро своего IP
+        try:
+            sub = jwt.get_unverified_claims(token).get("sub")
+        except JWTError:
+            return None
+        return str(sub) if sub else None
+
+    async def _reject(self, send: Send, status_code: int, reason: str, message: str, retry_after: float):
+        admission_rejected_total.inc((reason,))
+        body = orjson.dumps({"status_code": str(status_code), "message": message, "detail": None})
+        await send({
+            "type": "http.response.start",
+            "status": status_code,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
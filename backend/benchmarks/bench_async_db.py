@@ -0,0 +1,104 @@
+"""Сравнение пропускной способности синхронного и асинхронного слоя БД.
+
+Запуск (из папки backend):
+    python benchmarks/bench_async_db.py --latency-ms 5
+
+Используется локальный SQLite-файл (aiosqlite для асинхронного пути).
+Чтобы смоделировать сетевую задержку настоящей БД, каждый SQL-запрос
+засыпает на --latency-ms внутри потока драйвера.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from benchdb import add_reset_argument, check_reset_allowed, use_bench_database
+
+BENCH_DATABASE_URL = use_bench_database("bench_async_db")
+
+from sqlalchemy import event, insert
+
+from database import Base, engine, async_engine, SessionLocal, AsyncSessionLocal
+from models import User, Post
+from repositories import PostRepository, AsyncPostRepository
+
+
+def seed(users: int = 100, posts: int = 1000):
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(insert(User), [
+            {"id": i, "login": f"user{i}", "name": f"User {i}", "password_hash": "", "password_salt": ""}
+            for i in range(1, users + 1)
+        ])
+        conn.execute(insert(Post), [
+            {"id": i, "title": f"Post {i}", "content": "lorem ipsum", "user_id": i % users + 1}
+            for i in range(1, posts + 1)
+        ])
+    engine.dispose()
+
+
+def install_latency(latency_ms: float):
+    delay = latency_ms / 1000
+
+    def trace(_statement):
+        time.sleep(delay)
+
+    @event.listens_for(engine, "connect")
+    def on_sync_connect(dbapi_connection, _record):
+        dbapi_connection.set_trace_callback(trace)
+
+    @event.listens_for(async_engine.sync_engine, "connect")
+    def on_async_connect(dbapi_connection, _record):
+        # Колбэк выполняется в потоке aiosqlite и не блокирует event loop
+        dbapi_connection.run_async(lambda conn: conn.set_trace_callback(trace))
+
+
+async def sync_worker(n: int):
+    for _ in range(n):
+        db = SessionLocal()
+        try:
+            PostRepository(db).get_posts(skip=0, limit=10, current_user_id=1)
+        finally:
+            db.close()
+
+
+async def async_worker(n: int):
+    for _ in range(n):
+        async with AsyncSessionLocal() as db:
+            await AsyncPostRepository(db).get_posts(skip=0, limit=10, current_user_id=1)
+
+
+async def measure(worker, concurrency: int, total: int) -> float:
+    per_worker = max(1, total // concurrency)
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(per_worker) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return per_worker * concurrency / elapsed
+
+
+async def main(args):
+    # Прогрев пулов соединений
+    await measure(sync_worker, 1, 5)
+    await measure(async_worker, 1, 5)
+    print(f"{'concurrency':>12} {'sync req/s':>12} {'async req/s':>12}")
+    for concurrency in args.concurrency:
+        sync_rps = await measure(sync_worker, concurrency, args.requests)
+        async_rps = await measure(async_worker, concurrency, args.requests)
+        print(f"{concurrency:>12} {sync_rps:>12.1f} {async_rps:>12.1f}")
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    add_reset_argument(parser)
+    args = parser.parse_args()
+    check_reset_allowed(BENCH_DATABASE_URL, args.reset_db)
+    seed()
+    install_latency(args.latency_ms)
+    asyncio.run(main(args))
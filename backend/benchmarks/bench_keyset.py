@@ -0,0 +1,80 @@
+"""Сравнение OFFSET- и keyset-пагинации ленты на глубоких страницах.
+
+Запуск (из папки backend):
+    python benchmarks/bench_keyset.py --posts 200000 --page 10000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from benchdb import add_reset_argument, check_reset_allowed, use_bench_database
+
+BENCH_DATABASE_URL = use_bench_database("bench_keyset")
+
+from sqlalchemy import insert
+
+from database import Base, engine, async_engine, AsyncSessionLocal
+from models import User, Post
+from repositories import AsyncPostRepository
+
+PAGE_SIZE = 10
+
+
+def seed(posts: int):
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(insert(User), [{"id": 1, "login": "author", "name": "Author", "password_hash": "", "password_salt": ""}])
+        chunk = 50000
+        for start in range(1, posts + 1, chunk):
+            conn.execute(insert(Post), [
+                {"id": i, "title": f"Post {i}", "content": "lorem ipsum", "user_id": 1}
+                for i in range(start, min(start + chunk, posts + 1))
+            ])
+    engine.dispose()
+
+
+async def timed(coro_factory, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await coro_factory()
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return timings[len(timings) // 2] * 1000
+
+
+async def main(args):
+    async with AsyncSessionLocal() as db:
+        repo = AsyncPostRepository(db)
+        # id последнего поста предыдущей страницы — то, что лежит в курсоре
+        last_id_before_page = args.posts - (args.page - 1) * PAGE_SIZE + 1
+
+        offset_first = await timed(lambda: repo.get_posts(skip=0, limit=PAGE_SIZE), args.repeat)
+        offset_deep = await timed(lambda: repo.get_posts(skip=(args.page - 1) * PAGE_SIZE, limit=PAGE_SIZE), args.repeat)
+        keyset_first = await timed(lambda: repo.get_posts(skip=0, limit=PAGE_SIZE), args.repeat)
+        keyset_deep = await timed(lambda: repo.get_posts(skip=0, limit=PAGE_SIZE, after_id=last_id_before_page), args.repeat)
+
+        offset_page = await repo.get_posts(skip=(args.page - 1) * PAGE_SIZE, limit=PAGE_SIZE)
+        keyset_page = await repo.get_posts(skip=0, limit=PAGE_SIZE, after_id=last_id_before_page)
+        assert [p.id for p in offset_page] == [p.id for p in keyset_page]
+
+    print(f"{'mode':>8} {'page 1, ms':>12} {f'page {args.page}, ms':>16}")
+    print(f"{'offset':>8} {offset_first:>12.2f} {offset_deep:>16.2f}")
+    print(f"{'keyset':>8} {keyset_first:>12.2f} {keyset_deep:>16.2f}")
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--posts", type=int, default=200000)
+    parser.add_argument("--page", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=20)
+    add_reset_argument(parser)
+    args = parser.parse_args()
+    check_reset_allowed(BENCH_DATABASE_URL, args.reset_db)
+    seed(args.posts)
+    asyncio.run(main(args))
@@ -0,0 +1,109 @@
+"""Задержка посторонних запросов во время шторма логинов.
+
+Запуск (из папки backend):
+    python benchmarks/bench_login_storm.py --logins 64 --duration 5
+
+Сравнивает bcrypt прямо в event loop (executor=inline, как было раньше)
+с пулом хеширования и печатает p50/p99 для GET /users/posts/.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from benchdb import add_reset_argument, check_reset_allowed, use_bench_database
+
+BENCH_DATABASE_URL = use_bench_database("bench_login_storm")
+# Шторм логинов упирается в лимит дорогих маршрутов раньше, чем в пул хеширования
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+import httpx
+from sqlalchemy import insert
+
+import routers
+from database import Base, engine, async_engine
+from main import app
+from models import User, Post
+from services import PasswordHasher, _bcrypt_hash
+
+PASSWORD = "password123"
+
+
+def seed(rounds: int):
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    password_hash = _bcrypt_hash(PASSWORD, rounds)
+    with engine.begin() as conn:
+        conn.execute(insert(User), [
+            {"id": i, "login": f"user{i}", "name": f"User {i}", "password_hash": password_hash, "password_salt": ""}
+            for i in range(1, 101)
+        ])
+        conn.execute(insert(Post), [
+            {"id": i, "title": f"Post {i}", "content": "lorem ipsum", "user_id": i % 100 + 1}
+            for i in range(1, 1001)
+        ])
+    engine.dispose()
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))] * 1000
+
+
+async def run(hasher: PasswordHasher, logins: int, duration: float):
+    routers.password_hasher = hasher
+    transport = httpx.ASGITransport(app=app)
+    statuses = {}
+    latencies = []
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        login = await client.post("/users/login", json={"login": "user1", "password": PASSWORD})
+        token = login.json().get("token") if login.status_code == 200 else None
+        if not token:
+            raise SystemExit(f"Login failed with {login.status_code}: {login.text} (is RATE_LIMIT_ENABLED on?)")
+        headers = {"Authorization": f"Bearer {token}"}
+        deadline = time.perf_counter() + duration
+
+        async def login_loop(i):
+            while time.perf_counter() < deadline:
+                r = await client.post("/users/login", json={"login": f"user{i % 100 + 1}", "password": PASSWORD})
+                statuses[r.status_code] = statuses.get(r.status_code, 0) + 1
+                if r.status_code == 503:
+                    await asyncio.sleep(float(r.headers.get("Retry-After", "1")))
+
+        async def probe_loop():
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                r = await client.get("/users/posts/?limit=10", headers=headers)
+                r.raise_for_status()
+                latencies.append(time.perf_counter() - started)
+                await asyncio.sleep(0.005)
+
+        await asyncio.gather(probe_loop(), *(login_loop(i) for i in range(logins)))
+    hasher.shutdown()
+    return latencies, statuses
+
+
+async def main(args):
+    print(f"{'executor':>10} {'probes':>7} {'p50, ms':>9} {'p99, ms':>9}  login statuses")
+    for kind in ("inline", "thread", "process"):
+        hasher = PasswordHasher(executor=kind, workers=args.workers, queue_limit=args.queue_limit, rounds=args.rounds)
+        latencies, statuses = await run(hasher, args.logins, args.duration)
+        print(f"{kind:>10} {len(latencies):>7} {percentile(latencies, 0.5):>9.1f} {percentile(latencies, 0.99):>9.1f}  {statuses}")
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logins", type=int, default=64, help="одновременных клиентов, которые логинятся")
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--rounds", type=int, default=12)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--queue-limit", type=int, default=16)
+    add_reset_argument(parser)
+    args = parser.parse_args()
+    check_reset_allowed(BENCH_DATABASE_URL, args.reset_db)
+    seed(args.rounds)
+    asyncio.run(main(args))
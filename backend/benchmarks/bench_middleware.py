@@ -0,0 +1,117 @@
+"""Накладные расходы middleware на запрос: BaseHTTPMiddleware + print против чистого ASGI + очередь логов.
+
+Приложения вызываются напрямую через ASGI, без сети и сервера, поэтому разница
+между вариантами — это именно стоимость middleware и логирования.
+
+Запуск (из папки backend):
+    python benchmarks/bench_middleware.py --requests 20000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.environ.setdefault("DATABASE_URL", "sqlite:///./bench_middleware.db")
+
+from fastapi import FastAPI, HTTPException, Request
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.responses import JSONResponse
+
+from exceptions import NotFoundException
+from log import setup_logging, shutdown_logging
+from middleware import AccessLogMiddleware, ExceptionHandlerMiddleware
+
+PAYLOAD = [{"id": i, "title": f"Post {i}", "content": "lorem ipsum", "user_id": 1, "likes_count": i} for i in range(10)]
+
+
+class LegacyExceptionHandlerMiddleware(BaseHTTPMiddleware):
+    # Прежняя версия middleware.py
+    async def dispatch(self, request: Request, call_next):
+        try:
+            return await call_next(request)
+        except Exception as e:
+            status_code = 500
+            detail = "Internal Server Error"
+            if isinstance(e, NotFoundException):
+                status_code = 404
+                detail = str(e)
+            elif isinstance(e, HTTPException):
+                status_code = e.status_code
+                detail = e.detail
+            return JSONResponse(status_code=status_code, content={"status_code": str(status_code), "message": detail, "detail": None})
+
+
+def build_app(variant: str) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/posts")
+    async def posts():
+        return PAYLOAD
+
+    if variant == "before":
+        # Прежний main.py: логирование через @app.middleware("http") и print
+        @app.middleware("http")
+        async def log_requests(request: Request, call_next):
+            print(f"Incoming request: {request.method} {request.url}")
+            response = await call_next(request)
+            print(f"Response status: {response.status_code}")
+            return response
+
+        app.add_middleware(LegacyExceptionHandlerMiddleware)
+    elif variant == "after":
+        app.add_middleware(ExceptionHandlerMiddleware)
+        app.add_middleware(AccessLogMiddleware)
+    return app
+
+
+async def call(app, scope):
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    await app(dict(scope), receive, send)
+
+
+async def run(app, requests: int) -> float:
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": "/posts", "raw_path": b"/posts", "root_path": "", "query_string": b"",
+        "headers": [(b"host", b"bench")], "client": ("127.0.0.1", 1234), "server": ("bench", 80),
+    }
+    # Прогрев: сборка стека middleware и первые вызовы
+    for _ in range(200):
+        await call(app, scope)
+    started = time.perf_counter()
+    for _ in range(requests):
+        await call(app, scope)
+    return (time.perf_counter() - started) / requests * 1_000_000
+
+
+def main(args):
+    out = sys.stdout
+    # Логи обоих вариантов уходят в /dev/null, чтобы не мерить скорость терминала;
+    # логгер уже настроен при импорте, перенастраиваем его на новый stdout
+    shutdown_logging()
+    sys.stdout = open(os.devnull, "w")
+    setup_logging(access_sample_rate=args.sample_rate)
+    try:
+        results = {variant: asyncio.run(run(build_app(variant), args.requests)) for variant in ("bare", "before", "after")}
+    finally:
+        shutdown_logging()
+        sys.stdout = out
+
+    bare = results["bare"]
+    print(f"{'variant':<8} {'us/request':>11} {'overhead us':>12}")
+    for variant, per_request in results.items():
+        print(f"{variant:<8} {per_request:>11.1f} {per_request - bare:>12.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--sample-rate", type=float, default=1.0, help="ACCESS_LOG_SAMPLE_RATE для варианта after")
+    main(parser.parse_args())
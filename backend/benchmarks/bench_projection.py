@@ -0,0 +1,100 @@
+"""CPU и память на страницу ленты: ORM + Pydantic против проекции колонок + orjson.
+
+Каждый вариант — запрос страницы и сериализация в байты ответа, как в GET /users/posts/.
+CPU считается по time.process_time, память — пик tracemalloc за одну страницу.
+
+Запуск (из папки backend):
+    python benchmarks/bench_projection.py --posts 20000 --limit 50 --pages 500
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+import tracemalloc
+from typing import List
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from benchdb import add_reset_argument, check_reset_allowed, use_bench_database
+
+BENCH_DATABASE_URL = use_bench_database("bench_projection")
+
+from pydantic import TypeAdapter
+from sqlalchemy import insert
+
+from database import Base, engine, async_engine, AsyncSessionLocal
+from models import User, Post, post_likes
+from projection import POST_FIELDS, dump_rows, parse_post_fields
+from repositories import AsyncPostRepository
+from schemas import PostResponse
+
+post_list_adapter = TypeAdapter(List[PostResponse])
+CONTENT = "lorem ipsum dolor sit amet " * 40
+
+
+def seed(posts: int):
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(insert(User), [{"id": 1, "login": "reader", "name": "Reader", "password_hash": "", "password_salt": ""}])
+        conn.execute(insert(Post), [
+            {"id": i, "title": f"Post {i}", "content": CONTENT, "user_id": 1, "likes_count": i % 2}
+            for i in range(1, posts + 1)
+        ])
+        conn.execute(insert(post_likes), [{"post_id": i, "user_id": 1} for i in range(1, posts + 1, 2)])
+    engine.dispose()
+
+
+def variants(repo: AsyncPostRepository, limit: int):
+    async def orm():
+        posts = await repo.get_posts(skip=0, limit=limit, current_user_id=1)
+        return post_list_adapter.dump_json(post_list_adapter.validate_python(posts, from_attributes=True))
+
+    def projection(fields):
+        async def load():
+            rows = await repo.get_post_rows(skip=0, limit=limit, fields=fields, current_user_id=1)
+            return dump_rows(rows, fields)
+        return load
+
+    return {
+        "orm+pydantic": orm,
+        "projection": projection(POST_FIELDS),
+        "fields=preview": projection(parse_post_fields("id,title,content_preview,likes_count,liked_by_me")),
+    }
+
+
+async def measure(load, pages: int):
+    await load()
+    started = time.process_time()
+    for _ in range(pages):
+        body = await load()
+    cpu_ms = (time.process_time() - started) * 1000 / pages
+
+    tracemalloc.start()
+    await load()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return cpu_ms, peak / 1024, len(body)
+
+
+async def main(args):
+    async with AsyncSessionLocal() as db:
+        repo = AsyncPostRepository(db)
+        print(f"{'variant':>16} {'cpu ms/page':>12} {'peak KiB':>10} {'body KiB':>10}")
+        for name, load in variants(repo, args.limit).items():
+            db.expunge_all()
+            cpu_ms, peak_kib, body = await measure(load, args.pages)
+            print(f"{name:>16} {cpu_ms:>12.3f} {peak_kib:>10.1f} {body / 1024:>10.1f}")
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--posts", type=int, default=20000)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--pages", type=int, default=500)
+    add_reset_argument(parser)
+    args = parser.parse_args()
+    check_reset_allowed(BENCH_DATABASE_URL, args.reset_db)
+    seed(args.posts)
+    asyncio.run(main(args))
@@ -0,0 +1,87 @@
+"""Пик памяти при выгрузке всех постов пользователя: список целиком против потока с yield_per.
+
+Для каждого размера выгрузки считается пик tracemalloc: у сборки в памяти он растёт
+вместе с числом строк, у потоковой выгрузки определяется размером пачки.
+
+Запуск (из папки backend):
+    python benchmarks/bench_streaming.py --sizes 10000 50000 100000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tracemalloc
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from benchdb import add_reset_argument, check_reset_allowed, use_bench_database
+
+BENCH_DATABASE_URL = use_bench_database("bench_streaming")
+
+from sqlalchemy import insert
+
+from database import Base, engine, async_engine, AsyncSessionLocal
+from models import User, Post
+from projection import POST_FIELDS, STREAM_BATCH_SIZE, dump_rows, iter_json_array
+from repositories import AsyncPostRepository
+
+
+def seed(sizes):
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(insert(User), [
+            {"id": user_id, "login": f"author{user_id}", "name": None, "password_hash": "", "password_salt": ""}
+            for user_id in range(1, len(sizes) + 1)
+        ])
+        next_id = 1
+        for user_id, size in enumerate(sizes, start=1):
+            conn.execute(insert(Post), [
+                {"id": next_id + i, "title": f"Post {i}", "content": "lorem ipsum dolor sit amet " * 8, "user_id": user_id}
+                for i in range(size)
+            ])
+            next_id += size
+    engine.dispose()
+
+
+async def in_memory(user_id: int) -> int:
+    async with AsyncSessionLocal() as db:
+        rows = await AsyncPostRepository(db).get_post_rows_by_user(user_id, POST_FIELDS, current_user_id=1, limit=10 ** 9)
+        return len(dump_rows(rows, POST_FIELDS))
+
+
+async def streamed(user_id: int) -> int:
+    async with AsyncSessionLocal() as db:
+        partitions = AsyncPostRepository(db).stream_post_rows_by_user(user_id, POST_FIELDS, current_user_id=1, batch_size=STREAM_BATCH_SIZE)
+        sent = 0
+        async for chunk in iter_json_array(partitions, POST_FIELDS):
+            sent += len(chunk)
+        return sent
+
+
+async def peak_kib(coro) -> float:
+    tracemalloc.start()
+    await coro
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 1024
+
+
+async def main(args):
+    print(f"{'rows':>8} {'in memory, KiB':>16} {'streamed, KiB':>15}")
+    for user_id, size in enumerate(args.sizes, start=1):
+        # Прогрев: пул соединений и кэш скомпилированных запросов не должны попасть в замер
+        await streamed(user_id)
+        memory = await peak_kib(in_memory(user_id))
+        stream = await peak_kib(streamed(user_id))
+        print(f"{size:>8} {memory:>16.0f} {stream:>15.0f}")
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 50000, 100000])
+    add_reset_argument(parser)
+    args = parser.parse_args()
+    check_reset_allowed(BENCH_DATABASE_URL, args.reset_db)
+    seed(args.sizes)
+    asyncio.run(main(args))
@@ -0,0 +1,31 @@
+"""База для бенчмарков.
+
+Бенчмарки пересоздают таблицы, поэтому берут адрес базы из BENCH_DATABASE_URL,
+а не из DATABASE_URL разработчика (по умолчанию — свой SQLite-файл в папке backend).
+Удалить таблицы в базе, отличной от SQLite, можно только с флагом --reset-db.
+
+Импортируется до database/main: подменяет DATABASE_URL, из которого строятся движки.
+"""
+import argparse
+import os
+
+from sqlalchemy.engine import make_url
+
+
+def use_bench_database(name: str) -> str:
+    url = os.getenv("BENCH_DATABASE_URL", f"sqlite:///./{name}.db")
+    os.environ["DATABASE_URL"] = url
+    return url
+
+
+def add_reset_argument(parser: argparse.ArgumentParser):
+    parser.add_argument("--reset-db", action="store_true", help="разрешить удалить таблицы в базе, отличной от SQLite")
+
+
+def check_reset_allowed(url: str, reset_db: bool):
+    if reset_db or make_url(url).get_backend_name() == "sqlite":
+        return
+    raise SystemExit(
+        f"Refusing to drop all tables in {make_url(url).render_as_string(hide_password=True)}: "
+        "the benchmark recreates the schema. Pass --reset-db if this database is disposable."
+    )
@@ -0,0 +1,318 @@
+"""Нагрузочный тест API по сценариям с отчётом p50/p95/p99 и проверкой регрессий.
+
+Поднимает main.app в этом же процессе (через ASGI, без сети) поверх базы,
+заполненной seeding.seed_database, либо бьёт в уже запущенный сервер (--base-url).
+Все случайные выборы детерминированы --seed.
+
+Запуск (из папки backend):
+    python benchmarks/loadtest.py --output results.json
+    python benchmarks/loadtest.py --scenarios feed_anonymous,user_search --duration 5
+    python benchmarks/loadtest.py --save-baseline baseline.json
+    python benchmarks/loadtest.py --baseline baseline.json --threshold 0.2   # код выхода 1 при регрессии
+
+Postgres (таблицы пересоздаются!): BENCH_DATABASE_URL=postgresql://... python benchmarks/loadtest.py --reset-db
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from benchdb import add_reset_argument, check_reset_allowed, use_bench_database
+
+BENCH_DATABASE_URL = use_bench_database("bench_loadtest")
+# Access-лог на каждый запрос мешал бы и замеру, и выводу таблицы
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+# Все виртуальные пользователи приходят с одного IP — лимиты на клиента исказили бы замер
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+import httpx
+from sqlalchemy import func, select
+
+from database import Base, engine, async_engine
+from models import User, Post
+from seeding import SEED_PASSWORD, seed_database
+from services import PASSWORD_HASH_ROUNDS
+
+
+@dataclass
+class Fixture:
+    """Данные из засеянной базы, из которых сценарии выбирают запросы."""
+    users: List[dict]
+    hot_post_ids: List[int]
+    author_ids: List[int]
+    tokens: List[str] = field(default_factory=list)
+
+
+@dataclass
+class ScenarioResult:
+    name: str
+    requests: int = 0
+    errors: int = 0
+    duration: float = 0.0
+    latencies: List[float] = field(default_factory=list)
+    statuses: Dict[str, int] = field(default_factory=dict)
+
+    def summary(self) -> dict:
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "throughput_rps": round(self.requests / self.duration, 2) if self.duration else 0.0,
+            "p50_ms": percentile(self.latencies, 0.50),
+            "p95_ms": percentile(self.latencies, 0.95),
+            "p99_ms": percentile(self.latencies, 0.99),
+            "statuses": self.statuses,
+        }
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * q))] * 1000, 3)
+
+
+def auth(token: str) -> dict:
+    return {"Authorization": f"Bearer {token}"}
+
+
+# Сценарий — функция (client, fixture, rnd) -> ответ одного запроса.
+# like_toggle делает по одному запросу за вызов: ставит лайк, а следующий вызов того же воркера его снимает
+
+async def feed_anonymous(client, fixture, rnd, state):
+    return await client.get("/users/posts/", params={"skip": 0, "limit": 10})
+
+
+async def feed_authenticated(client, fixture, rnd, state):
+    return await client.get("/users/posts/", params={"skip": 0, "limit": 10}, headers=auth(rnd.choice(fixture.tokens)))
+
+
+async def like_toggle(client, fixture, rnd, state):
+    pending = state.get("liked")
+    if pending:
+        post_id, token = pending
+        state["liked"] = None
+        return await client.delete(f"/users/posts/{post_id}/like", headers=auth(token))
+    post_id, token = rnd.choice(fixture.hot_post_ids), rnd.choice(fixture.tokens)
+    state["liked"] = (post_id, token)
+    return await client.post(f"/users/posts/{post_id}/like", headers=auth(token))
+
+
+async def login_burst(client, fixture, rnd, state):
+    user = rnd.choice(fixture.users)
+    return await client.post("/users/login", json={"login": user["login"], "password": SEED_PASSWORD})
+
+
+async def user_search(client, fixture, rnd, state):
+    name = rnd.choice(fixture.users)["name"] or "a"
+    start = rnd.randrange(max(1, len(name) - 3))
+    return await client.get("/users/", params={"search": name[start:start + 3], "limit": 10}, headers=auth(rnd.choice(fixture.tokens)))
+
+
+async def user_posts(client, fixture, rnd, state):
+    author_id = rnd.choice(fixture.author_ids)
+    return await client.get(f"/users/{author_id}/posts/", params={"limit": 20}, headers=auth(rnd.choice(fixture.tokens)))
+
+
+# Смешанная нагрузка: доли примерно как у живой ленты — в основном чтение
+MIXED_WEIGHTS = [
+    (feed_anonymous, 35),
+    (feed_authenticated, 30),
+    (user_posts, 15),
+    (user_search, 10),
+    (like_toggle, 9),
+    (login_burst, 1),
+]
+
+
+async def mixed(client, fixture, rnd, state):
+    scenario = rnd.choices([item[0] for item in MIXED_WEIGHTS], weights=[item[1] for item in MIXED_WEIGHTS])[0]
+    return await scenario(client, fixture, rnd, state)
+
+
+SCENARIOS: Dict[str, Callable] = {
+    "feed_anonymous": feed_anonymous,
+    "feed_authenticated": feed_authenticated,
+    "like_toggle": like_toggle,
+    "login_burst": login_burst,
+    "user_search": user_search,
+    "user_posts": user_posts,
+    "mixed": mixed,
+}
+
+
+def seed(args):
+    Base.metadata.drop_all(bind=engine)
+    seed_database(users=args.users, posts=args.posts, likes=args.likes, seed=args.seed, workers=args.seed_workers, rounds=args.rounds)
+    engine.dispose()
+
+
+def load_fixture(args) -> Fixture:
+    with engine.connect() as conn:
+        users = [dict(row._mapping) for row in conn.execute(select(User.id, User.login, User.name).order_by(User.id))]
+        hot_post_ids = list(conn.execute(
+            select(Post.id).order_by(Post.likes_count.desc(), Post.id).limit(args.hot_posts)
+        ).scalars())
+        # Авторы с наибольшим числом постов — их страницы смотрят чаще всего
+        author_ids = list(conn.execute(
+            select(Post.user_id).group_by(Post.user_id).order_by(func.count().desc(), Post.user_id).limit(100)
+        ).scalars())
+    engine.dispose()
+    if not users or not hot_post_ids:
+        raise SystemExit("Database is empty: run without --reuse-db to seed it")
+    return Fixture(users=users, hot_post_ids=hot_post_ids, author_ids=author_ids)
+
+
+async def login_viewers(client, fixture: Fixture, count: int, rnd: random.Random):
+    for user in rnd.sample(fixture.users, min(count, len(fixture.users))):
+        response = await client.post("/users/login", json={"login": user["login"], "password": SEED_PASSWORD})
+        response.raise_for_status()
+        fixture.tokens.append(response.json()["token"])
+
+
+async def run_scenario(client, name: str, fixture: Fixture, args) -> ScenarioResult:
+    scenario = SCENARIOS[name]
+    result = ScenarioResult(name=name)
+
+    async def worker(index: int, deadline: float, record: bool):
+        rnd = random.Random(f"{args.seed}:{name}:{index}")
+        state: dict = {}
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            retry_after = 0.0
+            try:
+                response = await scenario(client, fixture, rnd, state)
+                status = str(response.status_code)
+                if response.status_code == 503:
+                    retry_after = float(response.headers.get("Retry-After", "1"))
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            elapsed = time.perf_counter() - started
+            if retry_after:
+                # Сервер перегружен — как и настоящий клиент, ждём Retry-After (вне замера)
+                await asyncio.sleep(retry_after)
+            if not record:
+                continue
+            result.requests += 1
+            result.latencies.append(elapsed)
+            result.statuses[status] = result.statuses.get(status, 0) + 1
+            if not status.isdigit() or int(status) >= 500:
+                result.errors += 1
+
+    # Прогрев (кэши, пул соединений) в статистику не попадает
+    if args.warmup > 0:
+        deadline = time.perf_counter() + args.warmup
+        await asyncio.gather(*(worker(i, deadline, False) for i in range(args.concurrency)))
+    started = time.perf_counter()
+    deadline = started + args.duration
+    await asyncio.gather(*(worker(i, deadline, True) for i in range(args.concurrency)))
+    result.duration = time.perf_counter() - started
+    return result
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], threshold: float) -> List[str]:
+    # Регрессия: p95 выросла или пропускная способность упала больше чем на threshold
+    failures = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        if previous["p95_ms"] and current["p95_ms"] > previous["p95_ms"] * (1 + threshold):
+            failures.append(f"{name}: p95 {current['p95_ms']:.1f} ms > baseline {previous['p95_ms']:.1f} ms")
+        if previous["throughput_rps"] and current["throughput_rps"] < previous["throughput_rps"] * (1 - threshold):
+            failures.append(f"{name}: {current['throughput_rps']:.1f} rps < baseline {previous['throughput_rps']:.1f} rps")
+    return failures
+
+
+async def main(args) -> int:
+    names = args.scenarios.split(",") if args.scenarios else list(SCENARIOS)
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        raise SystemExit(f"Unknown scenarios: {', '.join(unknown)}")
+
+    if args.base_url:
+        client = httpx.AsyncClient(base_url=args.base_url, timeout=30)
+    else:
+        from main import app
+        # ASGITransport не вызывает lifespan — startup/shutdown приложения запускаем сами
+        await app.router.startup()
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://loadtest", timeout=30)
+
+    fixture = load_fixture(args)
+    results: Dict[str, dict] = {}
+    try:
+        await login_viewers(client, fixture, args.viewers, random.Random(args.seed))
+        print(f"{'scenario':<20} {'requests':>9} {'errors':>7} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+        for name in names:
+            summary = (await run_scenario(client, name, fixture, args)).summary()
+            results[name] = summary
+            print(
+                f"{name:<20} {summary['requests']:>9} {summary['errors']:>7} {summary['throughput_rps']:>9.1f} "
+                f"{summary['p50_ms']:>9.2f} {summary['p95_ms']:>9.2f} {summary['p99_ms']:>9.2f}"
+            )
+    finally:
+        await client.aclose()
+        if not args.base_url:
+            from main import app
+            await app.router.shutdown()
+        await async_engine.dispose()
+
+    report = {
+        "meta": {
+            "database": engine.dialect.name,
+            "target": args.base_url or "in-process",
+            "users": args.users, "posts": args.posts, "likes": args.likes, "seed": args.seed,
+            "concurrency": args.concurrency, "duration": args.duration,
+            "python": platform.python_version(),
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        },
+        "scenarios": results,
+    }
+    for path in filter(None, (args.output, args.save_baseline)):
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["scenarios"]
+        failures = compare(results, baseline, args.threshold)
+        for failure in failures:
+            print(f"REGRESSION {failure}")
+        if failures:
+            return 1
+        print(f"No regressions against {args.baseline} (threshold {args.threshold:.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenarios", help=f"через запятую, по умолчанию все: {', '.join(SCENARIOS)}")
+    parser.add_argument("--duration", type=float, default=10.0, help="секунд на сценарий")
+    parser.add_argument("--warmup", type=float, default=1.0, help="секунд прогрева перед замером")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--posts", type=int, default=20000)
+    parser.add_argument("--likes", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--seed-workers", type=int, default=1)
+    parser.add_argument("--rounds", type=int, default=PASSWORD_HASH_ROUNDS, help="стоимость bcrypt для засеянных паролей")
+    parser.add_argument("--viewers", type=int, default=20, help="сколько пользователей логинится для авторизованных сценариев")
+    parser.add_argument("--hot-posts", type=int, default=20, help="сколько самых популярных постов лайкать")
+    parser.add_argument("--reuse-db", action="store_true", help="не пересоздавать базу, если она уже засеяна")
+    parser.add_argument("--base-url", help="бить в запущенный сервер вместо main.app в этом процессе")
+    parser.add_argument("--output", help="куда записать результаты (JSON)")
+    parser.add_argument("--save-baseline", help="записать результаты как эталон")
+    parser.add_argument("--baseline", help="эталон для сравнения; при регрессии код выхода 1")
+    parser.add_argument("--threshold", type=float, default=0.2, help="допустимое ухудшение p95/rps, доля")
+    add_reset_argument(parser)
+    args = parser.parse_args()
+    if not args.reuse_db and not args.base_url:
+        check_reset_allowed(BENCH_DATABASE_URL, args.reset_db)
+        seed(args)
+    sys.exit(asyncio.run(main(args)))
@@ -0,0 +1,136 @@
+import asyncio
+import json
+import os
+from typing import AsyncIterator, Dict, Optional, Set
+
+from exceptions import ServiceUnavailableException
+from log import get_logger
+
+# Поток изменений ленты: окно склейки событий по одному посту, буфер на клиента (в кадрах),
+# период keep-alive и максимум одновременных подписчиков на воркер
+FEED_STREAM_COALESCE_MS = int(os.getenv("FEED_STREAM_COALESCE_MS", "250"))
+FEED_STREAM_CLIENT_BUFFER = int(os.getenv("FEED_STREAM_CLIENT_BUFFER", "32"))
+FEED_STREAM_HEARTBEAT_SECONDS = float(os.getenv("FEED_STREAM_HEARTBEAT_SECONDS", "15"))
+FEED_STREAM_MAX_CLIENTS = int(os.getenv("FEED_STREAM_MAX_CLIENTS", "10000"))
+
+logger = get_logger("broadcast")
+
+
+class Subscriber:
+    __slots__ = ("queue", "dropped")
+
+    def __init__(self, buffer: int):
+        self.queue: "asyncio.Queue[bytes]" = asyncio.Queue(maxsize=buffer)
+        self.dropped = False
+
+
+class Broadcaster:
+    """Pub/sub в пределах процесса для Server-Sent Events.
+
+    События по одному посту, пришедшие в течение окна, склеиваются в одно; раз в окно
+    пачка сериализуется один раз и раскладывается по очередям подписчиков. Клиент,
+    чья очередь переполнена (не успевает читать), отключается, а не тормозит остальных.
+    """
+
+    def __init__(
+        self,
+        coalesce_ms: int = FEED_STREAM_COALESCE_MS,
+        client_buffer: int = FEED_STREAM_CLIENT_BUFFER,
+        heartbeat_seconds: float = FEED_STREAM_HEARTBEAT_SECONDS,
+        max_clients: int = FEED_STREAM_MAX_CLIENTS,
+    ):
+        self.coalesce_seconds = coalesce_ms / 1000
+        self.client_buffer = client_buffer
+        self.heartbeat_seconds = heartbeat_seconds
+        self.max_clients = max_clients
+        self._subscribers: Set[Subscriber] = set()
+        self._pending: Dict[int, dict] = {}
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+
+    def subscribe(self) -> Subscriber:
+        if len(self._subscribers) >= self.max_clients:
+            raise ServiceUnavailableException("Too many stream clients, try again later", retry_after=5)
+        subscriber = Subscriber(self.client_buffer)
+        self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self._subscribers.discard(subscriber)
+
+    def publish(self, event_type: str, post: dict):
+        # post_created / post_changed несут изменившиеся поля поста, post_deleted — только id
+        self.published += 1
+        if not self._subscribers:
+            return
+        post_id = post["id"]
+        pending = self._pending.get(post_id)
+        if pending is None or event_type == "post_deleted":
+            self._pending[post_id] = {"type": event_type, "post": dict(post)}
+        elif pending["type"] != "post_deleted":
+            # Созданный в этом же окне пост остаётся post_created, только с новыми значениями
+            pending["post"].update(post)
+        if self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.coalesce_seconds, self._flush)
+
+    def _flush(self):
+        self._flush_handle = None
+        events = list(self._pending.values())
+        self._pending.clear()
+        if not events:
+            return
+        frame = f"data: {json.dumps(events, separators=(',', ':'), ensure_ascii=False)}\n\n".encode()
+        for subscriber in list(self._subscribers):
+            try:
+                subscriber.queue.put_nowait(frame)
+                self.delivered += 1
+            except asyncio.QueueFull:
+                self._drop(subscriber)
+
+    def _drop(self, subscriber: Subscriber):
+        subscriber.dropped = True
+        self._subscribers.discard(subscriber)
+        self.dropped += 1
+        # Буфер медленного клиента больше не нужен
+        while not subscriber.queue.empty():
+            subscriber.queue.get_nowait()
+        # Будим генератор, ждущий в queue.get(): соединение освобождается сразу, а не по heartbeat
+        subscriber.queue.put_nowait(b"")
+        logger.info("Dropped slow stream client", extra={"fields": {"buffer": self.client_buffer}})
+
+    async def stream(self, subscriber: Subscriber) -> AsyncIterator[bytes]:
+        try:
+            yield b"retry: 3000\n\n"
+            while not subscriber.dropped:
+                try:
+                    frame = await asyncio.wait_for(subscriber.queue.get(), timeout=self.heartbeat_seconds)
+                except asyncio.TimeoutError:
+                    # Комментарий SSE: держит соединение живым через прокси
+                    frame = b": ping\n\n"
+                if subscriber.dropped:
+                    break
+                yield frame
+        finally:
+            self.unsubscribe(subscriber)
+
+    def close_all(self):
+        for subscriber in list(self._subscribers):
+            subscriber.dropped = True
+            self._subscribers.discard(subscriber)
+            if not subscriber.queue.full():
+                # Будим генератор, ждущий в queue.get()
+                subscriber.queue.put_nowait(b"")
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        self._pending.clear()
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": len(self._subscribers),
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+        }
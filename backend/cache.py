@@ -0,0 +1,175 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, FrozenSet, Hashable, Optional, Set, Tuple
+
+# Кэш ответов ленты: максимум записей, байт и время жизни записи.
+# TTL страхует от изменений, сделанных другими процессами (инвалидация локальна для процесса)
+FEED_CACHE_MAX_ENTRIES = int(os.getenv("FEED_CACHE_MAX_ENTRIES", "10000"))
+FEED_CACHE_MAX_BYTES = int(os.getenv("FEED_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+FEED_CACHE_TTL_SECONDS = float(os.getenv("FEED_CACHE_TTL_SECONDS", "30"))
+
+
+@dataclass
+class CachedPage:
+    """Готовое тело ответа и то, от каких постов оно зависит."""
+    body: bytes
+    post_ids: FrozenSet[int]
+    # Страница по skip/limit (без курсора): сдвигается при появлении и удалении постов
+    offset_based: bool
+    min_post_id: Optional[int]
+    headers: Dict[str, str]
+    etag: str
+
+
+class ResponseCache:
+    """LRU-кэш готовых ответов с ограничением по памяти и single-flight на промахах.
+
+    Записи помечаются id постов, попавших в ответ, и сбрасываются точечно,
+    когда эти посты меняются (см. on_post_*).
+    """
+
+    def __init__(
+        self,
+        max_entries: int = FEED_CACHE_MAX_ENTRIES,
+        max_bytes: int = FEED_CACHE_MAX_BYTES,
+        ttl: float = FEED_CACHE_TTL_SECONDS,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, Tuple[CachedPage, float]]" = OrderedDict()
+        self._keys_by_post: Dict[int, Set[Hashable]] = {}
+        self._offset_keys: Set[Hashable] = set()
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        # Растёт при каждой инвалидации: результат загрузки, начатой раньше, не кладём в кэш
+        self._generation = 0
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.max_bytes > 0
+
+    def get(self, key: Hashable) -> Optional[CachedPage]:
+        # Только чтение из кэша, без загрузки; промах здесь не считается
+        entry = self._entries.get(key)
+        if entry is None or entry[1] <= time.monotonic():
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[CachedPage]]) -> CachedPage:
+        if not self.enabled:
+            return await loader()
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            page, expires_at = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return page
+            self._discard(key)
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            # Такой же запрос уже идёт в БД — ждём его результат
+            self.coalesced += 1
+            return await asyncio.shield(inflight)
+
+        self.misses += 1
+        # Загрузка идёт отдельной задачей: отмена запроса-инициатора не отменяет её
+        # и не передаётся тем, кто ждёт того же ключа
+        task = asyncio.get_running_loop().create_task(self._load(key, loader))
+        self._inflight[key] = task
+        # Если все ждавшие отменены, исключение загрузки некому забрать — забираем сами
+        task.add_done_callback(lambda done: done.cancelled() or done.exception())
+        return await asyncio.shield(task)
+
+    async def _load(self, key: Hashable, loader: Callable[[], Awaitable[CachedPage]]) -> CachedPage:
+        generation = self._generation
+        try:
+            page = await loader()
+        finally:
+            del self._inflight[key]
+        if generation == self._generation:
+            self._store(key, page)
+        return page
+
+    def _store(self, key: Hashable, page: CachedPage):
+        size = len(page.body)
+        if size > self.max_bytes:
+            return
+        self._discard(key)
+        self._entries[key] = (page, time.monotonic() + self.ttl)
+        self.bytes += size
+        for post_id in page.post_ids:
+            self._keys_by_post.setdefault(post_id, set()).add(key)
+        if page.offset_based:
+            self._offset_keys.add(key)
+        while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+            self._discard(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _discard(self, key: Hashable) -> bool:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        page = entry[0]
+        self.bytes -= len(page.body)
+        for post_id in page.post_ids:
+            keys = self._keys_by_post.get(post_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_post[post_id]
+        self._offset_keys.discard(key)
+        return True
+
+    def _invalidate(self, keys):
+        self._generation += 1
+        for key in list(keys):
+            if self._discard(key):
+                self.invalidations += 1
+
+    def on_post_created(self, post_id: int):
+        # Новый пост с наибольшим id попадает в начало ленты: сдвигаются все страницы по skip,
+        # страницы по курсору содержат только посты старше курсора и не меняются
+        self._invalidate(self._offset_keys)
+
+    def on_post_changed(self, post_id: int):
+        # Правка поста, лайк или снятие лайка — только ответы, где этот пост есть
+        self._invalidate(self._keys_by_post.get(post_id, ()))
+
+    def on_post_deleted(self, post_id: int):
+        # Кроме ответов с этим постом сдвигаются страницы по skip, лежащие ниже него в ленте
+        shifted = [
+            key for key in self._offset_keys
+            if self._entries[key][0].min_post_id is None or self._entries[key][0].min_post_id < post_id
+        ]
+        self._invalidate(set(self._keys_by_post.get(post_id, ())) | set(shifted))
+
+    def clear(self):
+        self._invalidate(list(self._entries))
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_ratio": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "inflight": len(self._inflight),
+        }
@@ -0,0 +1,70 @@
+"""Служебные команды бэкенда.
+
+Запуск из папки backend:
+    python cli.py reconcile-likes
+    python cli.py trim-timelines --max-length 800
+    python cli.py seed --users 1000000 --posts 3000000 --likes 30000000 --workers 4
+"""
+import argparse
+
+from database import SessionLocal
+from repositories import PostRepository, TimelineRepository
+from seeding import seed_database
+from timeline import TIMELINE_MAX_LENGTH
+
+
+def reconcile_likes(args):
+    db = SessionLocal()
+    try:
+        fixed = PostRepository(db).reconcile_likes_count()
+        print(f"Reconciled likes_count for {fixed} posts")
+    finally:
+        db.close()
+
+
+def trim_timelines(args):
+    db = SessionLocal()
+    try:
+        removed = TimelineRepository(db).trim_all(args.max_length)
+        print(f"Removed {removed} home timeline entries")
+    finally:
+        db.close()
+
+
+def seed(args):
+    seed_database(
+        users=args.users,
+        posts=args.posts,
+        likes=args.likes,
+        seed=args.seed,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="StudPract backend commands")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    reconcile = subparsers.add_parser("reconcile-likes", help="Пересчитать posts.likes_count по таблице post_likes")
+    reconcile.set_defaults(func=reconcile_likes)
+
+    trim = subparsers.add_parser("trim-timelines", help="Обрезать домашние ленты до последних max-length постов")
+    trim.add_argument("--max-length", type=int, default=TIMELINE_MAX_LENGTH)
+    trim.set_defaults(func=trim_timelines)
+
+    seeder = subparsers.add_parser("seed", help="Сгенерировать синтетических пользователей, посты и лайки")
+    seeder.add_argument("--users", type=int, default=10000)
+    seeder.add_argument("--posts", type=int, default=50000)
+    seeder.add_argument("--likes", type=int, default=500000, help="примерное общее число лайков")
+    seeder.add_argument("--seed", type=int, default=42)
+    seeder.add_argument("--workers", type=int, default=1, help="процессов для генерации строк")
+    seeder.add_argument("--chunk-size", type=int, default=10000)
+    seeder.set_defaults(func=seed)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
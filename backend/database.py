@@ -1,31 +1,132 @@
 import os
 from dotenv import load_dotenv
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from log import get_logger
+from profiling import SqlProfiler, SQL_PROFILING
+from metrics import instrument_engine
+from replicas import ReplicaSet
 
 load_dotenv()
 
+logger = get_logger("database")
+
+def normalize_url(url: str) -> str:
+    if url.startswith("postgres://"):
+        return url.replace("postgres://", "postgresql://", 1)
+    return url
+
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL")
-print(f"SQLALCHEMY_DATABASE_URL: {SQLALCHEMY_DATABASE_URL}") 
 
-if SQLALCHEMY_DATABASE_URL and SQLALCHEMY_DATABASE_URL.startswith("postgres://"):
-    SQLALCHEMY_DATABASE_URL = SQLALCHEMY_DATABASE_URL.replace("postgres://", "postgresql://")
+if SQLALCHEMY_DATABASE_URL:
+    SQLALCHEMY_DATABASE_URL = normalize_url(SQLALCHEMY_DATABASE_URL)
 
 if not SQLALCHEMY_DATABASE_URL:
     raise ValueError("DATABASE_URL environment variable not set")
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+# Реплики только для чтения, через запятую; пусто — все запросы идут на DATABASE_URL
+DATABASE_REPLICA_URLS = [normalize_url(url.strip()) for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+
+# Пул соединений: постоянные соединения, сколько можно открыть сверх них, ожидание свободного (сек),
+# пересоздание соединений старше DB_POOL_RECYCLE сек (-1 — никогда) и проверка соединения перед выдачей
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+# Предел времени одного SQL-запроса, мс (0 — без предела); задаётся на стороне Postgres
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))
+
+logger.info(f"SQLALCHEMY_DATABASE_URL: {make_url(SQLALCHEMY_DATABASE_URL).render_as_string(hide_password=True)}")
+
+def to_async_url(url: str) -> str:
+    # Подменяем синхронный драйвер на асинхронный (asyncpg / aiosqlite)
+    scheme, rest = url.split("://", 1)
+    dialect = scheme.split("+", 1)[0]
+    if dialect == "postgresql":
+        return f"postgresql+asyncpg://{rest}"
+    if dialect == "sqlite":
+        return f"sqlite+aiosqlite://{rest}"
+    return url
+
+ASYNC_SQLALCHEMY_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or to_async_url(SQLALCHEMY_DATABASE_URL)
+
+def engine_options(url: str) -> dict:
+    parsed = make_url(url)
+    options = {"pool_pre_ping": DB_POOL_PRE_PING}
+    # SQLite в памяти живёт в одном соединении, размеры пула к нему неприменимы
+    if not (parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:")):
+        options.update(
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+        )
+    if DB_STATEMENT_TIMEOUT_MS and parsed.get_backend_name() == "postgresql":
+        if parsed.get_driver_name() == "asyncpg":
+            options["connect_args"] = {"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}}
+        else:
+            options["connect_args"] = {"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"}
+    return options
+
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **engine_options(SQLALCHEMY_DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Асинхронный движок: запросы не блокируют event loop
+async_engine = create_async_engine(ASYNC_SQLALCHEMY_DATABASE_URL, **engine_options(ASYNC_SQLALCHEMY_DATABASE_URL))
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+replica_engines = [create_async_engine(to_async_url(url), **engine_options(to_async_url(url))) for url in DATABASE_REPLICA_URLS]
+read_replicas = ReplicaSet(replica_engines)
+for url in DATABASE_REPLICA_URLS:
+    logger.info(f"Read replica: {make_url(url).render_as_string(hide_password=True)}")
+
+# Ожидание соединения и загрузка пулов — в /metrics
+instrument_engine(engine, "sync")
+instrument_engine(async_engine.sync_engine, "async")
+for number, replica in enumerate(replica_engines, start=1):
+    instrument_engine(replica.sync_engine, f"replica{number}")
+
+# Профилирование SQL по запросам (Server-Timing, медленные запросы, N+1); переключается на лету
+sql_profiler = SqlProfiler([engine, async_engine.sync_engine, *(replica.sync_engine for replica in replica_engines)])
+if SQL_PROFILING:
+    sql_profiler.enable()
+
 Base = declarative_base()
 
 def init_db():
     Base.metadata.create_all(bind=engine)
 
+async def init_async_db():
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+async def open_read_session(prefer_primary: bool = False) -> AsyncSession:
+    # Сессия только для чтения: следующая здоровая реплика или primary, если реплик нет,
+    # все исключены или читателю нужны его собственные свежие записи
+    replica = None if prefer_primary else read_replicas.pick()
+    if replica is not None:
+        db = AsyncSessionLocal(bind=replica)
+        try:
+            # Соединение берётся сразу: недоступная реплика исключается, а чтение уходит на primary
+            await db.connection()
+            return db
+        except (DBAPIError, OSError) as e:
+            await db.close()
+            read_replicas.eject(replica, e)
+    return AsyncSessionLocal()
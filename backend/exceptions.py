@@ -1,4 +1,10 @@
 class NotFoundException(Exception):
     def __init__(self, message: str):
         self.message = message
-        super().__init__(self.message)
\ No newline at end of file
+        super().__init__(self.message)
+
+class ServiceUnavailableException(Exception):
+    def __init__(self, message: str, retry_after: int = 1):
+        self.message = message
+        self.retry_after = retry_after
+        super().__init__(self.message)
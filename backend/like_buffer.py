@@ -0,0 +1,259 @@
+"""Отложенная запись лайков (write-behind) для всплесков на популярных постах.
+
+С LIKE_WRITE_BEHIND=true like/unlike не пишут в БД сами: намерение запоминается
+в буфере по ключу (post_id, user_id) вместе с тем, что сейчас записано в БД.
+Лайк и снятие лайка в пределах окна взаимно гасятся — в БД не уходит ничего.
+Буфер сбрасывается пачкой каждые LIKE_FLUSH_INTERVAL_MS или сразу по достижении
+LIKE_FLUSH_MAX_ENTRIES записей: одна транзакция на пачку вместо транзакции на лайк
+и одно обновление счётчика на пост вместо обновления на каждый лайк.
+
+Пока запись не сброшена, чтения накладывают буфер поверх данных из БД (liked_by_me,
+likes_count и версия для ETag) — пользователь видит свой лайк сразу. Буфер живёт
+в памяти процесса: другие воркеры увидят лайк после сброса. При остановке буфер
+сбрасывается до конца.
+"""
+import asyncio
+import os
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.orm.attributes import set_committed_value
+
+from database import AsyncSessionLocal
+from log import get_logger
+from repositories import AsyncPostRepository
+
+LIKE_WRITE_BEHIND = os.getenv("LIKE_WRITE_BEHIND", "false").lower() in ("1", "true", "yes")
+LIKE_FLUSH_INTERVAL_MS = float(os.getenv("LIKE_FLUSH_INTERVAL_MS", "20"))
+LIKE_FLUSH_MAX_ENTRIES = int(os.getenv("LIKE_FLUSH_MAX_ENTRIES", "500"))
+
+logger = get_logger("like_buffer")
+
+Key = Tuple[int, int]
+
+
+@dataclass
+class PendingLike:
+    liked: bool
+    # Что записано в БД (или будет записано сбрасываемой сейчас пачкой)
+    persisted: bool
+
+
+class LikeBuffer:
+    def __init__(
+        self,
+        enabled: bool = LIKE_WRITE_BEHIND,
+        flush_interval_ms: float = LIKE_FLUSH_INTERVAL_MS,
+        max_entries: int = LIKE_FLUSH_MAX_ENTRIES,
+    ):
+        self.enabled = enabled
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_entries = max_entries
+        self._pending: Dict[Key, PendingLike] = {}
+        # Пачка, которая сейчас пишется в БД: для наложения она ещё не сброшена
+        self._in_flight: Dict[Key, PendingLike] = {}
+        # Ожидаемое изменение likes_count по постам (pending + in-flight)
+        self._deltas: Dict[int, int] = {}
+        self._has_entries: Optional[asyncio.Event] = None
+        self._full: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._on_flushed: Optional[Callable[[Dict[int, int]], Awaitable[None]]] = None
+        self.flushes = 0
+        self.cancelled = 0
+        self.written = 0
+
+    def on_flushed(self, callback: Callable[[Dict[int, int]], Awaitable[None]]):
+        # callback получает {post_id: новый likes_count} постов, изменённых пачкой
+        self._on_flushed = callback
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def _change_delta(self, post_id: int, delta: int):
+        value = self._deltas.get(post_id, 0) + delta
+        if value:
+            self._deltas[post_id] = value
+        else:
+            self._deltas.pop(post_id, None)
+
+    def pending_state(self, post_id: int, user_id: int) -> Optional[bool]:
+        # Несброшенное состояние лайка; None — в буфере ничего нет, верна БД
+        entry = self._pending.get((post_id, user_id)) or self._in_flight.get((post_id, user_id))
+        return entry.liked if entry is not None else None
+
+    async def persisted_states(self, db, post_ids: List[int], user_id: int) -> Dict[int, bool]:
+        # Состояние "в БД" для новых записей; пачка в полёте считается уже записанной
+        states = {}
+        unknown = []
+        for post_id in post_ids:
+            entry = self._in_flight.get((post_id, user_id))
+            if entry is not None:
+                states[post_id] = entry.liked
+            elif (post_id, user_id) not in self._pending:
+                unknown.append(post_id)
+        if unknown:
+            liked = set(await AsyncPostRepository(db).get_liked_post_ids(unknown, user_id))
+            states.update({post_id: post_id in liked for post_id in unknown})
+        return states
+
+    def record(self, post_id: int, user_id: int, liked: bool, persisted: Optional[bool] = None) -> bool:
+        # True — видимое состояние изменилось. persisted нужен, только если записи в буфере ещё нет
+        key = (post_id, user_id)
+        entry = self._pending.get(key)
+        if entry is None:
+            persisted = (not liked) if persisted is None else persisted
+            if persisted == liked:
+                return False
+            self._pending[key] = PendingLike(liked, persisted)
+            self._change_delta(post_id, 1 if liked else -1)
+        elif entry.liked == liked:
+            return False
+        else:
+            # Лайк и снятие в одном окне гасят друг друга
+            del self._pending[key]
+            self._change_delta(post_id, 1 if liked else -1)
+            self.cancelled += 1
+            return True
+        self._ensure_running()
+        self._has_entries.set()
+        if len(self._pending) >= self.max_entries:
+            self._full.set()
+        return True
+
+    # Наложение буфера на прочитанные из БД данные
+
+    def overlay_rows(self, rows: Iterable[Any], user_id: Optional[int]) -> List[Any]:
+        # rows — RowMapping проекции; изменённые строки заменяются словарями
+        rows = list(rows)
+        if not self._deltas and not self._pending and not self._in_flight:
+            return rows
+        result = []
+        for row in rows:
+            post_id = row["id"]
+            delta = self._deltas.get(post_id, 0)
+            liked = self.pending_state(post_id, user_id) if user_id is not None else None
+            if not delta and liked is None:
+                result.append(row)
+                continue
+            row = dict(row)
+            if delta and "likes_count" in row:
+                row["likes_count"] += delta
+            if liked is not None and "liked_by_me" in row:
+                row["liked_by_me"] = liked
+            # Другая версия — другой ETag: 304 по состоянию до лайка не вернётся
+            row["version"] += 1
+            result.append(row)
+        return result
+
+    def overlay_posts(self, posts: Iterable[Any], user_id: Optional[int]):
+        # То же для ORM-объектов; значения ставятся как загруженные, чтобы сессия не записала их в БД
+        for post in posts:
+            delta = self._deltas.get(post.id, 0)
+            liked = self.pending_state(post.id, user_id) if user_id is not None else None
+            if not delta and liked is None:
+                continue
+            set_committed_value(post, "likes_count", post.likes_count + delta)
+            set_committed_value(post, "version", post.version + 1)
+            if liked is not None:
+                post.liked_by_me = liked
+
+    def overlay_liked(self, liked_ids: Iterable[int], post_ids: Iterable[int], user_id: int) -> Dict[int, bool]:
+        liked_ids = set(liked_ids)
+        states = {}
+        for post_id in post_ids:
+            pending = self.pending_state(post_id, user_id)
+            states[post_id] = pending if pending is not None else post_id in liked_ids
+        return states
+
+    def has_pending_for(self, user_id: Optional[int]) -> bool:
+        if user_id is None:
+            return False
+        return any(key[1] == user_id for key in self._pending) or any(key[1] == user_id for key in self._in_flight)
+
+    # Сброс в БД
+
+    async def flush(self):
+        if not self._pending or self._in_flight:
+            return
+        self._in_flight, self._pending = self._pending, {}
+        changes = {key: entry.liked for key, entry in self._in_flight.items()}
+        try:
+            async with AsyncSessionLocal() as db:
+                likes_counts = await AsyncPostRepository(db).apply_likes(changes)
+        except Exception as e:
+            logger.error(f"Error in like buffer flush, {len(changes)} entries kept for retry: {e}")
+            # Более новые намерения, пришедшие во время сброса, важнее
+            for key, entry in self._in_flight.items():
+                newer = self._pending.get(key)
+                if newer is None:
+                    self._pending[key] = entry
+                elif newer.liked == entry.persisted:
+                    del self._pending[key]
+                else:
+                    newer.persisted = entry.persisted
+            self._in_flight = {}
+            return
+        for (post_id, _), entry in self._in_flight.items():
+            self._change_delta(post_id, -1 if entry.liked else 1)
+        self._in_flight = {}
+        self.flushes += 1
+        self.written += len(changes)
+        if self._on_flushed is not None and likes_counts:
+            try:
+                await self._on_flushed(likes_counts)
+            except Exception as e:
+                logger.error(f"Error in like buffer flush callback: {e}")
+
+    async def _run(self):
+        while True:
+            await self._has_entries.wait()
+            if self._stopping:
+                return
+            try:
+                # Копим записи окно flush_interval или до заполнения пачки
+                await asyncio.wait_for(self._full.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            if self._stopping:
+                return
+            self._has_entries.clear()
+            self._full.clear()
+            await self.flush()
+            if self._pending:
+                self._has_entries.set()
+                if len(self._pending) >= self.max_entries:
+                    self._full.set()
+
+    def _ensure_running(self):
+        if self._task is None or self._task.done():
+            # События создаются вместе с задачей — в том же event loop
+            self._stopping = False
+            self._has_entries = asyncio.Event()
+            self._full = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def drain(self, attempts: int = 3):
+        # Остановка: фоновая задача дописывает текущую пачку и выходит, остаток пишется здесь.
+        # Задачу не отменяем — отмена посреди сброса потеряла бы пачку
+        if self._task is not None:
+            self._stopping = True
+            self._has_entries.set()
+            self._full.set()
+            await self._task
+            self._task = None
+        while self._pending and attempts > 0:
+            await self.flush()
+            attempts -= 1
+        if self._pending:
+            logger.error(f"Like buffer drained with {len(self._pending)} unsaved entries")
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "pending": len(self._pending),
+            "in_flight": len(self._in_flight),
+            "flushes": self.flushes,
+            "written": self.written,
+            "cancelled": self.cancelled,
+        }
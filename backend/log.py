@@ -0,0 +1,102 @@
+"""Структурированное логирование без блокировки event loop.
+
+Записи кладутся в очередь (QueueHandler), а в stdout их пишет отдельный поток
+(QueueListener). Формат — JSON-строка на запись или обычный текст.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Уровень логов, формат (json/text) и доля записываемых access-логов (0..1)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+ACCESS_LOG_SAMPLE_RATE = float(os.getenv("ACCESS_LOG_SAMPLE_RATE", "1.0"))
+
+_listener: Optional[QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = getattr(record, "fields", None)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает только долю rate записей ниже WARNING; предупреждения и ошибки — всегда."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or self.rate >= 1 or random.random() < self.rate
+
+
+class _NonBlockingQueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Форматирование (json.dumps, traceback) откладываем до потока-слушателя:
+        # в очередь идёт сама запись, только с уже подставленными аргументами
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def setup_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT, access_sample_rate: float = ACCESS_LOG_SAMPLE_RATE):
+    global _listener
+    if _listener is not None:
+        return
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=False)
+    _listener.start()
+    # При выходе из процесса (CLI, бенчмарки) дописываем очередь до конца
+    atexit.register(shutdown_logging)
+
+    app_logger = logging.getLogger("app")
+    app_logger.handlers[:] = [_NonBlockingQueueHandler(log_queue)]
+    app_logger.setLevel(level)
+    app_logger.propagate = False
+    logging.getLogger("app.access").filters[:] = [SamplingFilter(access_sample_rate)]
+
+
+def shutdown_logging():
+    # Дописывает всё, что осталось в очереди
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def get_logger(name: str) -> logging.Logger:
+    setup_logging()
+    return logging.getLogger(f"app.{name}")
@@ -1,29 +1,68 @@
-from fastapi import FastAPI, Request
+import os
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from routers import router
-from database import init_db
+from routers import router, password_hasher, feed_cache, feed_broadcaster, token_service, home_timelines, trending_posts, like_buffer, user_search
+from database import async_engine, init_async_db, read_replicas, sql_profiler
+from admission import AdmissionMiddleware
+from middleware import AccessLogMiddleware, CompressionMiddleware, ExceptionHandlerMiddleware, MetricsMiddleware, SqlProfilingMiddleware
+from metrics import REGISTRY, CallbackCounter, register_cache
+from log import get_logger, setup_logging, shutdown_logging
 
-app = FastAPI()
+logger = get_logger("main")
+
+# Включать и выключать SQL-профилирование через API можно только там, где это разрешено
+PROFILING_ENDPOINT_ENABLED = os.getenv("PROFILING_ENDPOINT_ENABLED", "false").lower() in ("1", "true", "yes")
 
-# Логирование запросов
-@app.middleware("http")
-async def log_requests(request: Request, call_next):
-    print(f"Incoming request: {request.method} {request.url}")
-    response = await call_next(request)
-    print(f"Response status: {response.status_code}")
-    return response
+app = FastAPI()
 
 # Инициализация базы данных при запуске
 @app.on_event("startup")
 async def startup_event():
-    print("Starting up database...")
+    setup_logging()
+    logger.info("Starting up database...")
     try:
-        init_db()
-        print("Database initialized successfully")
+        await init_async_db()
+        logger.info("Database initialized successfully")
+        # Рейтинг популярных постов — из последнего снимка, дальше снимки пишутся периодически
+        await trending_posts.start()
+        user_search.start(async_engine.dialect.name)
     except Exception as e:
-        print(f"Failed to initialize database: {e}")
+        logger.exception("Failed to initialize database")
         raise e
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    password_hasher.shutdown()
+    feed_broadcaster.close_all()
+    # Несброшенные лайки дописываются до снимка рейтинга и до закрытия логов
+    await like_buffer.drain()
+    await trending_posts.stop()
+    await user_search.stop()
+    shutdown_logging()
     
+# Ошибки в JSON, access-лог и сжатие; CORS добавляется последним и оборачивает их снаружи
+app.add_middleware(ExceptionHandlerMiddleware)
+app.add_middleware(SqlProfilingMiddleware)
+# Лимиты и сброс нагрузки — до маршрутизации, но внутри метрик и access-лога, чтобы отказы было видно
+app.add_middleware(AdmissionMiddleware)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(AccessLogMiddleware)
+app.add_middleware(CompressionMiddleware)
+
+register_cache("feed", feed_cache.stats)
+register_cache("auth_principal", token_service.cache.stats)
+REGISTRY.callback_gauge("db_replicas_healthy", "Read replicas currently in rotation", (), lambda: {(): read_replicas.stats()["healthy"]})
+REGISTRY.register(CallbackCounter(
+    "db_replica_ejections_total", "Read replicas taken out of rotation after connection errors", (),
+    lambda: {(): read_replicas.stats()["ejections"]}))
+REGISTRY.callback_gauge("trending_tracked_posts", "Posts with a live trending score", (), lambda: {(): trending_posts.stats()["tracked"]})
+REGISTRY.callback_gauge("like_buffer_pending", "Like changes waiting for write-behind flush", (), lambda: {(): like_buffer.stats()["pending"]})
+REGISTRY.callback_gauge("feed_stream_subscribers", "Open feed stream connections", (), lambda: {(): feed_broadcaster.stats()["subscribers"]})
+REGISTRY.register(CallbackCounter(
+    "feed_stream_dropped_clients_total", "Slow feed stream clients disconnected since process start", (),
+    lambda: {(): feed_broadcaster.stats()["dropped"]}))
+
 # Настройка CORS
 app.add_middleware(
     CORSMiddleware,
@@ -35,10 +74,31 @@ app.add_middleware(
     allow_credentials=True, 
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "Server-Timing"],
 )
 
 app.include_router(router)
 
+# Счётчики кэша ленты: доля попаданий и сколько промахов схлопнуто в один запрос к БД
+@app.get("/stats/cache")
+async def cache_stats():
+    return {"feed": feed_cache.stats(), "feed_stream": feed_broadcaster.stats(), "home_timelines": home_timelines.stats(), "trending": trending_posts.stats(), "like_buffer": like_buffer.stats()}
+
+# Метрики процесса в текстовом формате Prometheus
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.put("/stats/sql-profiling")
+async def set_sql_profiling(enabled: bool):
+    if not PROFILING_ENDPOINT_ENABLED:
+        raise HTTPException(status_code=403, detail="Profiling control is disabled")
+    if enabled:
+        sql_profiler.enable()
+    else:
+        sql_profiler.disable()
+    return {"enabled": sql_profiler.enabled}
+
 # Корневой маршрут (опционально)
 @app.get("/")
 async def root():
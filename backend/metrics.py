@@ -0,0 +1,268 @@
+"""Метрики в текстовом формате Prometheus без внешних зависимостей.
+
+Запись — обычные операции со словарями и списками без блокировок: метрики живут
+в памяти своего процесса, и каждый воркер uvicorn отдаёт на /metrics свои значения
+(Prometheus различает их по instance). Значения, которые дёшево прочитать целиком
+(пул соединений, кэши), не пишутся на каждый запрос, а собираются при отдаче /metrics.
+"""
+import bisect
+import math
+import time
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+
+Labels = Tuple[str, ...]
+Sample = Tuple[str, Dict[str, str], float]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_sample(name: str, labels: Dict[str, str], value: float) -> str:
+    if labels:
+        rendered = ",".join(f'{key}="{_escape(str(val))}"' for key, val in labels.items())
+        name = f"{name}{{{rendered}}}"
+    if value == float("inf"):
+        return f"{name} +Inf"
+    return f"{name} {value:g}" if isinstance(value, float) else f"{name} {value}"
+
+
+class Metric(ABC):
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+
+    @abstractmethod
+    def samples(self) -> Iterable[Sample]:
+        """Строки метрики: (имя, метки, значение)."""
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(_format_sample(*sample) for sample in self.samples())
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, labels: Labels = (), amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self) -> Iterable[Sample]:
+        for labels, value in list(self._values.items()):
+            yield self.name, dict(zip(self.labelnames, labels)), value
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, labels: Labels = (), amount: float = 1):
+        self.inc(labels, -amount)
+
+    def set(self, labels: Labels, value: float):
+        self._values[labels] = value
+
+
+class CallbackGauge(Metric):
+    """Значения считаются функцией в момент отдачи /metrics: {labels: value}."""
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str], callback: Callable[[], Dict[Labels, float]]):
+        super().__init__(name, help_text, labelnames)
+        self.callback = callback
+
+    def samples(self) -> Iterable[Sample]:
+        for labels, value in self.callback().items():
+            yield self.name, dict(zip(self.labelnames, labels)), value
+
+
+class CallbackCounter(CallbackGauge):
+    kind = "counter"
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [счётчики по корзинам (последняя — +Inf), сумма, количество]
+        self._series: Dict[Labels, list] = {}
+
+    def observe(self, value: float, labels: Labels = ()):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series.setdefault(labels, [[0] * (len(self.buckets) + 1), 0.0, 0])
+        # Счётчик только в одной корзине; накопительные значения считаются при отдаче
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def samples(self) -> Iterable[Sample]:
+        for labels, (counts, total, count) in list(self._series.items()):
+            base = dict(zip(self.labelnames, labels))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), list(counts)):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                yield f"{self.name}_bucket", {**base, "le": le}, cumulative
+            yield f"{self.name}_sum", base, total
+            yield f"{self.name}_count", base, count
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_text, labelnames, buckets))
+
+    def callback_gauge(self, name: str, help_text: str, labelnames: Sequence[str], callback: Callable[[], Dict[Labels, float]]) -> CallbackGauge:
+        return self.register(CallbackGauge(name, help_text, labelnames, callback))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+http_requests_total = REGISTRY.counter(
+    "http_requests_total", "HTTP requests by route template and status", ("method", "route", "status"))
+http_request_errors_total = REGISTRY.counter(
+    "http_request_errors_total", "HTTP requests that ended with 5xx or an unhandled exception", ("method", "route"))
+http_request_duration_seconds = REGISTRY.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template", ("method", "route"))
+http_requests_in_flight = REGISTRY.gauge(
+    "http_requests_in_flight", "HTTP requests currently being processed")
+
+db_pool_checkout_wait_seconds = REGISTRY.histogram(
+    "db_pool_checkout_wait_seconds", "Time spent waiting for a connection from the pool", ("engine",),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0))
+
+_engines: Dict[str, Engine] = {}
+
+
+class RecentWait:
+    """Скользящее среднее ожидания соединения, затухающее со временем.
+
+    Затухание нужно, чтобы после пика значение падало и без новых выдач соединений
+    (например, когда входящие запросы сбрасываются и к пулу никто не обращается).
+    """
+
+    def __init__(self, half_life: float = 1.0):
+        self.decay = math.log(2) / half_life
+        self.value = 0.0
+        self.updated = time.monotonic()
+
+    def current(self) -> float:
+        return self.value * math.exp(-self.decay * (time.monotonic() - self.updated))
+
+    def observe(self, seconds: float):
+        self.value = 0.7 * self.current() + 0.3 * seconds
+        self.updated = time.monotonic()
+
+
+_recent_waits: Dict[str, RecentWait] = {}
+
+
+def recent_pool_wait() -> float:
+    # Худшее по движкам недавнее ожидание соединения, секунды
+    return max((wait.current() for wait in list(_recent_waits.values())), default=0.0)
+
+
+def instrument_engine(engine: Engine, name: str):
+    """Замеряет ожидание соединения из QueuePool и регистрирует пул для метрик использования."""
+    if name in _engines:
+        return
+    _engines[name] = engine
+    _time_checkouts(engine.pool, name)
+    # dispose() создаёт новый пул — оборачиваем и его
+    event.listen(engine, "engine_disposed", lambda disposed: _time_checkouts(disposed.pool, name))
+
+
+def _time_checkouts(pool, name: str):
+    if not isinstance(pool, QueuePool):
+        return
+    take_connection = pool._do_get
+    recent = _recent_waits.setdefault(name, RecentWait())
+
+    def timed_do_get():
+        started = time.perf_counter()
+        try:
+            return take_connection()
+        finally:
+            waited = time.perf_counter() - started
+            db_pool_checkout_wait_seconds.observe(waited, (name,))
+            recent.observe(waited)
+
+    pool._do_get = timed_do_get
+
+
+def _pool_stats(stat: Callable[[QueuePool], float]) -> Callable[[], Dict[Labels, float]]:
+    return lambda: {
+        (name,): stat(engine.pool) for name, engine in list(_engines.items()) if isinstance(engine.pool, QueuePool)
+    }
+
+
+def _pool_utilisation(pool: QueuePool) -> float:
+    capacity = pool.size() + max(pool._max_overflow, 0)
+    return pool.checkedout() / capacity if capacity else 0.0
+
+
+REGISTRY.callback_gauge("db_pool_size", "Configured pool size", ("engine",), _pool_stats(lambda pool: pool.size()))
+REGISTRY.callback_gauge("db_pool_checked_out", "Connections currently checked out", ("engine",), _pool_stats(lambda pool: pool.checkedout()))
+REGISTRY.callback_gauge("db_pool_overflow", "Connections opened above pool_size", ("engine",), _pool_stats(lambda pool: max(pool.overflow(), 0)))
+REGISTRY.callback_gauge("db_pool_utilisation", "Checked out connections / (pool_size + max_overflow)", ("engine",), _pool_stats(_pool_utilisation))
+
+
+class _CacheStats:
+    # Одна метрика на показатель, серии — по всем зарегистрированным кэшам
+    def __init__(self, key: str):
+        self.key = key
+
+    def __call__(self) -> Dict[Labels, float]:
+        values = {}
+        for name, stats in _cache_sources.items():
+            value = stats().get(self.key)
+            if value is not None:
+                values[(name,)] = value
+        return values
+
+
+_cache_sources: Dict[str, Callable[[], dict]] = {}
+
+for _key in ("hits", "misses", "coalesced", "evictions", "invalidations"):
+    REGISTRY.register(CallbackCounter(f"cache_{_key}_total", f"Cache {_key} since process start", ("cache",), _CacheStats(_key)))
+REGISTRY.register(CallbackGauge("cache_hit_ratio", "Cache hits / lookups since process start", ("cache",), _CacheStats("hit_ratio")))
+REGISTRY.register(CallbackGauge("cache_entries", "Entries currently cached", ("cache",), _CacheStats("entries")))
+
+
+def register_cache(name: str, stats: Callable[[], dict]):
+    """Экспортирует показатели кэша из его stats() (hits, misses, hit_ratio, ...)."""
+    _cache_sources[name] = stats
@@ -1,27 +1,315 @@
-from fastapi import Request, HTTPException
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.responses import JSONResponse
+import logging
+import os
 import sys
+import time
+import zlib
+from typing import Optional
+
+from fastapi import HTTPException
+from starlette.datastructures import MutableHeaders
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from database import sql_profiler
+from exceptions import NotFoundException, ServiceUnavailableException
+from log import get_logger
+from metrics import http_requests_total, http_request_errors_total, http_request_duration_seconds, http_requests_in_flight
+
+try:
+    import brotli
+except ImportError:  # без пакета Brotli ответы сжимаются только gzip
+    brotli = None
+
+# Сжатие ответов: минимальный размер тела в байтах и уровни gzip (1-9) и brotli (0-11)
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+
+access_logger = get_logger("access")
+error_logger = get_logger("errors")
+sql_logger = get_logger("sql")
+
+
+# Чистые ASGI-middleware: в отличие от BaseHTTPMiddleware не создают задач
+# и не перекладывают тело ответа через промежуточный поток
+
+class ExceptionHandlerMiddleware:
+    """Превращает необработанные исключения в JSON-ответ {status_code, message, detail}."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        response_started = False
 
-from backend.exceptions import NotFoundException
+        async def send_wrapper(message: Message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
 
-class ExceptionHandlerMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
         try:
-            response = await call_next(request)
-            return response
+            await self.app(scope, receive, send_wrapper)
         except Exception as e:
+            # Если заголовки уже ушли клиенту, другой ответ отправить нельзя
+            if response_started:
+                raise
             status_code = 500
             detail = "Internal Server Error"
+            headers = None
 
             if isinstance(e, NotFoundException):
                 status_code = 404
                 detail = str(e)
+            elif isinstance(e, ServiceUnavailableException):
+                status_code = 503
+                detail = e.message
+                headers = {"Retry-After": str(e.retry_after)}
             elif isinstance(e, HTTPException):
                 status_code = e.status_code
                 detail = e.detail
 
-            return JSONResponse(
+            if status_code >= 500:
+                error_logger.error(
+                    "Unhandled exception",
+                    exc_info=e,
+                    extra={"fields": {"method": scope["method"], "path": scope["path"]}},
+                )
+            response = JSONResponse(
                 status_code=status_code,
-                content={"status_code": str(status_code), "message": detail, "detail": str(e) if sys.gettrace() else None}
-            )
\ No newline at end of file
+                content={"status_code": str(status_code), "message": detail, "detail": str(e) if sys.gettrace() else None},
+                headers=headers,
+            )
+            await response(scope, receive, send)
+
+
+class AccessLogMiddleware:
+    """Пишет по записи на запрос: метод, путь, статус и длительность."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not access_logger.isEnabledFor(logging.INFO):
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            access_logger.info(
+                "request",
+                extra={"fields": {
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "query": scope["query_string"].decode("latin-1"),
+                    "status": status_code,
+                    "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+                }},
+            )
+
+
+class SqlProfilingMiddleware:
+    """Добавляет Server-Timing со временем запросов к БД и пишет итог по запросу."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not sql_profiler.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        profile = sql_profiler.start(f"{scope['method']} {scope['path']}")
+
+        async def send_wrapper(message: Message):
+            if message["type"] == "http.response.start" and profile is not None:
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", profile.server_timing())
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+        if profile is not None and profile.query_count:
+            sql_logger.debug("Request SQL profile", extra={"fields": {
+                "request": profile.label,
+                "queries": profile.query_count,
+                "db_ms": round(profile.total_ms, 3),
+                "slowest_ms": round(profile.slowest_ms, 3),
+                "slowest_sql": profile.slowest_sql,
+                "n_plus_one": profile.reported_n_plus_one,
+            }})
+
+
+class MetricsMiddleware:
+    """Счётчики, ошибки и гистограмма задержек по шаблону маршрута (/users/{user_id}, а не /users/42)."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_requests_in_flight.dec()
+            # Маршрут проставляет в scope роутер FastAPI; без совпадения — один общий ярлык
+            route = scope.get("route")
+            template = getattr(route, "path_format", None) or getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            http_requests_total.inc((method, template, str(status_code)))
+            http_request_duration_seconds.observe(time.perf_counter() - started, (method, template))
+            if status_code >= 500:
+                http_request_errors_total.inc((method, template))
+
+
+def negotiate_encoding(accept_encoding: str) -> str:
+    # Выбор по Accept-Encoding с учётом q=0; при равных весах brotli предпочтительнее
+    weights = {}
+    for item in accept_encoding.lower().split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name.strip()] = q
+    candidates = [("br", weights.get("br", 0.0))] if brotli is not None else []
+    candidates.append(("gzip", weights.get("gzip", 0.0)))
+    name, q = max(candidates, key=lambda candidate: candidate[1])
+    return name if q > 0 else ""
+
+
+class _Compressor:
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=brotli_quality)
+            self._zlib = None
+        else:
+            # wbits=31 — формат gzip (заголовок и CRC), а не голый deflate
+            self._zlib = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+            self._brotli = None
+
+    def compress(self, data: bytes, finish: bool) -> bytes:
+        # В потоке каждый кусок сбрасывается сразу, чтобы клиент получал данные без задержки
+        if self._brotli is not None:
+            out = self._brotli.process(data)
+            return out + (self._brotli.finish() if finish else self._brotli.flush())
+        out = self._zlib.compress(data)
+        return out + self._zlib.flush(zlib.Z_FINISH if finish else zlib.Z_SYNC_FLUSH)
+
+
+class CompressionMiddleware:
+    """gzip/brotli по Accept-Encoding. Маленькие ответы (меньше min_size) идут как есть,
+    потоковые (more_body) сжимаются по кускам; SSE и уже сжатые ответы не трогаются."""
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        min_size: int = COMPRESSION_MIN_SIZE,
+        gzip_level: int = COMPRESSION_GZIP_LEVEL,
+        brotli_quality: int = COMPRESSION_BROTLI_QUALITY,
+    ):
+        self.app = app
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = ""
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                encoding = negotiate_encoding(value.decode("latin-1"))
+                break
+        if not encoding:
+            await self.app(scope, receive, send)
+            return
+
+        start_message: Optional[Message] = None
+        compressor: Optional[_Compressor] = None
+        passthrough = False
+
+        async def send_wrapper(message: Message):
+            nonlocal start_message, compressor, passthrough
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                content_type = headers.get("content-type", "")
+                etag = headers.get("etag")
+                if etag and not etag.startswith("W/") and "content-encoding" not in headers:
+                    # Клиент с таким Accept-Encoding получает слабый ETag всегда: и у сжатого 200,
+                    # и у 304, и у короткого ответа, который не сжимается
+                    headers["ETag"] = f"W/{etag}"
+                if (
+                    message["status"] < 200 or message["status"] in (204, 304)
+                    or "content-encoding" in headers
+                    or content_type.startswith("text/event-stream")
+                ):
+                    passthrough = True
+                    await send(message)
+                else:
+                    # Заголовки отправим, когда станет ясно, сжимать ли тело
+                    start_message = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if start_message is not None:
+                start, start_message = start_message, None
+                if not more_body and len(body) < self.min_size:
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+                headers = MutableHeaders(scope=start)
+                compressor = _Compressor(encoding, self.gzip_level, self.brotli_quality)
+                if "content-length" in headers:
+                    del headers["content-length"]
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                if not more_body:
+                    body = compressor.compress(body, finish=True)
+                    headers["Content-Length"] = str(len(body))
+                    await send(start)
+                    await send({"type": "http.response.body", "body": body})
+                    return
+                await send(start)
+            await send({
+                "type": "http.response.body",
+                "body": compressor.compress(body, finish=not more_body),
+                "more_body": more_body,
+            })
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,32 @@
+"""Add posts.likes_count
+
+Revision ID: 4b7e2d1c9a3f
+Revises: 1229cc538c44
+Create Date: 2026-10-18 10:12:41.502317
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4b7e2d1c9a3f'
+down_revision: Union[str, None] = '1229cc538c44'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('posts', sa.Column('likes_count', sa.Integer(), server_default='0', nullable=False))
+    op.execute(
+        "UPDATE posts SET likes_count = "
+        "(SELECT count(*) FROM post_likes WHERE post_likes.post_id = posts.id)"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('posts', 'likes_count')
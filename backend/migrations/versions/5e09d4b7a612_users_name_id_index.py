@@ -0,0 +1,28 @@
+"""Index users (name, id) for keyset pagination
+
+Revision ID: 5e09d4b7a612
+Revises: c81f3a6e5d20
+Create Date: 2026-10-18 11:48:05.640213
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e09d4b7a612'
+down_revision: Union[str, None] = 'c81f3a6e5d20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_users_name_id', 'users', ['name', 'id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_users_name_id', table_name='users')
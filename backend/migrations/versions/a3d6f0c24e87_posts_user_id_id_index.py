@@ -0,0 +1,28 @@
+"""Index posts (user_id, id DESC) for per-user listings
+
+Revision ID: a3d6f0c24e87
+Revises: 5e09d4b7a612
+Create Date: 2026-10-18 12:20:54.331908
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3d6f0c24e87'
+down_revision: Union[str, None] = '5e09d4b7a612'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_posts_user_id_id', 'posts', ['user_id', sa.text('id DESC')])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_posts_user_id_id', table_name='posts')
@@ -0,0 +1,52 @@
+"""Add follows, home_timeline and users.followers_count
+
+Revision ID: b5e8a1d3c7f2
+Revises: f4a9c3b82d16
+Create Date: 2026-10-18 16:05:41.218734
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b5e8a1d3c7f2'
+down_revision: Union[str, None] = 'f4a9c3b82d16'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('users', sa.Column('followers_count', sa.Integer(), server_default='0', nullable=False))
+    op.create_index('ix_users_followers_count', 'users', ['followers_count'], unique=False)
+    op.create_table(
+        'follows',
+        sa.Column('follower_id', sa.Integer(), nullable=False),
+        sa.Column('followee_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['follower_id'], ['users.id']),
+        sa.ForeignKeyConstraint(['followee_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('follower_id', 'followee_id', name='pk_follows'),
+    )
+    op.create_index('ix_follows_followee_id_follower_id', 'follows', ['followee_id', 'follower_id'], unique=False)
+    op.create_table(
+        'home_timeline',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('post_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.ForeignKeyConstraint(['post_id'], ['posts.id']),
+        sa.PrimaryKeyConstraint('user_id', 'post_id', name='pk_home_timeline'),
+    )
+    op.create_index('ix_home_timeline_post_id', 'home_timeline', ['post_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_home_timeline_post_id', table_name='home_timeline')
+    op.drop_table('home_timeline')
+    op.drop_index('ix_follows_followee_id_follower_id', table_name='follows')
+    op.drop_table('follows')
+    op.drop_index('ix_users_followers_count', table_name='users')
+    op.drop_column('users', 'followers_count')
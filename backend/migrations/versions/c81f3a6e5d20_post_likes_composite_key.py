@@ -0,0 +1,55 @@
+"""Composite primary key on post_likes
+
+Revision ID: c81f3a6e5d20
+Revises: 4b7e2d1c9a3f
+Create Date: 2026-10-18 11:03:27.118044
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c81f3a6e5d20'
+down_revision: Union[str, None] = '4b7e2d1c9a3f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Пересоздаём таблицу с ключом, убирая дубликаты и пустые строки
+    op.create_table(
+        'post_likes_new',
+        sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id'), nullable=False),
+        sa.Column('post_id', sa.Integer(), sa.ForeignKey('posts.id'), nullable=False),
+        sa.PrimaryKeyConstraint('post_id', 'user_id', name='pk_post_likes'),
+    )
+    op.execute(
+        "INSERT INTO post_likes_new (user_id, post_id) "
+        "SELECT DISTINCT user_id, post_id FROM post_likes "
+        "WHERE user_id IS NOT NULL AND post_id IS NOT NULL"
+    )
+    op.drop_table('post_likes')
+    op.rename_table('post_likes_new', 'post_likes')
+    op.create_index('ix_post_likes_user_id_post_id', 'post_likes', ['user_id', 'post_id'])
+    # Дубликаты завышали счётчики — пересчитываем
+    op.execute(
+        "UPDATE posts SET likes_count = "
+        "(SELECT count(*) FROM post_likes WHERE post_likes.post_id = posts.id)"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_post_likes_user_id_post_id', table_name='post_likes')
+    op.create_table(
+        'post_likes_old',
+        sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id')),
+        sa.Column('post_id', sa.Integer(), sa.ForeignKey('posts.id')),
+    )
+    op.execute("INSERT INTO post_likes_old (user_id, post_id) SELECT user_id, post_id FROM post_likes")
+    op.drop_table('post_likes')
+    op.rename_table('post_likes_old', 'post_likes')
@@ -0,0 +1,36 @@
+"""Trigram GIN indexes on users.name and users.login for search
+
+Revision ID: d72b1e8f4c59
+Revises: a3d6f0c24e87
+Create Date: 2026-10-18 13:05:41.208716
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd72b1e8f4c59'
+down_revision: Union[str, None] = 'a3d6f0c24e87'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # pg_trgm есть только в Postgres; на SQLite поиск работает через индекс в памяти
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.create_index('ix_users_name_trgm', 'users', ['name'], postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+    op.create_index('ix_users_login_trgm', 'users', ['login'], postgresql_using='gin', postgresql_ops={'login': 'gin_trgm_ops'})
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.drop_index('ix_users_login_trgm', table_name='users')
+    op.drop_index('ix_users_name_trgm', table_name='users')
@@ -0,0 +1,34 @@
+"""Add trending_scores checkpoint table
+
+Revision ID: e3c7a9f1b264
+Revises: b5e8a1d3c7f2
+Create Date: 2026-10-18 18:22:07.513904
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e3c7a9f1b264'
+down_revision: Union[str, None] = 'b5e8a1d3c7f2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'trending_scores',
+        sa.Column('post_id', sa.Integer(), nullable=False),
+        sa.Column('score', sa.Float(), nullable=False),
+        sa.Column('checkpointed_at', sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint('post_id'),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('trending_scores')
@@ -0,0 +1,30 @@
+"""Add row version columns to users and posts for ETags
+
+Revision ID: f4a9c3b82d16
+Revises: d72b1e8f4c59
+Create Date: 2026-10-18 13:42:17.560394
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f4a9c3b82d16'
+down_revision: Union[str, None] = 'd72b1e8f4c59'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('users', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+    op.add_column('posts', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('posts', 'version')
+    op.drop_column('users', 'version')
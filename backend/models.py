@@ -1,22 +1,65 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Table
+from sqlalchemy import Column, Integer, Float, String, ForeignKey, Table, PrimaryKeyConstraint, Index, DDL, event
 from sqlalchemy.orm import relationship
 from database import Base
 
 # Таблица для связи многие-ко-многим между пользователями и постами (лайки)
+# Составной первичный ключ (post_id, user_id) не даёт лайкнуть дважды и позволяет
+# ставить/снимать лайк одной операцией по ключу; обратный индекс — для лайков пользователя
 post_likes = Table(
     'post_likes',
     Base.metadata,
-    Column('user_id', Integer, ForeignKey('users.id')),
-    Column('post_id', Integer, ForeignKey('posts.id'))
+    Column('user_id', Integer, ForeignKey('users.id'), nullable=False),
+    Column('post_id', Integer, ForeignKey('posts.id'), nullable=False),
+    PrimaryKeyConstraint('post_id', 'user_id', name='pk_post_likes'),
+    Index('ix_post_likes_user_id_post_id', 'user_id', 'post_id'),
+)
+
+# Подписки: кто (follower_id) на кого (followee_id). Ключ — для ленты подписчика и проверки подписки,
+# обратный индекс — для рассылки поста всем подписчикам автора
+follows = Table(
+    'follows',
+    Base.metadata,
+    Column('follower_id', Integer, ForeignKey('users.id'), nullable=False),
+    Column('followee_id', Integer, ForeignKey('users.id'), nullable=False),
+    PrimaryKeyConstraint('follower_id', 'followee_id', name='pk_follows'),
+    Index('ix_follows_followee_id_follower_id', 'followee_id', 'follower_id'),
+)
+
+# Материализованная домашняя лента: id постов для каждого читателя, не больше TIMELINE_MAX_LENGTH.
+# Страница ленты — диапазон по ключу (user_id, post_id); индекс по post_id — для удаления поста из лент
+home_timeline = Table(
+    'home_timeline',
+    Base.metadata,
+    Column('user_id', Integer, ForeignKey('users.id'), nullable=False),
+    Column('post_id', Integer, ForeignKey('posts.id'), nullable=False),
+    PrimaryKeyConstraint('user_id', 'post_id', name='pk_home_timeline'),
+    Index('ix_home_timeline_post_id', 'post_id'),
+)
+
+# Снимок рейтинга популярных постов (см. trending.py): счёт на момент checkpointed_at (unix-время).
+# Без внешнего ключа — это кэш, удалённые посты просто пропускаются при чтении
+trending_scores = Table(
+    'trending_scores',
+    Base.metadata,
+    Column('post_id', Integer, primary_key=True),
+    Column('score', Float, nullable=False),
+    Column('checkpointed_at', Float, nullable=False),
 )
 
 class User(Base):
     __tablename__ = "users"
+    # Индекс под keyset-пагинацию при сортировке по имени.
+    # Второй индекс — выборка "знаменитостей" (followers_count выше порога) без просмотра всех пользователей
+    __table_args__ = (Index('ix_users_name_id', 'name', 'id'), Index('ix_users_followers_count', 'followers_count'))
     id = Column(Integer, primary_key=True, index=True)
     login = Column(String, unique=True, index=True)
     name = Column(String, nullable=True)
     password_hash = Column(String)
     password_salt = Column(String)
+    # Версия строки, растёт при каждом изменении — из неё строится ETag
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    # Денормализованное число подписчиков: по нему решается, рассылать ли посты автора при записи
+    followers_count = Column(Integer, nullable=False, default=0, server_default="0")
     posts = relationship("Post", back_populates="user")
     liked_posts = relationship("Post", secondary=post_likes, back_populates="liked_by")
 
@@ -26,5 +69,21 @@ class Post(Base):
     title = Column(String)
     content = Column(String)
     user_id = Column(Integer, ForeignKey("users.id"))
+    # Денормализованный счётчик лайков, обновляется в like_post/unlike_post
+    likes_count = Column(Integer, nullable=False, default=0, server_default="0")
+    # Версия строки для ETag: растёт при правке поста и при изменении likes_count
+    version = Column(Integer, nullable=False, default=1, server_default="1")
     user = relationship("User", back_populates="posts")
-    liked_by = relationship("User", secondary=post_likes, back_populates="liked_posts", lazy="joined")
\ No newline at end of file
+    liked_by = relationship("User", secondary=post_likes, back_populates="liked_posts")
+
+# Лента пользователя: WHERE user_id = ? ORDER BY id DESC LIMIT ? читается прямо из индекса
+Index('ix_posts_user_id_id', Post.user_id, Post.id.desc())
+
+# Поиск пользователей по подстроке (ILIKE '%q%') на Postgres идёт по триграммным GIN-индексам
+event.listen(
+    User.__table__,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"),
+)
+Index('ix_users_name_trgm', User.name, postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}).ddl_if(dialect='postgresql')
+Index('ix_users_login_trgm', User.login, postgresql_using='gin', postgresql_ops={'login': 'gin_trgm_ops'}).ddl_if(dialect='postgresql')
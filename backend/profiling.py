@@ -0,0 +1,125 @@
+"""Профилирование SQL в пределах одного HTTP-запроса.
+
+Слушатели событий движка включаются и выключаются на лету: когда профилирование
+выключено, их нет вовсе, и запросы к БД ничего лишнего не делают.
+"""
+import os
+import re
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from log import get_logger
+
+# Включено ли профилирование при старте, порог медленного запроса
+# и сколько одинаковых запросов за один HTTP-запрос считать N+1
+SQL_PROFILING = os.getenv("SQL_PROFILING", "false").lower() in ("1", "true", "yes")
+SQL_SLOW_QUERY_MS = float(os.getenv("SQL_SLOW_QUERY_MS", "100"))
+SQL_N_PLUS_ONE_THRESHOLD = int(os.getenv("SQL_N_PLUS_ONE_THRESHOLD", "5"))
+
+logger = get_logger("sql")
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*(?:\?|\$\d+|%\(\w+\)s|:\w+)(?:\s*,\s*(?:\?|\$\d+|%\(\w+\)s|:\w+))*\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_sql(statement: str) -> str:
+    # Литералы и списки параметров IN (...) заменяются на ?, чтобы одинаковые запросы совпадали
+    statement = _STRING_LITERAL.sub("?", statement)
+    statement = _NUMBER_LITERAL.sub("?", statement)
+    statement = _PLACEHOLDER_LIST.sub("(?)", statement)
+    return _WHITESPACE.sub(" ", statement).strip()
+
+
+@dataclass
+class RequestProfile:
+    label: str = ""
+    query_count: int = 0
+    total_ms: float = 0.0
+    slowest_ms: float = 0.0
+    slowest_sql: Optional[str] = None
+    statement_counts: Dict[str, int] = field(default_factory=dict)
+    reported_n_plus_one: List[str] = field(default_factory=list)
+
+    def server_timing(self) -> str:
+        return (
+            f'db;dur={self.total_ms:.2f};desc="{self.query_count} queries", '
+            f"db-slowest;dur={self.slowest_ms:.2f}"
+        )
+
+
+current_profile: ContextVar[Optional[RequestProfile]] = ContextVar("current_profile", default=None)
+
+
+class SqlProfiler:
+    def __init__(
+        self,
+        engines: List[Engine],
+        slow_query_ms: float = SQL_SLOW_QUERY_MS,
+        n_plus_one_threshold: int = SQL_N_PLUS_ONE_THRESHOLD,
+    ):
+        self.engines = engines
+        self.slow_query_ms = slow_query_ms
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.enabled = False
+
+    def enable(self):
+        if self.enabled:
+            return
+        for engine in self.engines:
+            event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+            event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+        self.enabled = True
+
+    def disable(self):
+        if not self.enabled:
+            return
+        self.enabled = False
+        for engine in self.engines:
+            event.remove(engine, "before_cursor_execute", self._before_cursor_execute)
+            event.remove(engine, "after_cursor_execute", self._after_cursor_execute)
+
+    def start(self, label: str) -> Optional[RequestProfile]:
+        if not self.enabled:
+            return None
+        profile = RequestProfile(label=label)
+        current_profile.set(profile)
+        return profile
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started_at", []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get("query_started_at")
+        if not started:
+            return
+        elapsed_ms = (time.perf_counter() - started.pop()) * 1000
+        profile = current_profile.get()
+        if profile is None:
+            return
+
+        normalized = normalize_sql(statement)
+        profile.query_count += 1
+        profile.total_ms += elapsed_ms
+        if elapsed_ms > profile.slowest_ms:
+            profile.slowest_ms = elapsed_ms
+            profile.slowest_sql = normalized
+        if elapsed_ms >= self.slow_query_ms:
+            logger.warning("Slow query", extra={"fields": {
+                "request": profile.label, "duration_ms": round(elapsed_ms, 3), "sql": normalized,
+            }})
+
+        count = profile.statement_counts.get(normalized, 0) + 1
+        profile.statement_counts[normalized] = count
+        if count == self.n_plus_one_threshold:
+            # Один и тот же запрос в цикле: get_by_login по списку, ленивая загрузка связи и т.п.
+            profile.reported_n_plus_one.append(normalized)
+            logger.warning("Possible N+1 query", extra={"fields": {
+                "request": profile.label, "repeats": count, "sql": normalized,
+            }})
@@ -0,0 +1,70 @@
+"""Облегчённое чтение списков: из БД выбираются только поля ответа, строки сразу
+сериализуются orjson — без ORM-объектов и без повторной валидации через Pydantic.
+"""
+import os
+from typing import Any, AsyncIterator, Iterable, Optional, Sequence, Tuple
+
+import orjson
+
+# Длина content_preview в символах
+CONTENT_PREVIEW_LENGTH = int(os.getenv("CONTENT_PREVIEW_LENGTH", "140"))
+# Сколько строк за раз читается с серверного курсора при потоковой выгрузке
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "500"))
+
+# Поля PostResponse в том же порядке, что и в ответе по умолчанию
+POST_FIELDS = ("id", "title", "content", "user_id", "likes_count", "liked_by_me")
+# Дополнительно по запросу: первые CONTENT_PREVIEW_LENGTH символов content
+POST_EXTRA_FIELDS = ("content_preview",)
+
+USER_FIELDS = ("id", "login", "name")
+
+
+def parse_post_fields(fields: Optional[str]) -> Tuple[str, ...]:
+    # fields=id,title,content_preview — разреженный набор полей; без параметра — все поля PostResponse
+    if not fields:
+        return POST_FIELDS
+    requested = tuple(dict.fromkeys(field.strip() for field in fields.split(",") if field.strip()))
+    unknown = [field for field in requested if field not in POST_FIELDS + POST_EXTRA_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    if not requested:
+        raise ValueError("At least one field is required")
+    return requested
+
+
+def dump_rows(rows: Iterable[Any], fields: Sequence[str]) -> bytes:
+    # rows — RowMapping из result.mappings(): доступ по имени колонки без промежуточных объектов
+    return orjson.dumps([{field: row[field] for field in fields} for row in rows])
+
+
+def dump_users_page(users: Iterable[Any], total: int, skip: int, limit: int, next_cursor: Optional[str]) -> bytes:
+    # Та же форма, что у PaginatedUserResponse; users — строки проекции или ORM-объекты
+    return orjson.dumps({
+        "users": [{"id": user.id, "login": user.login, "name": user.name, "token": None} for user in users],
+        "total": total,
+        "skip": skip,
+        "limit": limit,
+        "next_cursor": next_cursor,
+    })
+
+
+# Потоковая выгрузка: partitions — пачки строк с серверного курсора (yield_per),
+# в памяти одновременно только одна пачка и её JSON
+
+async def iter_json_array(partitions: AsyncIterator[Sequence[Any]], fields: Sequence[str]) -> AsyncIterator[bytes]:
+    yield b"["
+    first = True
+    async for rows in partitions:
+        if not rows:
+            continue
+        # Массив пачки без внешних скобок — элементы общего массива
+        chunk = dump_rows(rows, fields)[1:-1]
+        yield chunk if first else b"," + chunk
+        first = False
+    yield b"]"
+
+
+async def iter_ndjson(partitions: AsyncIterator[Sequence[Any]], fields: Sequence[str]) -> AsyncIterator[bytes]:
+    async for rows in partitions:
+        if rows:
+            yield b"".join(orjson.dumps({field: row[field] for field in fields}) + b"\n" for row in rows)
@@ -0,0 +1,90 @@
+"""Маршрутизация чтений на реплики БД.
+
+Реплики выбираются по кругу; реплика, к которой не удалось подключиться или на которой
+оборвалось соединение, исключается на REPLICA_EJECT_SECONDS и потом пробуется снова.
+Пользователь, только что что-то изменивший, читает с primary, пока не пройдёт
+READ_YOUR_WRITES_SECONDS — реплика могла ещё не догнать его запись.
+"""
+import itertools
+import os
+import time
+from typing import Dict, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from log import get_logger
+
+REPLICA_EJECT_SECONDS = float(os.getenv("REPLICA_EJECT_SECONDS", "30"))
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+
+logger = get_logger("replicas")
+
+
+class ReplicaSet:
+    def __init__(self, engines: List[AsyncEngine], eject_seconds: float = REPLICA_EJECT_SECONDS):
+        self.engines = engines
+        self.eject_seconds = eject_seconds
+        self._ejected_until: Dict[AsyncEngine, float] = {}
+        self._next = itertools.cycle(range(len(engines))) if engines else None
+        self.ejections = 0
+        for engine in engines:
+            # Обрыв соединения посреди запроса тоже выводит реплику из ротации
+            event.listen(engine.sync_engine, "handle_error", self._on_error(engine))
+
+    def _on_error(self, engine: AsyncEngine):
+        def handle_error(context):
+            if context.is_disconnect:
+                self.eject(engine, context.original_exception)
+        return handle_error
+
+    def pick(self) -> Optional[AsyncEngine]:
+        # Следующая здоровая реплика по кругу; None — здоровых нет, читаем с primary
+        if self._next is None:
+            return None
+        now = time.monotonic()
+        for _ in range(len(self.engines)):
+            engine = self.engines[next(self._next)]
+            if self._ejected_until.get(engine, 0) <= now:
+                return engine
+        return None
+
+    def eject(self, engine: AsyncEngine, error: Optional[BaseException] = None):
+        if self._ejected_until.get(engine, 0) > time.monotonic():
+            return
+        self._ejected_until[engine] = time.monotonic() + self.eject_seconds
+        self.ejections += 1
+        logger.warning("Read replica ejected", extra={"fields": {
+            "replica": engine.url.render_as_string(hide_password=True),
+            "seconds": self.eject_seconds,
+            "error": str(error) if error else None,
+        }})
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            "replicas": len(self.engines),
+            "healthy": sum(1 for engine in self.engines if self._ejected_until.get(engine, 0) <= now),
+            "ejections": self.ejections,
+        }
+
+
+class RecentWriters:
+    """Кто из пользователей писал в последние window секунд (для read-your-writes)."""
+
+    def __init__(self, window: float = READ_YOUR_WRITES_SECONDS):
+        self.window = window
+        self._until: Dict[int, float] = {}
+
+    def mark(self, user_id: int):
+        now = time.monotonic()
+        if len(self._until) > 10000:
+            # Истёкшие отметки чистим изредка, а не на каждом чтении
+            self._until = {uid: until for uid, until in self._until.items() if until > now}
+        self._until[user_id] = now + self.window
+
+    def recent(self, user_id: Optional[int]) -> bool:
+        if user_id is None:
+            return False
+        until = self._until.get(user_id)
+        return until is not None and until > time.monotonic()
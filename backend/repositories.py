@@ -1,6 +1,186 @@
+from sqlalchemy import select, insert, update, delete, func, exists, literal, and_, or_, case, union_all, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from models import User, Post
-from typing import Optional, List
+from sqlalchemy.orm.attributes import set_committed_value
+from models import User, Post, post_likes, follows, home_timeline, trending_scores
+from log import get_logger
+from projection import CONTENT_PREVIEW_LENGTH
+from typing import Dict, Optional, List, Sequence, Tuple
+
+logger = get_logger("repositories")
+
+def likes_count_subquery():
+    # Фактическое количество лайков по post_likes (для сверки счётчика posts.likes_count)
+    return (
+        select(func.count())
+        .select_from(post_likes)
+        .where(post_likes.c.post_id == Post.id)
+        .correlate(Post)
+        .scalar_subquery()
+    )
+
+def liked_by_me_column(current_user_id: Optional[int] = None):
+    # Признак "лайкнул я" считается одной EXISTS-проверкой, без загрузки лайкнувших
+    if current_user_id:
+        return exists().where(
+            post_likes.c.post_id == Post.id,
+            post_likes.c.user_id == current_user_id,
+        ).correlate(Post).label("liked_by_me")
+    return literal(False).label("liked_by_me")
+
+def post_columns(fields: Sequence[str], current_user_id: Optional[int] = None):
+    # Только запрошенные поля; id и version нужны всегда — для курсора, тегов кэша и ETag
+    columns = {"id": Post.id, "version": Post.version}
+    for field in fields:
+        if field == "liked_by_me":
+            columns[field] = liked_by_me_column(current_user_id)
+        elif field == "content_preview":
+            columns[field] = func.substr(Post.content, 1, CONTENT_PREVIEW_LENGTH).label("content_preview")
+        else:
+            columns[field] = getattr(Post, field)
+    return list(columns.values())
+
+def attach_liked_by_me(rows) -> List[Post]:
+    posts = []
+    for post, liked_by_me in rows:
+        post.liked_by_me = bool(liked_by_me)
+        posts.append(post)
+    return posts
+
+def like_insert(dialect_name: str, post_id: int, user_id: int):
+    # Идемпотентная вставка по ключу (post_id, user_id): повторный лайк ничего не делает.
+    # RETURNING отдаёт строку только если лайк действительно добавлен
+    values = {"post_id": post_id, "user_id": user_id}
+    if dialect_name == "postgresql":
+        stmt = pg_insert(post_likes).values(**values).on_conflict_do_nothing()
+    elif dialect_name == "sqlite":
+        stmt = sqlite_insert(post_likes).values(**values).on_conflict_do_nothing()
+    else:
+        already_liked = exists().where(post_likes.c.post_id == post_id, post_likes.c.user_id == user_id)
+        stmt = insert(post_likes).from_select(
+            ["post_id", "user_id"],
+            select(literal(post_id), literal(user_id)).where(~already_liked),
+        )
+    return stmt.returning(post_likes.c.post_id)
+
+def likes_insert(dialect_name: str, post_ids: List[int], user_id: int):
+    # Пакетный вариант like_insert: только существующие посты и только ещё не лайкнутые.
+    # RETURNING отдаёт id постов, лайк к которым действительно добавлен
+    already_liked = exists().where(post_likes.c.post_id == Post.id, post_likes.c.user_id == user_id)
+    rows = select(Post.id, literal(user_id)).where(Post.id.in_(post_ids), ~already_liked)
+    if dialect_name == "postgresql":
+        stmt = pg_insert(post_likes).from_select(["post_id", "user_id"], rows).on_conflict_do_nothing()
+    elif dialect_name == "sqlite":
+        stmt = sqlite_insert(post_likes).from_select(["post_id", "user_id"], rows).on_conflict_do_nothing()
+    else:
+        stmt = insert(post_likes).from_select(["post_id", "user_id"], rows)
+    return stmt.returning(post_likes.c.post_id)
+
+def insert_ignoring_duplicates(dialect_name: str, table, columns: List[str], rows):
+    # INSERT ... SELECT, в котором уже существующие по ключу строки пропускаются
+    if dialect_name == "postgresql":
+        return pg_insert(table).from_select(columns, rows).on_conflict_do_nothing()
+    if dialect_name == "sqlite":
+        return sqlite_insert(table).from_select(columns, rows).on_conflict_do_nothing()
+    return insert(table).from_select(columns, rows)
+
+def follow_insert(dialect_name: str, follower_id: int, followee_id: int):
+    # Как like_insert: повторная подписка ничего не делает, RETURNING — только для новой
+    already_following = exists().where(follows.c.follower_id == follower_id, follows.c.followee_id == followee_id)
+    rows = select(literal(follower_id), literal(followee_id)).where(~already_following)
+    stmt = insert_ignoring_duplicates(dialect_name, follows, ["follower_id", "followee_id"], rows)
+    return stmt.returning(follows.c.followee_id)
+
+def timeline_trim(max_length: int, user_id: Optional[int] = None):
+    # Всё, что старше max_length последних записей ленты; без user_id — по всем читателям
+    newer = home_timeline.alias("newer")
+    cutoff = (
+        select(newer.c.post_id)
+        .where(newer.c.user_id == home_timeline.c.user_id)
+        .order_by(newer.c.post_id.desc())
+        .offset(max_length)
+        .limit(1)
+        .scalar_subquery()
+    )
+    stmt = delete(home_timeline).where(home_timeline.c.post_id <= cutoff)
+    if user_id is not None:
+        stmt = stmt.where(home_timeline.c.user_id == user_id)
+    return stmt
+
+def like_delete(post_id: int, user_id: int):
+    return (
+        delete(post_likes)
+        .where(post_likes.c.post_id == post_id, post_likes.c.user_id == user_id)
+        .returning(post_likes.c.post_id)
+    )
+
+USER_SORTS = {
+    "id": (User.id.asc(),),
+    "id_desc": (User.id.desc(),),
+    # id добавлен как уникальный хвост ключа, чтобы порядок был однозначным
+    "name": (User.name.asc().nulls_last(), User.id.asc()),
+    "name_desc": (User.name.desc().nulls_first(), User.id.desc()),
+}
+
+def user_order_by(sort_by: Optional[str]):
+    return USER_SORTS.get(sort_by, USER_SORTS["id"])
+
+def user_seek_condition(sort_by: Optional[str], after_id: int, after_name: Optional[str]):
+    # Условие "строго после (after_name, after_id)" в порядке user_order_by
+    if sort_by == "name":
+        if after_name is None:
+            return and_(User.name.is_(None), User.id > after_id)
+        return or_(
+            User.name > after_name,
+            and_(User.name == after_name, User.id > after_id),
+            User.name.is_(None),
+        )
+    if sort_by == "name_desc":
+        if after_name is None:
+            return or_(and_(User.name.is_(None), User.id < after_id), User.name.is_not(None))
+        return or_(User.name < after_name, and_(User.name == after_name, User.id < after_id))
+    if sort_by == "id_desc":
+        return User.id < after_id
+    return User.id > after_id
+
+def user_search_condition(search: str):
+    pattern = f"%{search}%"
+    return or_(User.name.ilike(pattern), User.login.ilike(pattern))
+
+def user_relevance(dialect_name: str, search: str):
+    # Выражение для ORDER BY: чем меньше, тем релевантнее
+    if dialect_name == "postgresql":
+        return -func.greatest(func.similarity(User.name, search), func.similarity(User.login, search))
+    query = search.lower()
+    return case(
+        (or_(func.lower(User.name) == query, func.lower(User.login) == query), 0),
+        (or_(func.lower(User.name).like(f"{query}%"), func.lower(User.login).like(f"{query}%")), 1),
+        else_=2,
+    )
+
+def _release_likes_of(user: User):
+    # Лайки удаляемого пользователя исчезнут вместе с ним, уменьшаем счётчики заранее
+    liked_post_ids = select(post_likes.c.post_id).where(post_likes.c.user_id == user.id)
+    return (
+        update(Post)
+        .where(Post.id.in_(liked_post_ids))
+        .values(likes_count=Post.likes_count - 1, version=Post.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+
+def _release_follows_of(user: User):
+    # Подписки удаляемого пользователя и на него, его домашняя лента; счётчики подписчиков — заранее
+    followed_ids = select(follows.c.followee_id).where(follows.c.follower_id == user.id)
+    return [
+        update(User)
+        .where(User.id.in_(followed_ids))
+        .values(followers_count=User.followers_count - 1)
+        .execution_options(synchronize_session=False),
+        delete(follows).where(or_(follows.c.follower_id == user.id, follows.c.followee_id == user.id)),
+        delete(home_timeline).where(home_timeline.c.user_id == user.id),
+    ]
 
 class UserRepository:
     def __init__(self, db: Session):
@@ -33,21 +213,26 @@ class UserRepository:
         try:
             for key, value in user_update.items():
                 setattr(user, key, value)
+            # Версия строки для ETag; инкремент в самой БД, refresh подтянет новое значение
+            user.version = User.version + 1
             self.db.commit()
             self.db.refresh(user)
             return user
         except Exception as e:
             self.db.rollback()
-            print(f"Error in update user: {str(e)}")
+            logger.error(f"Error in update user: {e}")
             raise
 
     def delete(self, user: User):
         try:
+            self.db.execute(_release_likes_of(user))
+            for stmt in _release_follows_of(user):
+                self.db.execute(stmt)
             self.db.delete(user)
             self.db.commit()
         except Exception as e:
             self.db.rollback()
-            print(f"Error in delete user: {str(e)}")
+            logger.error(f"Error in delete user: {e}")
             raise
 
 class PostRepository:
@@ -62,7 +247,7 @@ class PostRepository:
             return post
         except Exception as e:
             self.db.rollback()
-            print(f"Error in create post: {str(e)}")
+            logger.error(f"Error in create post: {e}")
             raise
 
     def get(self, post_id: int) -> Optional[Post]:
@@ -70,68 +255,693 @@ class PostRepository:
 
     def get_posts(self, skip: int, limit: int, current_user_id: Optional[int] = None) -> List[Post]:
         try:
-            query = self.db.query(Post).order_by(Post.id.desc())
+            query = self.db.query(Post, liked_by_me_column(current_user_id)).order_by(Post.id.desc())
             query = query.offset(skip).limit(limit)
-            posts = query.all()
-            for post in posts:
-                post.likes_count = len(post.liked_by) if post.liked_by is not None else 0
-                post.liked_by_me = any(user.id == current_user_id for user in post.liked_by) if current_user_id and post.liked_by else False
-            return posts
+            return attach_liked_by_me(query.all())
         except Exception as e:
-            print(f"Error in get_posts: {str(e)}")
+            logger.error(f"Error in get_posts: {e}")
             raise
 
     def get_posts_by_user(self, user_id: int, current_user_id: Optional[int] = None) -> List[Post]:
         try:
-            query = self.db.query(Post).filter(Post.user_id == user_id).order_by(Post.id.desc())
-            posts = query.all()
-            for post in posts:
-                post.likes_count = len(post.liked_by) if post.liked_by is not None else 0
-                post.liked_by_me = any(user.id == current_user_id for user in post.liked_by) if current_user_id and post.liked_by else False
-            return posts
+            query = self.db.query(Post, liked_by_me_column(current_user_id)).filter(Post.user_id == user_id).order_by(Post.id.desc())
+            return attach_liked_by_me(query.all())
         except Exception as e:
-            print(f"Error in get_posts_by_user: {str(e)}")
+            logger.error(f"Error in get_posts_by_user: {e}")
             raise
 
     def update(self, post: Post, post_update: dict) -> Post:
         try:
             for key, value in post_update.items():
                 setattr(post, key, value)
+            # Версия строки для ETag; инкремент в самой БД, refresh подтянет новое значение
+            post.version = Post.version + 1
             self.db.commit()
             self.db.refresh(post)
             return post
         except Exception as e:
             self.db.rollback()
-            print(f"Error in update post: {str(e)}")
+            logger.error(f"Error in update post: {e}")
             raise
 
     def delete(self, post: Post):
         try:
+            self.db.execute(delete(home_timeline).where(home_timeline.c.post_id == post.id))
             self.db.delete(post)
             self.db.commit()
         except Exception as e:
             self.db.rollback()
-            print(f"Error in delete post: {str(e)}")
+            logger.error(f"Error in delete post: {e}")
+            raise
+
+    def _change_likes_count(self, post: Post, delta: int):
+        # Атомарный инкремент на стороне БД, без пересчёта по post_likes
+        result = self.db.execute(
+            update(Post)
+            .where(Post.id == post.id)
+            .values(likes_count=Post.likes_count + delta, version=Post.version + 1)
+            .returning(Post.likes_count, Post.version)
+            .execution_options(synchronize_session=False)
+        )
+        likes_count, version = result.one()
+        set_committed_value(post, "likes_count", likes_count)
+        set_committed_value(post, "version", version)
+
+    def reconcile_likes_count(self) -> int:
+        # Чинит расхождения posts.likes_count с post_likes, возвращает число исправленных постов
+        try:
+            actual = likes_count_subquery()
+            result = self.db.execute(
+                update(Post)
+                .where(Post.likes_count != actual)
+                .values(likes_count=actual, version=Post.version + 1)
+                .execution_options(synchronize_session=False)
+            )
+            self.db.commit()
+            return result.rowcount
+        except Exception as e:
+            self.db.rollback()
+            logger.error(f"Error in reconcile_likes_count: {e}")
             raise
 
     def like_post(self, post: Post, user: User):
         try:
-            if user not in post.liked_by:
-                post.liked_by.append(user)
-                self.db.commit()
-                self.db.refresh(post)
+            inserted = self.db.execute(like_insert(self.db.get_bind().dialect.name, post.id, user.id)).first()
+            if inserted:
+                self._change_likes_count(post, 1)
+            self.db.commit()
         except Exception as e:
             self.db.rollback()
-            print(f"Error in like_post: {str(e)}")
+            logger.error(f"Error in like_post: {e}")
             raise
 
     def unlike_post(self, post: Post, user: User):
         try:
-            if user in post.liked_by:
-                post.liked_by.remove(user)
-                self.db.commit()
-                self.db.refresh(post)
+            deleted = self.db.execute(like_delete(post.id, user.id)).first()
+            if deleted:
+                self._change_likes_count(post, -1)
+            self.db.commit()
+        except Exception as e:
+            self.db.rollback()
+            logger.error(f"Error in unlike_post: {e}")
+            raise
+
+class AsyncUserRepository:
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def get_by_login(self, login: str) -> Optional[User]:
+        result = await self.db.execute(select(User).filter(User.login == login))
+        return result.scalars().first()
+
+    async def get(self, user_id: int) -> Optional[User]:
+        result = await self.db.execute(select(User).filter(User.id == user_id))
+        return result.scalars().first()
+
+    async def get_page(
+        self,
+        skip: int = 0,
+        limit: int = 10,
+        sort_by: Optional[str] = None,
+        search: Optional[str] = None,
+        after_id: Optional[int] = None,
+        after_name: Optional[str] = None,
+    ) -> Tuple[list, int]:
+        # Страница и общее количество одним запросом: total — скалярный подзапрос в каждой строке
+        filters = [user_search_condition(search)] if search else []
+        total = select(func.count()).select_from(User).where(*filters).scalar_subquery()
+        # Только поля ответа и version для ETag, без гидрации ORM-объектов
+        query = select(User.id, User.login, User.name, User.version, total.label("total")).where(*filters)
+        if search and sort_by is None:
+            query = query.order_by(user_relevance(self.db.get_bind().dialect.name, search), User.id.asc())
+        else:
+            query = query.order_by(*user_order_by(sort_by))
+        if after_id is not None and not (search and sort_by is None):
+            query = query.filter(user_seek_condition(sort_by, after_id, after_name))
+        else:
+            query = query.offset(skip)
+        result = await self.db.execute(query.limit(limit))
+        rows = result.all()
+        if not rows:
+            # Пустая страница (например, skip за концом) — total берём отдельным запросом
+            return [], await self.db.scalar(select(func.count()).select_from(User).where(*filters))
+        return list(rows), rows[0].total
+
+    async def get_many(self, user_ids: List[int]) -> List[User]:
+        # Пользователи по списку id в том же порядке, одним запросом по первичному ключу
+        if not user_ids:
+            return []
+        result = await self.db.execute(select(User).where(User.id.in_(user_ids)))
+        by_id = {user.id: user for user in result.scalars().all()}
+        return [by_id[user_id] for user_id in user_ids if user_id in by_id]
+
+    async def stream_rows(self, sort_by: Optional[str] = None, search: Optional[str] = None, batch_size: int = 500):
+        # Все пользователи пачками по batch_size через серверный курсор, без загрузки всего результата
+        filters = [user_search_condition(search)] if search else []
+        query = (
+            select(User.id, User.login, User.name)
+            .where(*filters)
+            .order_by(*user_order_by(sort_by))
+            .execution_options(yield_per=batch_size)
+        )
+        result = await self.db.stream(query)
+        async for rows in result.mappings().partitions():
+            yield rows
+
+    async def search_entries(self, batch_size: int = 5000) -> List[Tuple[int, Optional[str], str]]:
+        # Пачками с серверного курсора: между пачками event loop обслуживает другие запросы
+        result = await self.db.stream(select(User.id, User.name, User.login).execution_options(yield_per=batch_size))
+        entries = []
+        async for rows in result.partitions():
+            entries.extend(tuple(row) for row in rows)
+        return entries
+
+    async def create(self, user: User) -> User:
+        try:
+            self.db.add(user)
+            await self.db.commit()
+            await self.db.refresh(user)
+            return user
+        except Exception as e:
+            await self.db.rollback()
+            logger.error(f"Error in create user: {e}")
+            raise
+
+    async def update(self, user: User, user_update: dict) -> User:
+        try:
+            for key, value in user_update.items():
+                setattr(user, key, value)
+            # Версия строки для ETag; инкремент в самой БД, refresh подтянет новое значение
+            user.version = User.version + 1
+            await self.db.commit()
+            await self.db.refresh(user)
+            return user
+        except Exception as e:
+            await self.db.rollback()
+            logger.error(f"Error in update user: {e}")
+            raise
+
+    async def delete(self, user: User):
+        try:
+            await self.db.execute(_release_likes_of(user))
+            for stmt in _release_follows_of(user):
+                await self.db.execute(stmt)
+            await self.db.delete(user)
+            await self.db.commit()
+        except Exception as e:
+            await self.db.rollback()
+            logger.error(f"Error in delete user: {e}")
+            raise
+
+    async def _change_followers_count(self, user: User, delta: int):
+        result = await self.db.execute(
+            update(User)
+            .where(User.id == user.id)
+            .values(followers_count=User.followers_count + delta)
+            .returning(User.followers_count)
+            .execution_options(synchronize_session=False)
+        )
+        set_committed_value(user, "followers_count", result.scalar_one())
+
+    async def follow(self, follower_id: int, followee: User) -> bool:
+        # True — подписка добавлена, False — уже была
+        try:
+            result = await self.db.execute(follow_insert(self.db.get_bind().dialect.name, follower_id, followee.id))
+            added = result.first() is not None
+            if added:
+                await self._change_followers_count(followee, 1)
+            await self.db.commit()
+            return added
+        except Exception as e:
+            await self.db.rollback()
+            logger.error(f"Error in follow: {e}")
+            raise
+
+    async def unfollow(self, follower_id: int, followee: User) -> bool:
+        try:
+            result = await self.db.execute(
+                delete(follows)
+                .where(follows.c.follower_id == follower_id, follows.c.followee_id == followee.id)
+                .returning(follows.c.followee_id)
+            )
+            removed = result.first() is not None
+            if removed:
+                await self._change_followers_count(followee, -1)
+            await self.db.commit()
+            return removed
+        except Exception as e:
+            await self.db.rollback()
+            logger.error(f"Error in unfollow: {e}")
+            raise
+
+class AsyncPostRepository:
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def create(self, post: Post):
+        try:
+            self.db.add(post)
+            await self.db.commit()
+            await self.db.refresh(post)
+            return post
+        except Exception as e:
+            await self.db.rollback()
+            logger.error(f"Error in create post: {e}")
+            raise
+
+    async def get(self, post_id: int) -> Optional[Post]:
+        result = await self.db.execute(select(Post).filter(Post.id == post_id))
+        return result.scalars().first()
+
+    async def get_with_stats(self, post_id: int, current_user_id: Optional[int] = None) -> Optional[Post]:
+        query = select(Post, liked_by_me_column(current_user_id)).filter(Post.id == post_id)
+        result = await self.db.execute(query)
+        posts = attach_liked_by_me(result.all())
+        return posts[0] if posts else None
+
+    async def get_posts(self, skip: int, limit: int, current_user_id: Optional[int] = None, after_id: Optional[int] = None) -> List[Post]:
+        try:
+            query = select(Post, liked_by_me_column(current_user_id)).order_by(Post.id.desc())
+            if after_id is not None:
+                query = query.filter(Post.id < after_id)
+            else:
+                query = query.offset(skip)
+            query = query.limit(limit)
+            result = await self.db.execute(query)
+            return attach_liked_by_me(result.all())
+        except Exception as e:
+            logger.error(f"Error in get_posts: {e}")
+            raise
+
+    async def get_many_with_stats(self, post_ids: List[int], current_user_id: Optional[int] = None) -> List[Post]:
+        # Посты по списку id одним запросом по первичному ключу; порядок — как в post_ids.
+        # populate_existing: посты из identity map сессии перечитываются (после пакетного лайка)
+        if not post_ids:
+            return []
+        query = (
+            select(Post, liked_by_me_column(current_user_id))
+            .where(Post.id.in_(post_ids))
+            .execution_options(populate_existing=True)
+        )
+        result = await self.db.execute(query)
+        by_id = {post.id: post for post in attach_liked_by_me(result.all())}
+        return [by_id[post_id] for post_id in post_ids if post_id in by_id]
+
+    async def get_liked_post_ids(self, post_ids: List[int], user_id: int) -> List[int]:
+        # Какие из постов лайкнул пользователь — только по post_likes, без чтения самих постов
+        if not post_ids:
+            return []
+        result = await self.db.execute(
+            select(post_likes.c.post_id).where(post_likes.c.user_id == user_id, post_likes.c.post_id.in_(post_ids))
+        )
+        return list(result.scalars().all())
+
+    async def get_post_rows(
+        self,
+        skip: int,
+        limit: int,
+        fields: Sequence[str],
+        current_user_id: Optional[int] = None,
+        after_id: Optional[int] = None,
+    ):
+        # Та же страница, что и get_posts, но строками-словарями только с нужными колонками
+        query = select(*post_columns(fields, current_user_id)).order_by(Post.id.desc())
+        if after_id is not None:
+            query = query.filter(Post.id < after_id)
+        else:
+            query = query.offset(skip)
+        result = await self.db.execute(query.limit(limit))
+        return result.mappings().all()
+
+    async def get_post_rows_by_user(
+        self,
+        user_id: int,
+        fields: Sequence[str],
+        current_user_id: Optional[int] = None,
+        limit: int = 20,
+        after_id: Optional[int] = None,
+    ):
+        query = select(*post_columns(fields, current_user_id)).filter(Post.user_id == user_id).order_by(Post.id.desc())
+        if after_id is not None:
+            query = query.filter(Post.id < after_id)
+        result = await self.db.execute(query.limit(limit))
+        return result.mappings().all()
+
+    async def stream_post_rows_by_user(
+        self,
+        user_id: int,
+        fields: Sequence[str],
+        current_user_id: Optional[int] = None,
+        batch_size: int = 500,
+    ):
+        # Все посты пользователя пачками по batch_size через серверный курсор
+        query = (
+            select(*post_columns(fields, current_user_id))
+            .filter(Post.user_id == user_id)
+            .order_by(Post.id.desc())
+            .execution_options(yield_per=batch_size)
+        )
+        result = await self.db.stream(query)
+        async for rows in result.mappings().partitions():
+            yield rows
+
+    async def get_post_rows_by_ids(self, post_ids: List[int], fields: Sequence[str], current_user_id: Optional[int] = None):
+        # Строки проекции по списку id, в порядке post_ids (удалённые посты пропускаются)
+        if not post_ids:
+            return []
+        result = await self.db.execute(select(*post_columns(fields, current_user_id)).where(Post.id.in_(post_ids)))
+        by_id = {row["id"]: row for row in result.mappings().all()}
+        return [by_id[post_id] for post_id in post_ids if post_id in by_id]
+
+    async def get_post_versions(self, skip: int, limit: int, after_id: Optional[int] = None) -> List[Tuple[int, int]]:
+        # Та же страница ленты, что и get_posts, но только (id, version) — для проверки ETag
+        query = select(Post.id, Post.version).order_by(Post.id.desc())
+        if after_id is not None:
+            query = query.filter(Post.id < after_id)
+        else:
+            query = query.offset(skip)
+        result = await self.db.execute(query.limit(limit))
+        return [tuple(row) for row in result.all()]
+
+    async def get_posts_by_user(
+        self,
+        user_id: int,
+        current_user_id: Optional[int] = None,
+        limit: int = 20,
+        after_id: Optional[int] = None,
+    ) -> List[Post]:
+        try:
+            # Обходится индексом (user_id, id DESC) без сортировки
+            query = select(Post, liked_by_me_column(current_user_id)).filter(Post.user_id == user_id).order_by(Post.id.desc())
+            if after_id is not None:
+                query = query.filter(Post.id < after_id)
+            query = query.limit(limit)
+            result = await self.db.execute(query)
+            return attach_liked_by_me(result.all())
+        except Exception as e:
+            logger.error(f"Error in get_posts_by_user: {e}")
+            raise
+
+    async def update(self, post: Post, post_update: dict) -> Post:
+        try:
+            for key, value in post_update.items():
+                setattr(post, key, value)
+            # Версия строки для ETag; инкремент в самой БД, refresh подтянет новое значение
+            post.version = Post.version + 1
+            await self.db.commit()
+            await self.db.refresh(post)
+            return post
+        except Exception as e:
+            await self.db.rollback()
+            logger.error(f"Error in update post: {e}")
+            raise
+
+    async def delete(self, post: Post):
+        try:
+            # Пост убирается и из материализованных домашних лент
+            await self.db.execute(delete(home_timeline).where(home_timeline.c.post_id == post.id))
+            await self.db.delete(post)
+            await self.db.commit()
+        except Exception as e:
+            await self.db.rollback()
+            logger.error(f"Error in delete post: {e}")
+            raise
+
+    async def _change_likes_count(self, post: Post, delta: int):
+        # Атомарный инкремент на стороне БД, без пересчёта по post_likes
+        result = await self.db.execute(
+            update(Post)
+            .where(Post.id == post.id)
+            .values(likes_count=Post.likes_count + delta, version=Post.version + 1)
+            .returning(Post.likes_count, Post.version)
+            .execution_options(synchronize_session=False)
+        )
+        likes_count, version = result.one()
+        set_committed_value(post, "likes_count", likes_count)
+        set_committed_value(post, "version", version)
+
+    async def like_post(self, post: Post, user: User) -> bool:
+        # True — лайк действительно поставлен, False — повторный запрос
+        try:
+            result = await self.db.execute(like_insert(self.db.get_bind().dialect.name, post.id, user.id))
+            changed = result.first() is not None
+            if changed:
+                await self._change_likes_count(post, 1)
+            await self.db.commit()
+            return changed
+        except Exception as e:
+            await self.db.rollback()
+            logger.error(f"Error in like_post: {e}")
+            raise
+
+    async def unlike_post(self, post: Post, user: User) -> bool:
+        # True — лайк действительно снят, False — повторный запрос
+        try:
+            result = await self.db.execute(like_delete(post.id, user.id))
+            changed = result.first() is not None
+            if changed:
+                await self._change_likes_count(post, -1)
+            await self.db.commit()
+            return changed
+        except Exception as e:
+            await self.db.rollback()
+            logger.error(f"Error in unlike_post: {e}")
+            raise
+
+    async def _change_likes_counts(self, post_ids: List[int], delta: int):
+        if post_ids:
+            await self.db.execute(
+                update(Post)
+                .where(Post.id.in_(post_ids))
+                .values(likes_count=Post.likes_count + delta, version=Post.version + 1)
+                .execution_options(synchronize_session=False)
+            )
+
+    async def like_posts(self, post_ids: List[int], user: User) -> List[int]:
+        # Все лайки и счётчики — в одной транзакции; возвращает id постов, где лайк добавлен
+        try:
+            result = await self.db.execute(likes_insert(self.db.get_bind().dialect.name, post_ids, user.id))
+            liked = list(result.scalars().all())
+            await self._change_likes_counts(liked, 1)
+            await self.db.commit()
+            return liked
+        except Exception as e:
+            await self.db.rollback()
+            logger.error(f"Error in like_posts: {e}")
+            raise
+
+    async def unlike_posts(self, post_ids: List[int], user: User) -> List[int]:
+        try:
+            result = await self.db.execute(
+                delete(post_likes)
+                .where(post_likes.c.user_id == user.id, post_likes.c.post_id.in_(post_ids))
+                .returning(post_likes.c.post_id)
+            )
+            unliked = list(result.scalars().all())
+            await self._change_likes_counts(unliked, -1)
+            await self.db.commit()
+            return unliked
+        except Exception as e:
+            await self.db.rollback()
+            logger.error(f"Error in unlike_posts: {e}")
+            raise
+
+    async def apply_likes(self, changes: Dict[Tuple[int, int], bool]) -> Dict[int, int]:
+        # Пачка отложенных лайков {(post_id, user_id): лайкнут ли} одной транзакцией:
+        # одна вставка, одно удаление и по одному UPDATE счётчиков на каждое значение изменения.
+        # Возвращает новый likes_count постов, у которых он действительно изменился
+        try:
+            pairs = list(changes)
+            post_ids = {post_id for post_id, _ in pairs}
+            user_ids = {user_id for _, user_id in pairs}
+            # Лайки удалённых за время ожидания постов и пользователей отбрасываются
+            existing_posts = set((await self.db.execute(select(Post.id).where(Post.id.in_(post_ids)))).scalars())
+            existing_users = set((await self.db.execute(select(User.id).where(User.id.in_(user_ids)))).scalars())
+            likes = [
+                {"post_id": post_id, "user_id": user_id}
+                for (post_id, user_id), liked in changes.items()
+                if liked and post_id in existing_posts and user_id in existing_users
+            ]
+            unlikes = [pair for pair, liked in changes.items() if not liked and pair[0] in existing_posts]
+
+            deltas: Dict[int, int] = {}
+            if likes:
+                dialect_name = self.db.get_bind().dialect.name
+                if dialect_name == "postgresql":
+                    stmt = pg_insert(post_likes).values(likes).on_conflict_do_nothing()
+                elif dialect_name == "sqlite":
+                    stmt = sqlite_insert(post_likes).values(likes).on_conflict_do_nothing()
+                else:
+                    stmt = insert(post_likes).values(likes)
+                for post_id in (await self.db.execute(stmt.returning(post_likes.c.post_id))).scalars():
+                    deltas[post_id] = deltas.get(post_id, 0) + 1
+            if unlikes:
+                result = await self.db.execute(
+                    delete(post_likes)
+                    .where(tuple_(post_likes.c.post_id, post_likes.c.user_id).in_(unlikes))
+                    .returning(post_likes.c.post_id)
+                )
+                for post_id in result.scalars():
+                    deltas[post_id] = deltas.get(post_id, 0) - 1
+
+            by_delta: Dict[int, List[int]] = {}
+            for post_id, delta in deltas.items():
+                if delta:
+                    by_delta.setdefault(delta, []).append(post_id)
+            likes_counts: Dict[int, int] = {}
+            for delta, ids in by_delta.items():
+                result = await self.db.execute(
+                    update(Post)
+                    .where(Post.id.in_(ids))
+                    .values(likes_count=Post.likes_count + delta, version=Post.version + 1)
+                    .returning(Post.id, Post.likes_count)
+                    .execution_options(synchronize_session=False)
+                )
+                likes_counts.update({post_id: likes_count for post_id, likes_count in result.all()})
+            await self.db.commit()
+            return likes_counts
+        except Exception as e:
+            await self.db.rollback()
+            logger.error(f"Error in apply_likes: {e}")
+            raise
+
+class TimelineRepository:
+    def __init__(self, db: Session):
+        self.db = db
+
+    def trim_all(self, max_length: int) -> int:
+        try:
+            result = self.db.execute(timeline_trim(max_length))
+            self.db.commit()
+            return result.rowcount
         except Exception as e:
             self.db.rollback()
-            print(f"Error in unlike_post: {str(e)}")
-            raise
\ No newline at end of file
+            logger.error(f"Error in trim_all timelines: {e}")
+            raise
+
+class AsyncTimelineRepository:
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def get_followers_count(self, user_id: int) -> int:
+        return await self.db.scalar(select(User.followers_count).where(User.id == user_id)) or 0
+
+    async def fan_out(self, post_id: int, author_id: int, to_followers: bool = True) -> int:
+        # Одна вставка INSERT ... SELECT: id поста в ленты всех подписчиков автора и в его собственную
+        rows = select(literal(author_id), literal(post_id))
+        if to_followers:
+            rows = union_all(
+                rows,
+                select(follows.c.follower_id, literal(post_id)).where(follows.c.followee_id == author_id),
+            )
+        try:
+            result = await self.db.execute(
+                insert_ignoring_duplicates(self.db.get_bind().dialect.name, home_timeline, ["user_id", "post_id"], rows)
+            )
+            await self.db.commit()
+            return result.rowcount
+        except Exception as e:
+            await self.db.rollback()
+            logger.error(f"Error in fan_out: {e}")
+            raise
+
+    async def backfill(self, follower_id: int, followee_id: int, limit: int):
+        # Новая подписка: последние посты автора сразу появляются в ленте подписчика
+        latest = (
+            select(literal(follower_id), Post.id)
+            .where(Post.user_id == followee_id)
+            .order_by(Post.id.desc())
+            .limit(limit)
+        )
+        try:
+            await self.db.execute(
+                insert_ignoring_duplicates(self.db.get_bind().dialect.name, home_timeline, ["user_id", "post_id"], latest)
+            )
+            await self.db.commit()
+        except Exception as e:
+            await self.db.rollback()
+            logger.error(f"Error in backfill timeline: {e}")
+            raise
+
+    async def remove_author(self, follower_id: int, followee_id: int):
+        try:
+            await self.db.execute(
+                delete(home_timeline).where(
+                    home_timeline.c.user_id == follower_id,
+                    home_timeline.c.post_id.in_(select(Post.id).where(Post.user_id == followee_id)),
+                )
+            )
+            await self.db.commit()
+        except Exception as e:
+            await self.db.rollback()
+            logger.error(f"Error in remove_author from timeline: {e}")
+            raise
+
+    async def get_page_ids(self, user_id: int, limit: int, after_id: Optional[int] = None) -> List[int]:
+        # Диапазон по первичному ключу (user_id, post_id): цена зависит только от limit
+        query = select(home_timeline.c.post_id).where(home_timeline.c.user_id == user_id)
+        if after_id is not None:
+            query = query.where(home_timeline.c.post_id < after_id)
+        result = await self.db.execute(query.order_by(home_timeline.c.post_id.desc()).limit(limit))
+        return list(result.scalars().all())
+
+    async def get_author_post_ids(self, author_ids: List[int], limit: int, after_id: Optional[int] = None) -> List[int]:
+        # Чтение по авторам без рассылки: по limit последних постов каждого из индекса (user_id, id DESC)
+        if not author_ids:
+            return []
+        pages = []
+        for author_id in author_ids:
+            query = select(Post.id).where(Post.user_id == author_id)
+            if after_id is not None:
+                query = query.where(Post.id < after_id)
+            page = query.order_by(Post.id.desc()).limit(limit).subquery()
+            pages.append(select(page.c.id))
+        result = await self.db.execute(union_all(*pages) if len(pages) > 1 else pages[0])
+        return sorted(result.scalars().all(), reverse=True)[:limit]
+
+    async def get_celebrity_ids(self, min_followers: int) -> List[int]:
+        result = await self.db.execute(select(User.id).where(User.followers_count >= min_followers))
+        return list(result.scalars().all())
+
+    async def get_followed_among(self, follower_id: int, candidate_ids: List[int]) -> List[int]:
+        if not candidate_ids:
+            return []
+        result = await self.db.execute(
+            select(follows.c.followee_id).where(follows.c.follower_id == follower_id, follows.c.followee_id.in_(candidate_ids))
+        )
+        return list(result.scalars().all())
+
+    async def trim(self, user_id: int, max_length: int) -> int:
+        try:
+            result = await self.db.execute(timeline_trim(max_length, user_id))
+            await self.db.commit()
+            return result.rowcount
+        except Exception as e:
+            await self.db.rollback()
+            logger.error(f"Error in trim timeline: {e}")
+            raise
+
+class AsyncTrendingRepository:
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def load(self) -> List[Tuple[int, float, float]]:
+        result = await self.db.execute(
+            select(trending_scores.c.post_id, trending_scores.c.score, trending_scores.c.checkpointed_at)
+        )
+        return [tuple(row) for row in result.all()]
+
+    async def save(self, entries: List[Tuple[int, float]], checkpointed_at: float):
+        # Снимок целиком заменяет предыдущий в одной транзакции
+        try:
+            await self.db.execute(delete(trending_scores))
+            if entries:
+                await self.db.execute(
+                    insert(trending_scores),
+                    [{"post_id": post_id, "score": score, "checkpointed_at": checkpointed_at} for post_id, score in entries],
+                )
+            await self.db.commit()
+        except Exception as e:
+            await self.db.rollback()
+            logger.error(f"Error in save trending scores: {e}")
+            raise
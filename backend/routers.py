@@ -1,27 +1,56 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, Depends, Header, HTTPException, Query, Response, status
+from fastapi.responses import StreamingResponse
 from fastapi.security import OAuth2PasswordBearer
 import jwt
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
-from database import get_db
-from schemas import UserCreate, UserUpdate, UserResponse, PostCreate, PostUpdate, PostResponse
-from repositories import UserRepository, PostRepository
-from services import TokenService
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_async_db, open_read_session
+from schemas import (
+    UserCreate, UserUpdate, UserResponse, PostCreate, PostUpdate, PostResponse,
+    BatchPostIds, BatchPostResponse, BatchUserResponse, LikeStateResponse, FollowResponse,
+)
+from repositories import AsyncUserRepository, AsyncPostRepository
+from services import TokenService, Principal, PasswordHasher
+from exceptions import ServiceUnavailableException
 from models import User, Post
-import hashlib
 import os
-from typing import List, Optional, Dict
-from utils import generate_random_user
+from typing import AsyncIterator, Callable, List, Optional, Dict
+from utils import generate_random_user, encode_cursor, decode_cursor, make_etag, etag_matches
+from seeding import seed_database
+from search import UserSearchService
+from cache import ResponseCache, CachedPage
+from broadcast import Broadcaster
+from replicas import RecentWriters
+from timeline import TimelineService
+from trending import TrendingService
+from like_buffer import LikeBuffer
+from projection import USER_FIELDS, STREAM_BATCH_SIZE, parse_post_fields, dump_rows, dump_users_page, iter_json_array, iter_ndjson
+from log import get_logger
 
 router = APIRouter(prefix="/users", tags=["users"])
+logger = get_logger("routers")
 
 token_service = TokenService()
+password_hasher = PasswordHasher()
+user_search = UserSearchService()
+feed_cache = ResponseCache()
+feed_broadcaster = Broadcaster()
+recent_writers = RecentWriters()
+home_timelines = TimelineService()
+trending_posts = TrendingService()
+like_buffer = LikeBuffer()
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 SECRET_KEY = "tokentokentokentokentokentoken"
 ALGORITHM = "HS256"
 
+MAX_PAGE_SIZE = 100
+MAX_BATCH_SIZE = 100
+
+# Массовая генерация данных доступна только там, где её явно включили
+SEED_ENDPOINT_ENABLED = os.getenv("SEED_ENDPOINT_ENABLED", "false").lower() in ("1", "true", "yes")
+
 def get_current_user(token: str = Depends(oauth2_scheme)):
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
@@ -34,11 +63,94 @@ def get_current_user(token: str = Depends(oauth2_scheme)):
 
 
 
+def service_unavailable(e: ServiceUnavailableException) -> HTTPException:
+    return HTTPException(status_code=503, detail=e.message, headers={"Retry-After": str(e.retry_after)})
+
+def clamp_limit(limit: int) -> int:
+    # Размер страницы ограничивается на сервере, что бы ни прислал клиент
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+def read_db(principal_dependency):
+    # Сессия для GET-маршрутов: реплика, а для автора недавней записи — primary (read-your-writes).
+    # Зависимость от того же principal_dependency, что и у маршрута, FastAPI вычисляет один раз
+    async def read_session(current_user: Optional[Principal] = Depends(principal_dependency)):
+        db = await open_read_session(prefer_primary=recent_writers.recent(current_user.id if current_user else None))
+        async with db:
+            yield db
+    return read_session
+
+get_read_db = read_db(token_service.get_current_principal)
+get_read_db_optional = read_db(token_service.get_current_principal_optional)
+
+def stream_rows_response(
+    rows_of: Callable[[AsyncSession], AsyncIterator],
+    fields,
+    accept: Optional[str],
+    prefer_primary: bool = False,
+) -> StreamingResponse:
+    # Accept: application/x-ndjson — по объекту на строку, иначе один JSON-массив, собираемый по частям
+    ndjson = accept is not None and "application/x-ndjson" in accept
+    encode = iter_ndjson if ndjson else iter_json_array
+
+    async def body():
+        # Своя сессия: тело отдаётся уже после того, как зависимость get_async_db закрыла свою
+        async with await open_read_session(prefer_primary) as db:
+            async for chunk in encode(rows_of(db), fields):
+                yield chunk
+
+    return StreamingResponse(body(), media_type="application/x-ndjson" if ndjson else "application/json")
+
+def batch_ids(ids: List[int]) -> List[int]:
+    # Повторы убираются с сохранением порядка; размер пакета ограничен так же, как страница
+    unique_ids = list(dict.fromkeys(ids))
+    if not unique_ids:
+        raise HTTPException(status_code=400, detail="At least one id is required")
+    if len(unique_ids) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_SIZE} ids per batch")
+    return unique_ids
+
+def post_batch_response(post_ids: List[int], posts: List[Post]) -> dict:
+    by_id = {post.id: post for post in posts}
+    return {"items": [
+        {"id": post_id, "status": 200, "post": by_id[post_id]} if post_id in by_id
+        else {"id": post_id, "status": 404, "detail": f"Post with id {post_id} not found"}
+        for post_id in post_ids
+    ]}
+
+# Ответы для конкретного пользователя браузер может хранить, но обязан перепроверять по ETag
+PRIVATE_CACHE_CONTROL = "private, no-cache"
+# Анонимная лента одинакова для всех: разрешаем общим кэшам держать её несколько секунд
+PUBLIC_FEED_CACHE_CONTROL = "public, max-age=5"
+
+def not_modified(etag: str, cache_headers: Optional[Dict[str, str]] = None) -> Response:
+    headers = cache_headers or {"Cache-Control": PRIVATE_CACHE_CONTROL}
+    return Response(status_code=304, headers={**headers, "ETag": etag})
+
+def feed_etag(viewer_id: Optional[int], fields, versions) -> str:
+    # like/unlike меняют версию поста, так что (id, version), читатель и набор полей однозначно задают страницу
+    return make_etag("feed", viewer_id, ",".join(fields), *(f"{post_id}:{version}" for post_id, version in versions))
+
+def post_fields(fields: Optional[str]):
+    try:
+        return parse_post_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def parse_cursor(cursor: Optional[str]) -> Optional[dict]:
+    if not cursor:
+        return None
+    try:
+        return decode_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 class PaginatedUserResponse(BaseModel):
     users: List[UserResponse]
     total: int
     skip: int
     limit: int
+    next_cursor: Optional[str] = None
 
 
 @router.get("/", response_model=PaginatedUserResponse)
@@ -47,127 +159,298 @@ async def get_users(
     limit: int = 10,
     sort_by: Optional[str] = None,
     search: Optional[str] = None,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(token_service.get_current_user_optional)
+    cursor: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_read_db_optional),
+    current_user: Optional[Principal] = Depends(token_service.get_current_principal_optional)
 ):
     try:
-        repo = UserRepository(db)
-        # Получаем пользователей с пагинацией
-        users = repo.get_all(skip=skip, limit=limit, sort_by=sort_by, search=search)
-        
-        # Считаем общее количество пользователей для пагинации
-        total_query = db.query(User)
+        after = parse_cursor(cursor)
+        limit = clamp_limit(limit)
+        page = dict(
+            skip=skip,
+            limit=limit,
+            sort_by=sort_by,
+            after_id=after["id"] if after else None,
+            after_name=after.get("name") if after else None,
+        )
+        # Страница и общее количество для пагинации приходят вместе
         if search:
-            total_query = total_query.filter(User.name.ilike(f"%{search}%"))
-        total = total_query.count()
-
-        print(f"Returning users: {[user.__dict__ for user in users]}, total: {total}")
-        return {
-            "users": users,
-            "total": total,
-            "skip": skip,
-            "limit": limit
-        }
+            users, total = await user_search.search(db, search, **page)
+        else:
+            users, total = await AsyncUserRepository(db).get_page(**page)
+
+        next_cursor = None
+        # При сортировке по релевантности листаем только через skip
+        if users and len(users) == limit and not (search and sort_by is None):
+            last = users[-1]
+            if sort_by in ("name", "name_desc"):
+                next_cursor = encode_cursor(id=last.id, name=last.name)
+            else:
+                next_cursor = encode_cursor(id=last.id)
+
+        etag = make_etag("users", total, *(f"{user.id}:{user.version}" for user in users))
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+
+        return Response(
+            content=dump_users_page(users, total, skip, limit, next_cursor),
+            media_type="application/json",
+            headers={"ETag": etag, "Cache-Control": PRIVATE_CACHE_CONTROL},
+        )
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error in get_users: {str(e)}")
+        logger.exception(f"Error in get_users: {e}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 @router.post("/", response_model=UserResponse)
-async def create_user(user: UserCreate, db: Session = Depends(get_db)):
+async def create_user(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
     try:
-        repo = UserRepository(db)
-        db_user = repo.get_by_login(user.login)
+        password_hasher.check_capacity()
+        repo = AsyncUserRepository(db)
+        db_user = await repo.get_by_login(user.login)
         if db_user:
             raise HTTPException(status_code=400, detail="User already exists")
 
-        salt = hashlib.sha256(os.urandom(32)).hexdigest()
-        password_hash = hashlib.sha256((user.password + salt).encode()).hexdigest()
+        # Возвращаем соединение в пул, пока пароль хешируется в пуле
+        await db.commit()
+        password_hash = await password_hasher.hash(user.password)
 
         new_user = User(
             login=user.login,
             name=user.name,
             password_hash=password_hash,
-            password_salt=salt
+            password_salt=""  # соль хранится внутри bcrypt-хеша
         )
-        db.add(new_user)
-        db.commit()
-        db.refresh(new_user)
+        new_user = await repo.create(new_user)
+        user_search.on_user_saved(new_user)
+        recent_writers.mark(new_user.id)
 
-        token = token_service.create_access_token(data={"sub": new_user.login})
+        token = token_service.create_access_token(data={"sub": new_user.login, "uid": new_user.id})
         new_user.token = token
         return new_user
+    except ServiceUnavailableException as e:
+        raise service_unavailable(e)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception(f"Error in create_user: {e}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@router.get("/export")
+async def export_users(
+    sort_by: Optional[str] = None,
+    search: Optional[str] = None,
+    accept: Optional[str] = Header(None),
+    current_user: Principal = Depends(token_service.get_current_principal)
+):
+    """
+    Все пользователи одним потоком (JSON-массив или NDJSON) с постоянным расходом памяти.
+    """
+    return stream_rows_response(
+        lambda db: AsyncUserRepository(db).stream_rows(sort_by=sort_by, search=search, batch_size=STREAM_BATCH_SIZE),
+        USER_FIELDS,
+        accept,
+        prefer_primary=recent_writers.recent(current_user.id),
+    )
+
+@router.get("/batch", response_model=BatchUserResponse)
+async def get_users_batch(
+    ids: List[int] = Query(...),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Principal = Depends(token_service.get_current_principal)
+):
+    """
+    Несколько пользователей за один запрос: /users/batch?ids=1&ids=2.
+    """
+    try:
+        user_ids = batch_ids(ids)
+        users = {user.id: user for user in await AsyncUserRepository(db).get_many(user_ids)}
+        return {"items": [
+            {"id": user_id, "status": 200, "user": users[user_id]} if user_id in users
+            else {"id": user_id, "status": 404, "detail": f"User with id {user_id} not found"}
+            for user_id in user_ids
+        ]}
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error in create_user: {str(e)}")
+        logger.exception(f"Error in get_users_batch: {e}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@router.get("/timeline", response_model=List[PostResponse])
+async def get_home_timeline(
+    background_tasks: BackgroundTasks,
+    limit: int = 20,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Principal = Depends(token_service.get_current_principal)
+):
+    """
+    Домашняя лента: посты тех, на кого подписан пользователь, и его собственные, новые сверху.
+    """
+    try:
+        after = parse_cursor(cursor)
+        limit = clamp_limit(limit)
+        selected = post_fields(fields)
+        post_ids = await home_timelines.page_ids(db, current_user.id, limit, after["id"] if after else None)
+        rows = await AsyncPostRepository(db).get_post_rows_by_ids(post_ids, selected, current_user_id=current_user.id)
+        rows = like_buffer.overlay_rows(rows, current_user.id)
+        headers = {}
+        # Курсор — по id из ленты: удалённый между чтениями пост не обрывает пагинацию
+        if len(post_ids) == limit:
+            headers["X-Next-Cursor"] = encode_cursor(id=post_ids[-1])
+        background_tasks.add_task(home_timelines.maybe_trim, current_user.id)
+        return Response(content=dump_rows(rows, selected), media_type="application/json", headers=headers)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception(f"Error in get_home_timeline: {e}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 @router.get("/{user_id}", response_model=UserResponse)
-async def get_user(user_id: int, db: Session = Depends(get_db), current_user: User = Depends(token_service.get_current_user)):
+async def get_user(
+    user_id: int,
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Principal = Depends(token_service.get_current_principal)
+):
     try:
-        repo = UserRepository(db)
-        user = repo.get(user_id)
+        repo = AsyncUserRepository(db)
+        user = await repo.get(user_id)
         if not user:
             raise HTTPException(status_code=404, detail=f"User with id {user_id} not found")
-        print(f"Returning user: {user.__dict__}")
+        etag = make_etag("user", user.id, user.version)
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = PRIVATE_CACHE_CONTROL
         return user
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error in get_user: {str(e)}")
+        logger.exception(f"Error in get_user: {e}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 @router.put("/{user_id}", response_model=UserResponse)
-async def update_user(user_id: int, user_update: UserUpdate, db: Session = Depends(get_db), current_user: User = Depends(token_service.get_current_user)):
+async def update_user(user_id: int, user_update: UserUpdate, db: AsyncSession = Depends(get_async_db), current_user: Principal = Depends(token_service.get_current_user)):
     try:
         if current_user.id != user_id:
             raise HTTPException(status_code=403, detail="Not authorized to update this user")
-        repo = UserRepository(db)
-        user = repo.get(user_id)
+        repo = AsyncUserRepository(db)
+        user = await repo.get(user_id)
         if not user:
             raise HTTPException(status_code=404, detail=f"User with id {user_id} not found")
-        user = repo.update(user, user_update.dict(exclude_unset=True))
+        user = await repo.update(user, user_update.dict(exclude_unset=True))
+        token_service.invalidate_user(user_id)
+        user_search.on_user_saved(user)
+        recent_writers.mark(user_id)
         return user
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error in update_user: {str(e)}")
+        logger.exception(f"Error in update_user: {e}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 @router.delete("/{user_id}")
-async def delete_user(user_id: int, db: Session = Depends(get_db), current_user: User = Depends(token_service.get_current_user)):
+async def delete_user(user_id: int, db: AsyncSession = Depends(get_async_db), current_user: Principal = Depends(token_service.get_current_user)):
     try:
         if current_user.id != user_id:
             raise HTTPException(status_code=403, detail="Not authorized to delete this user")
-        repo = UserRepository(db)
-        user = repo.get(user_id)
+        repo = AsyncUserRepository(db)
+        user = await repo.get(user_id)
         if not user:
             raise HTTPException(status_code=404, detail=f"User with id {user_id} not found")
-        repo.delete(user)
+        await repo.delete(user)
+        token_service.invalidate_user(user_id, deleted=True)
+        user_search.on_user_deleted(user_id)
+        # Удаление снимает лайки пользователя со многих постов сразу
+        feed_cache.clear()
         return {"message": "User deleted"}
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error in delete_user: {str(e)}")
+        logger.exception(f"Error in delete_user: {e}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@router.post("/{user_id}/follow", response_model=FollowResponse)
+async def follow_user(
+    user_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(token_service.get_current_user)
+):
+    try:
+        if current_user.id == user_id:
+            raise HTTPException(status_code=400, detail="Cannot follow yourself")
+        repo = AsyncUserRepository(db)
+        followee = await repo.get(user_id)
+        if not followee:
+            raise HTTPException(status_code=404, detail=f"User with id {user_id} not found")
+        if await repo.follow(current_user.id, followee):
+            await home_timelines.on_follow(db, current_user.id, user_id, followee.followers_count)
+        recent_writers.mark(current_user.id)
+        return {"user_id": user_id, "following": True, "followers_count": followee.followers_count}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception(f"Error in follow_user: {e}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@router.delete("/{user_id}/follow", response_model=FollowResponse)
+async def unfollow_user(
+    user_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(token_service.get_current_user)
+):
+    try:
+        repo = AsyncUserRepository(db)
+        followee = await repo.get(user_id)
+        if not followee:
+            raise HTTPException(status_code=404, detail=f"User with id {user_id} not found")
+        if await repo.unfollow(current_user.id, followee):
+            await home_timelines.on_unfollow(db, current_user.id, user_id)
+        recent_writers.mark(current_user.id)
+        return {"user_id": user_id, "following": False, "followers_count": followee.followers_count}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception(f"Error in unfollow_user: {e}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 @router.post("/login", response_model=UserResponse)
-async def login_user(user: UserCreate, db: Session = Depends(get_db)):
+async def login_user(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
     try:
-        repo = UserRepository(db)
-        db_user = repo.get_by_login(user.login)
+        password_hasher.check_capacity()
+        repo = AsyncUserRepository(db)
+        db_user = await repo.get_by_login(user.login)
         if not db_user:
             raise HTTPException(status_code=401, detail="Invalid login or password")
 
-        password_hash = hashlib.sha256((user.password + db_user.password_salt).encode()).hexdigest()
-        if password_hash != db_user.password_hash:
+        # Возвращаем соединение в пул, пока пароль проверяется в пуле
+        await db.commit()
+        if not await password_hasher.verify(user.password, db_user.password_hash, db_user.password_salt):
             raise HTTPException(status_code=401, detail="Invalid login or password")
 
-        token = token_service.create_access_token(data={"sub": db_user.login})
+        token = token_service.create_access_token(data={"sub": db_user.login, "uid": db_user.id})
         db_user.token = token
         return db_user
+    except ServiceUnavailableException as e:
+        raise service_unavailable(e)
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error in login_user: {str(e)}")
+        logger.exception(f"Error in login_user: {e}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 @router.post("/{user_id}/posts/", response_model=PostResponse)
 async def create_post(
     user_id: int,
     post: PostCreate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(token_service.get_current_user)
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(token_service.get_current_user)
 ):
     try:
         # Проверяем, что текущий пользователь создаёт пост от своего имени
@@ -175,146 +458,436 @@ async def create_post(
             raise HTTPException(status_code=403, detail="Not authorized to create post for this user")
         
         # Создаём новый пост
-        repo = PostRepository(db)
+        repo = AsyncPostRepository(db)
         new_post = Post(
             title=post.title,
             content=post.content,
             user_id=user_id
         )
-        created_post = repo.create(new_post)
+        created_post = await repo.create(new_post)
+        feed_cache.on_post_created(created_post.id)
+        recent_writers.mark(current_user.id)
+        feed_broadcaster.publish("post_created", PostResponse.model_validate(created_post).model_dump(exclude={"liked_by_me"}))
+        # Раскладка по домашним лентам подписчиков — после отправки ответа
+        background_tasks.add_task(home_timelines.fan_out, created_post.id, user_id)
         return created_post
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error in create_post: {str(e)}")
+        logger.exception(f"Error in create_post: {e}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 @router.get("/{user_id}/posts/", response_model=List[PostResponse])
-async def get_posts_by_user(user_id: int, db: Session = Depends(get_db), current_user: User = Depends(token_service.get_current_user)):
+async def get_posts_by_user(
+    user_id: int,
+    limit: int = 20,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Principal = Depends(token_service.get_current_principal)
+):
     try:
-        repo = PostRepository(db)
-        posts = repo.get_posts_by_user(user_id, current_user_id=current_user.id)
-        print(f"Returning posts for user {user_id}: {[post.__dict__ for post in posts]}")
-        return posts
+        after = parse_cursor(cursor)
+        limit = clamp_limit(limit)
+        selected = post_fields(fields)
+        repo = AsyncPostRepository(db)
+        rows = await repo.get_post_rows_by_user(
+            user_id,
+            selected,
+            current_user_id=current_user.id,
+            limit=limit,
+            after_id=after["id"] if after else None
+        )
+        rows = like_buffer.overlay_rows(rows, current_user.id)
+        headers = {}
+        if rows and len(rows) == limit:
+            headers["X-Next-Cursor"] = encode_cursor(id=rows[-1]["id"])
+        return Response(content=dump_rows(rows, selected), media_type="application/json", headers=headers)
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error in get_posts_by_user: {str(e)}")
+        logger.exception(f"Error in get_posts_by_user: {e}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+@router.get("/{user_id}/posts/export")
+async def export_posts_by_user(
+    user_id: int,
+    fields: Optional[str] = None,
+    accept: Optional[str] = Header(None),
+    current_user: Principal = Depends(token_service.get_current_principal)
+):
+    """
+    Все посты пользователя одним потоком, без ограничения limit; fields — как в ленте.
+    """
+    selected = post_fields(fields)
+    return stream_rows_response(
+        lambda db: AsyncPostRepository(db).stream_post_rows_by_user(
+            user_id, selected, current_user_id=current_user.id, batch_size=STREAM_BATCH_SIZE
+        ),
+        selected,
+        accept,
+        prefer_primary=recent_writers.recent(current_user.id),
+    )
+
 @router.get("/posts/", response_model=List[PostResponse])
 async def get_posts(
     skip: int = 0,
     limit: int = 10,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(token_service.get_current_user_optional)
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_read_db_optional),
+    current_user: Optional[Principal] = Depends(token_service.get_current_principal_optional)
 ):
     try:
-        repo = PostRepository(db)
-        posts = repo.get_posts(
-            skip=skip,
-            limit=limit,
-            current_user_id=current_user.id if current_user else None
+        after = parse_cursor(cursor)
+        after_id = after["id"] if after else None
+        # До ключа кэша: иначе каждый limit — отдельная запись, а большой грузит всю таблицу
+        limit = clamp_limit(limit)
+        viewer_id = current_user.id if current_user else None
+        selected = post_fields(fields)
+        cache_headers = {
+            "Cache-Control": PRIVATE_CACHE_CONTROL if viewer_id else PUBLIC_FEED_CACHE_CONTROL,
+            "Vary": "Authorization",
+        }
+
+        async def load_page() -> CachedPage:
+            repo = AsyncPostRepository(db)
+            rows = await repo.get_post_rows(
+                skip=skip,
+                limit=limit,
+                fields=selected,
+                current_user_id=viewer_id,
+                after_id=after_id
+            )
+            # Несброшенные лайки (write-behind) видны сразу, в том числе в ETag
+            rows = like_buffer.overlay_rows(rows, viewer_id)
+            headers = {}
+            # Тело ответа остаётся списком, курсор следующей страницы — в заголовке
+            if rows and len(rows) == limit:
+                headers["X-Next-Cursor"] = encode_cursor(id=rows[-1]["id"])
+            return CachedPage(
+                body=dump_rows(rows, selected),
+                post_ids=frozenset(row["id"] for row in rows),
+                offset_based=after_id is None,
+                min_post_id=rows[-1]["id"] if rows else None,
+                headers=headers,
+                etag=feed_etag(viewer_id, selected, [(row["id"], row["version"]) for row in rows]),
+            )
+
+        # liked_by_me зависит от читателя, поэтому он входит в ключ (None — анонимная лента)
+        key = ("feed", skip if after_id is None else None, limit, after_id, viewer_id, selected)
+        page = feed_cache.get(key)
+        if page is None and if_none_match and not like_buffer.has_pending_for(viewer_id):
+            # Страницы нет в кэше: сверяем ETag по (id, version) без тяжёлого запроса ленты
+            versions = await AsyncPostRepository(db).get_post_versions(skip, limit, after_id)
+            etag = feed_etag(viewer_id, selected, versions)
+            if etag_matches(if_none_match, etag):
+                return not_modified(etag, cache_headers)
+        if page is None:
+            page = await feed_cache.get_or_load(key, load_page)
+        if etag_matches(if_none_match, page.etag):
+            return not_modified(page.etag, cache_headers)
+        return Response(
+            content=page.body,
+            media_type="application/json",
+            headers={**page.headers, **cache_headers, "ETag": page.etag},
         )
-        print(f"Returning posts: {[post.__dict__ for post in posts]}")
-        return posts
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error in get_posts: {str(e)}")
+        logger.exception(f"Error in get_posts: {e}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@router.get("/posts/popular", response_model=List[PostResponse])
+async def get_popular_posts(
+    skip: int = 0,
+    limit: int = 10,
+    fields: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db_optional),
+    current_user: Optional[Principal] = Depends(token_service.get_current_principal_optional)
+):
+    """
+    Популярные посты: по скорости набора лайков с затуханием, лучшие TRENDING_TOP_SIZE.
+    """
+    try:
+        limit = clamp_limit(limit)
+        selected = post_fields(fields)
+        post_ids = trending_posts.page_ids(max(skip, 0), limit)
+        viewer_id = current_user.id if current_user else None
+        rows = await AsyncPostRepository(db).get_post_rows_by_ids(post_ids, selected, current_user_id=viewer_id)
+        rows = like_buffer.overlay_rows(rows, viewer_id)
+        return Response(content=dump_rows(rows, selected), media_type="application/json")
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception(f"Error in get_popular_posts: {e}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@router.get("/posts/stream")
+async def stream_posts():
+    """
+    Server-Sent Events с изменениями ленты: новые, изменённые (в т.ч. likes_count) и удалённые посты.
+    """
+    try:
+        subscriber = feed_broadcaster.subscribe()
+    except ServiceUnavailableException as e:
+        raise service_unavailable(e)
+    return StreamingResponse(
+        feed_broadcaster.stream(subscriber),
+        media_type="text/event-stream",
+        # Без буферизации в nginx и без кэширования — события должны идти сразу
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.get("/posts/batch", response_model=BatchPostResponse)
+async def get_posts_batch(
+    ids: List[int] = Query(...),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Principal = Depends(token_service.get_current_principal)
+):
+    """
+    Несколько постов за один запрос: /users/posts/batch?ids=1&ids=2.
+    """
+    try:
+        post_ids = batch_ids(ids)
+        posts = await AsyncPostRepository(db).get_many_with_stats(post_ids, current_user_id=current_user.id)
+        like_buffer.overlay_posts(posts, current_user.id)
+        return post_batch_response(post_ids, posts)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception(f"Error in get_posts_batch: {e}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@router.get("/posts/likes", response_model=LikeStateResponse)
+async def get_like_state(
+    ids: List[int] = Query(...),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Principal = Depends(token_service.get_current_principal)
+):
+    """
+    liked_by_me для списка постов одним запросом к post_likes.
+    """
+    try:
+        post_ids = batch_ids(ids)
+        liked = await AsyncPostRepository(db).get_liked_post_ids(post_ids, current_user.id)
+        return {"liked_by_me": like_buffer.overlay_liked(liked, post_ids, current_user.id)}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception(f"Error in get_like_state: {e}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+async def buffer_likes(db: AsyncSession, post_ids: List[int], user_id: int, like: bool) -> List[int]:
+    # Write-behind: намерения в буфер вместо транзакции; рейтинг обновляется сразу
+    persisted = await like_buffer.persisted_states(db, post_ids, user_id)
+    changed = [post_id for post_id in post_ids if like_buffer.record(post_id, user_id, like, persisted.get(post_id))]
+    trending_posts.on_likes_changed(changed, 1 if like else -1)
+    return changed
+
+async def on_likes_flushed(likes_counts: Dict[int, int]):
+    # Пачка лайков записана в БД: сбрасываем кэш и рассылаем итоговые счётчики
+    for post_id, likes_count in likes_counts.items():
+        feed_cache.on_post_changed(post_id)
+        feed_broadcaster.publish("post_changed", {"id": post_id, "likes_count": likes_count})
+
+like_buffer.on_flushed(on_likes_flushed)
+
+async def change_likes_batch(db: AsyncSession, post_ids: List[int], current_user: Principal, like: bool) -> dict:
+    repo = AsyncPostRepository(db)
+    if like_buffer.enabled:
+        posts = await repo.get_many_with_stats(post_ids, current_user_id=current_user.id)
+        for post_id in await buffer_likes(db, [post.id for post in posts], current_user.id, like):
+            feed_cache.on_post_changed(post_id)
+        like_buffer.overlay_posts(posts, current_user.id)
+        recent_writers.mark(current_user.id)
+        return post_batch_response(post_ids, posts)
+    if like:
+        changed = set(await repo.like_posts(post_ids, current_user))
+    else:
+        changed = set(await repo.unlike_posts(post_ids, current_user))
+    trending_posts.on_likes_changed(list(changed), 1 if like else -1)
+    posts = await repo.get_many_with_stats(post_ids, current_user_id=current_user.id)
+    for post in posts:
+        if post.id in changed:
+            feed_cache.on_post_changed(post.id)
+            feed_broadcaster.publish("post_changed", {"id": post.id, "likes_count": post.likes_count})
+    recent_writers.mark(current_user.id)
+    return post_batch_response(post_ids, posts)
+
+@router.post("/posts/batch/like", response_model=BatchPostResponse)
+async def like_posts_batch(
+    batch: BatchPostIds,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(token_service.get_current_user)
+):
+    """
+    Лайк нескольких постов в одной транзакции; уже лайкнутые не меняются.
+    """
+    try:
+        return await change_likes_batch(db, batch_ids(batch.post_ids), current_user, like=True)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception(f"Error in like_posts_batch: {e}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@router.post("/posts/batch/unlike", response_model=BatchPostResponse)
+async def unlike_posts_batch(
+    batch: BatchPostIds,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(token_service.get_current_user)
+):
+    try:
+        return await change_likes_batch(db, batch_ids(batch.post_ids), current_user, like=False)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception(f"Error in unlike_posts_batch: {e}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 @router.get("/posts/{post_id}", response_model=PostResponse)
-async def get_post(post_id: int, db: Session = Depends(get_db), current_user: User = Depends(token_service.get_current_user)):
+async def get_post(
+    post_id: int,
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Principal = Depends(token_service.get_current_principal)
+):
     try:
-        repo = PostRepository(db)
-        post = repo.get(post_id)
+        repo = AsyncPostRepository(db)
+        post = await repo.get_with_stats(post_id, current_user_id=current_user.id)
         if not post:
             raise HTTPException(status_code=404, detail=f"Post with id {post_id} not found")
-        post.likes_count = len(post.liked_by) if post.liked_by is not None else 0
-        post.liked_by_me = any(user.id == current_user.id for user in post.liked_by) if post.liked_by else False
+        like_buffer.overlay_posts([post], current_user.id)
+        # liked_by_me зависит от читателя, поэтому его id входит в ETag
+        etag = make_etag("post", post.id, post.version, current_user.id)
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = PRIVATE_CACHE_CONTROL
         return post
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error in get_post: {str(e)}")
+        logger.exception(f"Error in get_post: {e}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 @router.put("/posts/{post_id}", response_model=PostResponse)
-async def update_post(post_id: int, post_update: PostUpdate, db: Session = Depends(get_db), current_user: User = Depends(token_service.get_current_user)):
+async def update_post(post_id: int, post_update: PostUpdate, db: AsyncSession = Depends(get_async_db), current_user: Principal = Depends(token_service.get_current_user)):
     try:
-        repo = PostRepository(db)
-        post = repo.get(post_id)
+        repo = AsyncPostRepository(db)
+        post = await repo.get(post_id)
         if not post:
             raise HTTPException(status_code=404, detail=f"Post with id {post_id} not found")
         if post.user_id != current_user.id:
             raise HTTPException(status_code=403, detail="Not authorized to update this post")
-        post = repo.update(post, post_update.dict(exclude_unset=True))
+        post = await repo.update(post, post_update.dict(exclude_unset=True))
+        feed_cache.on_post_changed(post_id)
+        feed_broadcaster.publish("post_changed", {"id": post.id, "title": post.title, "content": post.content})
+        recent_writers.mark(current_user.id)
         return post
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error in update_post: {str(e)}")
+        logger.exception(f"Error in update_post: {e}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 @router.delete("/posts/{post_id}")
-async def delete_post(post_id: int, db: Session = Depends(get_db), current_user: User = Depends(token_service.get_current_user)):
+async def delete_post(post_id: int, db: AsyncSession = Depends(get_async_db), current_user: Principal = Depends(token_service.get_current_user)):
     try:
-        repo = PostRepository(db)
-        post = repo.get(post_id)
+        repo = AsyncPostRepository(db)
+        post = await repo.get(post_id)
         if not post:
             raise HTTPException(status_code=404, detail=f"Post with id {post_id} not found")
         if post.user_id != current_user.id:
             raise HTTPException(status_code=403, detail="Not authorized to delete this post")
-        repo.delete(post)
+        await repo.delete(post)
+        trending_posts.on_post_deleted(post_id)
+        feed_cache.on_post_deleted(post_id)
+        feed_broadcaster.publish("post_deleted", {"id": post_id})
+        recent_writers.mark(current_user.id)
         return {"message": "Post deleted"}
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error in delete_post: {str(e)}")
+        logger.exception(f"Error in delete_post: {e}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 @router.post("/posts/{post_id}/like", response_model=PostResponse)
 async def like_post(
     post_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(token_service.get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(token_service.get_current_user)
 ):
     try:
-        repo = PostRepository(db)
-        post = repo.get(post_id)
+        repo = AsyncPostRepository(db)
+        post = await repo.get(post_id)
         if not post:
             raise HTTPException(status_code=404, detail=f"Post with id {post_id} not found")
-        repo.like_post(post, current_user)
-        post.likes_count = len(post.liked_by) if post.liked_by is not None else 0
+        if like_buffer.enabled:
+            await buffer_likes(db, [post_id], current_user.id, like=True)
+            like_buffer.overlay_posts([post], current_user.id)
+        else:
+            if await repo.like_post(post, current_user):
+                trending_posts.on_likes_changed([post_id], 1)
+            feed_broadcaster.publish("post_changed", {"id": post.id, "likes_count": post.likes_count})
+        feed_cache.on_post_changed(post_id)
+        recent_writers.mark(current_user.id)
         post.liked_by_me = True
         return post
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error in like_post: {str(e)}")
+        logger.exception(f"Error in like_post: {e}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 @router.delete("/posts/{post_id}/like", response_model=PostResponse)
 async def unlike_post(
     post_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(token_service.get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(token_service.get_current_user)
 ):
     try:
-        repo = PostRepository(db)
-        post = repo.get(post_id)
+        repo = AsyncPostRepository(db)
+        post = await repo.get(post_id)
         if not post:
             raise HTTPException(status_code=404, detail=f"Post with id {post_id} not found")
-        repo.unlike_post(post, current_user)
-        post.likes_count = len(post.liked_by) if post.liked_by is not None else 0
+        if like_buffer.enabled:
+            await buffer_likes(db, [post_id], current_user.id, like=False)
+            like_buffer.overlay_posts([post], current_user.id)
+        else:
+            if await repo.unlike_post(post, current_user):
+                trending_posts.on_likes_changed([post_id], -1)
+            feed_broadcaster.publish("post_changed", {"id": post.id, "likes_count": post.likes_count})
+        feed_cache.on_post_changed(post_id)
+        recent_writers.mark(current_user.id)
         post.liked_by_me = False
         return post
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error in unlike_post: {str(e)}")
+        logger.exception(f"Error in unlike_post: {e}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
     
 @router.post("/random", response_model=List[UserResponse])
-async def create_random_users(db: Session = Depends(get_db)):
+async def create_random_users(db: AsyncSession = Depends(get_async_db)):
     """
     Создаёт 20 случайных пользователей с русскими или английскими именами.
     """
     try:
-        repo = UserRepository(db)
+        repo = AsyncUserRepository(db)
         created_users = []
+        # Пароль у всех одинаковый — хешируем один раз и вне event loop
+        password_hash = await password_hasher.hash("password123")
         
         for _ in range(20):
             # Генерируем случайного пользователя
-            user_data = generate_random_user()
+            user_data = generate_random_user(password_hash=password_hash)
             
             # Проверяем, что логин уникален
-            existing_user = repo.get_by_login(user_data["login"])
+            existing_user = await repo.get_by_login(user_data["login"])
             if existing_user:
                 continue  # Пропускаем, если логин уже существует
             
@@ -328,14 +901,41 @@ async def create_random_users(db: Session = Depends(get_db)):
             db.add(new_user)
             created_users.append(new_user)
         
-        db.commit()
+        await db.commit()
         
         # Обновляем созданных пользователей
         for user in created_users:
-            db.refresh(user)
+            await db.refresh(user)
+            user_search.on_user_saved(user)
         
         return created_users
+    except ServiceUnavailableException as e:
+        raise service_unavailable(e)
     except Exception as e:
-        db.rollback()
-        print(f"Error in create_random_users: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
\ No newline at end of file
+        await db.rollback()
+        logger.exception(f"Error in create_random_users: {e}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+async def invalidate_caches():
+    # async — чтобы выполнялось в event loop, а не в потоке вместе с seed_database
+    user_search.invalidate()
+    feed_cache.clear()
+
+@router.post("/seed", status_code=202)
+async def seed_data(
+    background_tasks: BackgroundTasks,
+    users: int = 1000,
+    posts: int = 5000,
+    likes: int = 20000,
+    seed: int = 42,
+):
+    """
+    Запускает в фоне генерацию синтетических пользователей, постов и лайков (см. seeding.py).
+    """
+    if not SEED_ENDPOINT_ENABLED:
+        raise HTTPException(status_code=403, detail="Seeding is disabled")
+    if users <= 0 or posts < 0 or likes < 0:
+        raise HTTPException(status_code=400, detail="users must be positive, posts and likes non-negative")
+    background_tasks.add_task(seed_database, users=users, posts=posts, likes=likes, seed=seed)
+    background_tasks.add_task(invalidate_caches)
+    return {"message": "Seeding started", "users": users, "posts": posts, "likes": likes, "seed": seed}
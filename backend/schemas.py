@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Optional, List, Dict
 
 class UserCreate(BaseModel):
     login: str
@@ -41,4 +41,34 @@ class PaginatedUserResponse(BaseModel):
     users: List[UserResponse]
     total: int
     skip: int
-    limit: int
\ No newline at end of file
+    limit: int
+    next_cursor: Optional[str] = None
+class BatchPostIds(BaseModel):
+    post_ids: List[int]
+
+# Элементы пакетных ответов идут в порядке запрошенных id; отсутствующие — со status 404
+class BatchPostItem(BaseModel):
+    id: int
+    status: int
+    post: Optional[PostResponse] = None
+    detail: Optional[str] = None
+
+class BatchPostResponse(BaseModel):
+    items: List[BatchPostItem]
+
+class BatchUserItem(BaseModel):
+    id: int
+    status: int
+    user: Optional[UserResponse] = None
+    detail: Optional[str] = None
+
+class BatchUserResponse(BaseModel):
+    items: List[BatchUserItem]
+
+class LikeStateResponse(BaseModel):
+    liked_by_me: Dict[int, bool]
+
+class FollowResponse(BaseModel):
+    user_id: int
+    following: bool
+    followers_count: int
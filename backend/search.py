@@ -0,0 +1,229 @@
+import asyncio
+import os
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import AsyncSessionLocal
+from log import get_logger
+from repositories import AsyncUserRepository
+
+# Бэкенд поиска пользователей: auto (pg_trgm на Postgres, индекс в памяти на остальных),
+# postgres, memory или like (простой ILIKE без индекса)
+USER_SEARCH_BACKEND = os.getenv("USER_SEARCH_BACKEND", "auto")
+# Как часто индекс в памяти перечитывается из БД (изменения других воркеров)
+USER_SEARCH_REFRESH_SECONDS = int(os.getenv("USER_SEARCH_REFRESH_SECONDS", "60"))
+# Запросы короче — без триграмм, их обслуживает БД, а не перебор индекса
+MIN_INDEXED_QUERY_LENGTH = 3
+
+logger = get_logger("search")
+
+
+def trigrams(value: str) -> Set[str]:
+    return {value[i:i + 3] for i in range(len(value) - 2)}
+
+
+def relevance(query: str, name: Optional[str], login: Optional[str]) -> float:
+    # Точное совпадение > начало строки > начало слова > подстрока
+    best = 0.0
+    for field in (name, login):
+        if not field:
+            continue
+        field = field.lower()
+        if field == query:
+            score = 4.0
+        elif field.startswith(query):
+            score = 3.0
+        elif any(word.startswith(query) for word in field.split()):
+            score = 2.0
+        elif query in field:
+            score = 1.0
+        else:
+            continue
+        # При равном типе совпадения выше короткие строки, где запрос занимает большую часть
+        best = max(best, score + len(query) / len(field))
+    return best
+
+
+class TrigramIndex:
+    """Триграммный индекс по name и login в памяти процесса — замена pg_trgm для SQLite."""
+
+    def __init__(self):
+        self._entries: Dict[int, Tuple[Optional[str], str, str]] = {}
+        self._postings: Dict[str, Set[int]] = {}
+        self.loaded_at: Optional[float] = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    @classmethod
+    def build(cls, entries: Iterable[Tuple[int, Optional[str], str]]) -> "TrigramIndex":
+        # Только CPU, без общего состояния — выполняется в пуле потоков, вне event loop
+        index = cls()
+        for user_id, name, login in entries:
+            index.add(user_id, name, login)
+        index.loaded_at = time.monotonic()
+        return index
+
+    def add(self, user_id: int, name: Optional[str], login: str):
+        self.remove(user_id)
+        text = f"{(name or '').lower()}\n{(login or '').lower()}"
+        self._entries[user_id] = (name, login, text)
+        for gram in trigrams(text):
+            self._postings.setdefault(gram, set()).add(user_id)
+
+    def remove(self, user_id: int):
+        entry = self._entries.pop(user_id, None)
+        if entry is None:
+            return
+        for gram in trigrams(entry[2]):
+            ids = self._postings.get(gram)
+            if ids is not None:
+                ids.discard(user_id)
+                if not ids:
+                    del self._postings[gram]
+
+    def match(self, query: str) -> List[int]:
+        # query не короче MIN_INDEXED_QUERY_LENGTH: короткие запросы сюда не попадают
+        query = query.lower()
+        postings = sorted((self._postings.get(gram, set()) for gram in trigrams(query)), key=len)
+        candidates = set.intersection(*postings) if postings else set()
+        # Триграммы только отбирают кандидатов, точное совпадение подстроки проверяем отдельно
+        return [user_id for user_id in candidates if query in self._entries[user_id][2]]
+
+    def sort_key(self, sort_by: Optional[str], query: str):
+        entries = self._entries
+        if sort_by in ("name", "name_desc"):
+            return lambda user_id: (entries[user_id][0] is None, entries[user_id][0] or "", user_id)
+        if sort_by in ("id", "id_desc"):
+            return lambda user_id: user_id
+        return lambda user_id: (-relevance(query.lower(), entries[user_id][0], entries[user_id][1]), user_id)
+
+
+class UserSearchService:
+    """Поиск пользователей по name и login с ранжированием; count и страница — за один проход."""
+
+    def __init__(self, backend: str = USER_SEARCH_BACKEND, refresh_seconds: int = USER_SEARCH_REFRESH_SECONDS):
+        self.backend = backend
+        self.refresh_seconds = refresh_seconds
+        self.index = TrigramIndex()
+        self._reload_task: Optional[asyncio.Task] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+        # Изменения пользователей, пришедшие во время сборки нового индекса
+        self._changes: Optional[List[Tuple[int, Optional[Tuple[Optional[str], str]]]]] = None
+        self._reload_again = False
+
+    def _backend_for(self, dialect_name: str) -> str:
+        if self.backend != "auto":
+            return self.backend
+        return "postgres" if dialect_name == "postgresql" else "memory"
+
+    async def search(
+        self,
+        db: AsyncSession,
+        query: str,
+        skip: int = 0,
+        limit: int = 10,
+        sort_by: Optional[str] = None,
+        after_id: Optional[int] = None,
+        after_name: Optional[str] = None,
+    ) -> Tuple[list, int]:
+        repo = AsyncUserRepository(db)
+        use_index = self._backend_for(db.get_bind().dialect.name) == "memory" and len(query) >= MIN_INDEXED_QUERY_LENGTH
+        if use_index and self.index.loaded_at is None:
+            # Индекс ещё собирается в фоне — запрос не ждёт его, а идёт в БД
+            self.reload()
+            use_index = False
+        if not use_index:
+            return await repo.get_page(
+                skip=skip, limit=limit, sort_by=sort_by, search=query,
+                after_id=after_id, after_name=after_name,
+            )
+
+        matches = self.index.match(query)
+        reverse = sort_by in ("id_desc", "name_desc")
+        matches.sort(key=self.index.sort_key(sort_by, query), reverse=reverse)
+        total = len(matches)
+
+        if after_id is not None and sort_by is not None:
+            # Keyset по уже отсортированному списку: начинаем после записи из курсора
+            key = self.index.sort_key(sort_by, query)
+            if sort_by in ("name", "name_desc"):
+                cursor_key = (after_name is None, after_name or "", after_id)
+            else:
+                cursor_key = after_id
+            matches = [user_id for user_id in matches if (key(user_id) < cursor_key if reverse else key(user_id) > cursor_key)]
+            page_ids = matches[:limit]
+        else:
+            page_ids = matches[skip:skip + limit]
+        return await repo.get_many(page_ids), total
+
+    def reload(self) -> asyncio.Task:
+        # Одна пересборка на процесс: конкурентные вызовы получают ту же задачу
+        if self._reload_task is None or self._reload_task.done():
+            self._reload_task = asyncio.get_running_loop().create_task(self._reload())
+        else:
+            self._reload_again = True
+        return self._reload_task
+
+    async def _reload(self):
+        while True:
+            self._reload_again = False
+            self._changes = []
+            try:
+                async with AsyncSessionLocal() as db:
+                    entries = await AsyncUserRepository(db).search_entries()
+                index = await asyncio.get_running_loop().run_in_executor(None, TrigramIndex.build, entries)
+                # Правки, сделанные после чтения таблицы, применяются к новому индексу до подмены
+                for user_id, fields in self._changes:
+                    if fields is None:
+                        index.remove(user_id)
+                    else:
+                        index.add(user_id, *fields)
+                self.index = index
+            except Exception as e:
+                logger.error(f"Error in user search index reload: {e}")
+            finally:
+                self._changes = None
+            if not self._reload_again:
+                return
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(self.refresh_seconds)
+            await self.reload()
+
+    def start(self, dialect_name: str):
+        # Индекс в памяти строится сразу и обновляется в фоне (изменения других воркеров)
+        if self._backend_for(dialect_name) != "memory" or self._refresh_task is not None:
+            return
+        self.reload()
+        if self.refresh_seconds > 0:
+            self._refresh_task = asyncio.get_running_loop().create_task(self._refresh_loop())
+
+    async def stop(self):
+        for task in (self._refresh_task, self._reload_task):
+            if task is not None and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._refresh_task = self._reload_task = None
+
+    def on_user_saved(self, user):
+        if self.index.loaded_at is not None:
+            self.index.add(user.id, user.name, user.login)
+        if self._changes is not None:
+            self._changes.append((user.id, (user.name, user.login)))
+
+    def on_user_deleted(self, user_id: int):
+        self.index.remove(user_id)
+        if self._changes is not None:
+            self._changes.append((user_id, None))
+
+    def invalidate(self):
+        # После массовых вставок проще перечитать индекс целиком; до подмены работает старый
+        if self.index.loaded_at is not None or self._reload_task is not None:
+            self.reload()
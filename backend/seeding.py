@@ -0,0 +1,207 @@
+"""Генерация большого синтетического набора данных для нагрузочного тестирования.
+
+Данные детерминированы: один и тот же seed на пустой базе даёт одни и те же строки
+независимо от числа воркеров. Популярность распределена по степенному закону:
+немногие авторы пишут большую часть постов, немногие посты собирают большую часть лайков.
+"""
+import bisect
+import csv
+import io
+import random
+import time
+from itertools import accumulate
+from multiprocessing import Pool
+from typing import Dict, List, Optional, Tuple
+
+from faker import Faker
+from sqlalchemy import func, insert, select, text
+
+from database import Base, engine as default_engine
+from models import User, Post, post_likes
+from services import _bcrypt_hash, PASSWORD_HASH_ROUNDS
+
+SEED_PASSWORD = "password123"
+
+# Показатель Ципфа для авторов постов и параметр Парето для числа лайков на пост
+AUTHOR_ZIPF_S = 1.1
+LIKES_PARETO_ALPHA = 1.2
+
+_worker_state: Dict = {}
+
+
+def _chunk_seed(seed: int, kind: int, index: int) -> int:
+    return (seed * 1_000_003 + kind) * 1_000_033 + index
+
+
+def _init_worker(user_ids: Tuple[int, int], password_hash: str):
+    first_user_id, users = user_ids
+    # Кумулятивные веса Ципфа: пользователь с рангом r пишет пропорционально 1 / r^s
+    weights = (1 / (rank ** AUTHOR_ZIPF_S) for rank in range(1, users + 1))
+    _worker_state["author_cum_weights"] = list(accumulate(weights))
+    _worker_state["first_user_id"] = first_user_id
+    _worker_state["users"] = users
+    _worker_state["password_hash"] = password_hash
+
+
+def _generate_users(task) -> List[dict]:
+    seed, index, first_id, count = task
+    rnd = random.Random(_chunk_seed(seed, 1, index))
+    fakers = (Faker('ru_RU'), Faker('en_US'))
+    for faker in fakers:
+        faker.seed_instance(_chunk_seed(seed, 2, index))
+    password_hash = _worker_state["password_hash"]
+    rows = []
+    for user_id in range(first_id, first_id + count):
+        faker = fakers[rnd.random() < 0.5]
+        rows.append({
+            "id": user_id,
+            # id в логине гарантирует уникальность без проверок в БД
+            "login": f"{faker.user_name()}{user_id}",
+            "name": faker.name(),
+            "password_hash": password_hash,
+            "password_salt": "",
+        })
+    return rows
+
+
+def _generate_posts(task) -> Tuple[List[dict], List[dict]]:
+    seed, index, first_id, count, likes_per_post = task
+    rnd = random.Random(_chunk_seed(seed, 3, index))
+    first_user_id = _worker_state["first_user_id"]
+    users = _worker_state["users"]
+    cum_weights = _worker_state["author_cum_weights"]
+    total_weight = cum_weights[-1]
+    # Ранги перемешаны детерминированно, чтобы самые активные авторы не были просто первыми id
+    author_rank_offset = _chunk_seed(seed, 4, 0) % users
+
+    posts, likes = [], []
+    for post_id in range(first_id, first_id + count):
+        rank = bisect.bisect_left(cum_weights, rnd.random() * total_weight)
+        author_id = first_user_id + (rank + author_rank_offset) % users
+        like_count = min(users, int(rnd.paretovariate(LIKES_PARETO_ALPHA) * likes_per_post))
+        posts.append({
+            "id": post_id,
+            "title": f"Post {post_id}",
+            "content": f"Synthetic post {post_id} by user {author_id}",
+            "user_id": author_id,
+            "likes_count": like_count,
+        })
+        # Лайкнувшие выбираются без повторов, поэтому пары (post_id, user_id) уникальны
+        for offset in rnd.sample(range(users), like_count):
+            likes.append({"post_id": post_id, "user_id": first_user_id + offset})
+    return posts, likes
+
+
+def _copy_rows(connection, table, rows: List[dict]):
+    # COPY FROM STDIN на Postgres, executemany на остальных базах
+    if not rows:
+        return
+    columns = list(rows[0].keys())
+    if connection.dialect.name == "postgresql" and connection.dialect.driver == "psycopg2":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow([row[column] for column in columns])
+        buffer.seek(0)
+        cursor = connection.connection.cursor()
+        cursor.copy_expert(f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH CSV", buffer)
+    else:
+        connection.execute(insert(table), rows)
+
+
+class _Progress:
+    def __init__(self, label: str, total: int):
+        self.label = label
+        self.total = total
+        self.done = 0
+        self.started = time.perf_counter()
+
+    def advance(self, count: int):
+        self.done += count
+        elapsed = time.perf_counter() - self.started
+        rate = self.done / elapsed if elapsed else 0
+        print(f"{self.label}: {self.done}/{self.total} ({rate:.0f} rows/s)", flush=True)
+
+
+def _next_id(connection, column) -> int:
+    return (connection.execute(select(func.max(column))).scalar() or 0) + 1
+
+
+def seed_database(
+    users: int,
+    posts: int,
+    likes: int,
+    seed: int = 42,
+    workers: int = 1,
+    chunk_size: int = 10000,
+    rounds: int = PASSWORD_HASH_ROUNDS,
+    engine=None,
+) -> Dict[str, int]:
+    """Добавляет users пользователей, posts постов и примерно likes лайков. Возвращает фактические числа."""
+    engine = engine or default_engine
+    if users <= 0:
+        raise ValueError("users must be positive")
+
+    # Пароль у всех одинаковый — один bcrypt на весь набор данных
+    password_hash = _bcrypt_hash(SEED_PASSWORD, rounds)
+
+    Base.metadata.create_all(bind=engine)
+    with engine.connect() as connection:
+        first_user_id = _next_id(connection, User.id)
+        first_post_id = _next_id(connection, Post.id)
+
+    likes_per_post = 0.0
+    if posts:
+        mean_pareto = LIKES_PARETO_ALPHA / (LIKES_PARETO_ALPHA - 1)
+        likes_per_post = likes / (posts * mean_pareto)
+
+    user_tasks = [
+        (seed, index, first_user_id + start, min(chunk_size, users - start))
+        for index, start in enumerate(range(0, users, chunk_size))
+    ]
+    post_tasks = [
+        (seed, index, first_post_id + start, min(chunk_size, posts - start), likes_per_post)
+        for index, start in enumerate(range(0, posts, chunk_size))
+    ]
+    init_args = ((first_user_id, users), password_hash)
+
+    pool: Optional[Pool] = None
+    if workers > 1:
+        pool = Pool(processes=workers, initializer=_init_worker, initargs=init_args)
+        imap = pool.imap
+    else:
+        _init_worker(*init_args)
+        imap = map
+
+    totals = {"users": 0, "posts": 0, "likes": 0}
+    try:
+        user_progress = _Progress("users", users)
+        for rows in imap(_generate_users, user_tasks):
+            with engine.begin() as connection:
+                _copy_rows(connection, User.__table__, rows)
+            totals["users"] += len(rows)
+            user_progress.advance(len(rows))
+
+        post_progress = _Progress("posts", posts)
+        for post_rows, like_rows in imap(_generate_posts, post_tasks):
+            with engine.begin() as connection:
+                _copy_rows(connection, Post.__table__, post_rows)
+                _copy_rows(connection, post_likes, like_rows)
+            totals["posts"] += len(post_rows)
+            totals["likes"] += len(like_rows)
+            post_progress.advance(len(post_rows))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    if engine.dialect.name == "postgresql":
+        # id вставлялись явно — подтягиваем последовательности
+        with engine.begin() as connection:
+            for table in ("users", "posts"):
+                connection.execute(text(
+                    f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT max(id) FROM {table}))"
+                ))
+
+    print(f"Seeded {totals['users']} users, {totals['posts']} posts, {totals['likes']} likes", flush=True)
+    return totals
@@ -1,20 +1,132 @@
+import asyncio
+import hashlib
+import hmac
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Dict, Set, Tuple
+import bcrypt
 from jose import JWTError, jwt
 from fastapi import HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
-from database import get_db
-from repositories import UserRepository
-from models import User
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_async_db
+from repositories import AsyncUserRepository
+from exceptions import ServiceUnavailableException
 
 SECRET_KEY = "tokentokentokentokentokentoken"  # Замените на свой секретный ключ
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# Кэш проверенных токенов: сколько держать запись и сколько записей максимум
+AUTH_CACHE_TTL_SECONDS = int(os.getenv("AUTH_CACHE_TTL_SECONDS", "60"))
+AUTH_CACHE_MAX_SIZE = int(os.getenv("AUTH_CACHE_MAX_SIZE", "10000"))
+# Stateless-режим: id пользователя берётся из токена, read-only маршруты не ходят в БД
+AUTH_STATELESS = os.getenv("AUTH_STATELESS", "false").lower() in ("1", "true", "yes")
+
+# Хеширование паролей: пул (thread/process/inline), число воркеров, длина очереди и стоимость bcrypt
+PASSWORD_HASH_EXECUTOR = os.getenv("PASSWORD_HASH_EXECUTOR", "thread")
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_QUEUE_LIMIT = int(os.getenv("PASSWORD_HASH_QUEUE_LIMIT", "32"))
+PASSWORD_HASH_ROUNDS = int(os.getenv("PASSWORD_HASH_ROUNDS", "12"))
+PASSWORD_HASH_RETRY_AFTER = int(os.getenv("PASSWORD_HASH_RETRY_AFTER", "1"))
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="users/login")
+# Для маршрутов, открытых анонимам: без заголовка Authorization токен просто None, а не 401
+oauth2_scheme_optional = OAuth2PasswordBearer(tokenUrl="users/login", auto_error=False)
+
+
+@dataclass(frozen=True)
+class Principal:
+    """Аутентифицированный пользователь без ORM-объекта: всё, что нужно маршрутам."""
+    id: int
+    login: str
+
+
+class PrincipalCache:
+    """LRU-кэш token -> Principal с TTL, не переживающим exp самого токена."""
+
+    def __init__(self, max_size: int = AUTH_CACHE_MAX_SIZE, ttl: int = AUTH_CACHE_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[Principal, float, bool]]" = OrderedDict()
+        self._tokens_by_user: Dict[int, Set[str]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, token: str, require_verified: bool = False) -> Optional[Principal]:
+        entry = self._entries.get(token)
+        if entry is None:
+            self.misses += 1
+            return None
+        principal, expires_at, verified = entry
+        if expires_at <= time.time():
+            self._discard(token)
+            self.misses += 1
+            return None
+        if require_verified and not verified:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(token)
+        self.hits += 1
+        return principal
+
+    def put(self, token: str, principal: Principal, token_exp: Optional[float] = None, verified: bool = True):
+        if self.max_size <= 0:
+            return
+        expires_at = time.time() + self.ttl
+        if token_exp is not None:
+            expires_at = min(expires_at, token_exp)
+        self._discard(token)
+        # verified=False — пользователь взят из токена без проверки в БД (stateless)
+        self._entries[token] = (principal, expires_at, verified)
+        self._tokens_by_user.setdefault(principal.id, set()).add(token)
+        while len(self._entries) > self.max_size:
+            oldest = next(iter(self._entries))
+            self._discard(oldest)
+            self.evictions += 1
+
+    def invalidate_user(self, user_id: int):
+        for token in list(self._tokens_by_user.get(user_id, ())):
+            self._discard(token)
+
+    def clear(self):
+        self._entries.clear()
+        self._tokens_by_user.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+    def _discard(self, token: str):
+        entry = self._entries.pop(token, None)
+        if entry is None:
+            return
+        tokens = self._tokens_by_user.get(entry[0].id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_user[entry[0].id]
+
 
 class TokenService:
+    def __init__(self, stateless: bool = AUTH_STATELESS):
+        self.stateless = stateless
+        self.cache = PrincipalCache()
+        # id удалённых пользователей: в stateless-режиме их токены живут до exp,
+        # поэтому отсекаем их хотя бы в пределах процесса
+        self._revoked_user_ids: Set[int] = set()
+
     def create_access_token(self, data: dict) -> str:
         to_encode = data.copy()
         expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -22,37 +134,141 @@ class TokenService:
         encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
         return encoded_jwt
 
-    def get_current_user(self, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> User:
-        credentials_exception = HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Could not validate credentials",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+    def invalidate_user(self, user_id: int, deleted: bool = False):
+        self.cache.invalidate_user(user_id)
+        if deleted:
+            self._revoked_user_ids.add(user_id)
+
+    async def _authenticate(self, token: str, db: AsyncSession, trust_token: bool) -> Optional[Principal]:
+        principal = self.cache.get(token, require_verified=not trust_token)
+        if principal is not None:
+            return principal
+
         try:
             payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-            login: str = payload.get("sub")
-            if login is None:
-                raise credentials_exception
         except JWTError:
-            raise credentials_exception
+            return None
+        login: str = payload.get("sub")
+        if login is None:
+            return None
+
+        user_id = payload.get("uid")
+        if trust_token and self.stateless and isinstance(user_id, int):
+            if user_id in self._revoked_user_ids:
+                return None
+            principal = Principal(id=user_id, login=login)
+            verified = False
+        else:
+            repo = AsyncUserRepository(db)
+            user = await repo.get_by_login(login)
+            if user is None:
+                return None
+            principal = Principal(id=user.id, login=user.login)
+            verified = True
+
+        self.cache.put(token, principal, payload.get("exp"), verified=verified)
+        return principal
 
-        repo = UserRepository(db)
-        user = repo.get_by_login(login)
-        if user is None:
-            raise credentials_exception
-        return user
+    async def get_current_user(self, token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)) -> Principal:
+        principal = await self._authenticate(token, db, trust_token=False)
+        if principal is None:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Could not validate credentials",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        return principal
 
-    def get_current_user_optional(self, token: Optional[str] = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> Optional[User]:
+    async def get_current_user_optional(self, token: Optional[str] = Depends(oauth2_scheme_optional), db: AsyncSession = Depends(get_async_db)) -> Optional[Principal]:
         if not token:
             return None
-        try:
-            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-            login: str = payload.get("sub")
-            if login is None:
-                return None
-        except JWTError:
+        return await self._authenticate(token, db, trust_token=False)
+
+    async def get_current_principal(self, token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)) -> Principal:
+        # Для read-only маршрутов: в stateless-режиме пользователь не ищется в БД
+        principal = await self._authenticate(token, db, trust_token=True)
+        if principal is None:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Could not validate credentials",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        return principal
+
+    async def get_current_principal_optional(self, token: Optional[str] = Depends(oauth2_scheme_optional), db: AsyncSession = Depends(get_async_db)) -> Optional[Principal]:
+        if not token:
+            return None
+        return await self._authenticate(token, db, trust_token=True)
+
+
+def _bcrypt_hash(password: str, rounds: int) -> str:
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds=rounds)).decode()
+
+
+def _bcrypt_verify(password: str, password_hash: str) -> bool:
+    return bcrypt.checkpw(password.encode(), password_hash.encode())
+
+
+class PasswordHasher:
+    """Выполняет bcrypt вне event loop в ограниченном пуле.
+
+    Если все воркеры заняты и очередь заполнена, новая задача сразу получает
+    ServiceUnavailableException (маршрут отвечает 503 с Retry-After), а не ждёт.
+    """
+
+    def __init__(
+        self,
+        executor: str = PASSWORD_HASH_EXECUTOR,
+        workers: int = PASSWORD_HASH_WORKERS,
+        queue_limit: int = PASSWORD_HASH_QUEUE_LIMIT,
+        rounds: int = PASSWORD_HASH_ROUNDS,
+        retry_after: int = PASSWORD_HASH_RETRY_AFTER,
+    ):
+        self.executor_kind = executor
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.rounds = rounds
+        self.retry_after = retry_after
+        self._executor: Optional[Executor] = None
+        self._pending = 0
+
+    def _get_executor(self) -> Optional[Executor]:
+        if self.executor_kind == "inline":
             return None
+        if self._executor is None:
+            if self.executor_kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password-hash")
+        return self._executor
+
+    def check_capacity(self):
+        # Позволяет отказать сразу, ещё до запросов в БД
+        if self.executor_kind != "inline" and self._pending >= self.workers + self.queue_limit:
+            raise ServiceUnavailableException("Password hashing is overloaded, try again later", retry_after=self.retry_after)
+
+    async def _run(self, func, *args):
+        executor = self._get_executor()
+        if executor is None:
+            return func(*args)
+        self.check_capacity()
+        self._pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+        finally:
+            self._pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(_bcrypt_hash, password, self.rounds)
+
+    async def verify(self, password: str, password_hash: str, password_salt: Optional[str] = None) -> bool:
+        if password_hash and password_hash.startswith("$2"):
+            return await self._run(_bcrypt_verify, password, password_hash)
+        # Старые пользователи: sha256(password + salt), это дёшево и считается на месте
+        legacy_hash = hashlib.sha256((password + (password_salt or "")).encode()).hexdigest()
+        return hmac.compare_digest(legacy_hash, password_hash or "")
 
-        repo = UserRepository(db)
-        user = repo.get_by_login(login)
-        return user
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,56 @@
+import asyncio
+
+from cache import CachedPage, ResponseCache
+
+
+def make_page(body: bytes = b"[]") -> CachedPage:
+    return CachedPage(body=body, post_ids=frozenset(), offset_based=True, min_post_id=None, headers={}, etag='"x"')
+
+
+def test_cancelled_leader_does_not_cancel_waiters():
+    async def scenario():
+        cache = ResponseCache()
+        started = asyncio.Event()
+        release = asyncio.Event()
+
+        async def loader():
+            started.set()
+            await release.wait()
+            return make_page(b"page")
+
+        leader = asyncio.create_task(cache.get_or_load("k", loader))
+        await started.wait()
+        waiter = asyncio.create_task(cache.get_or_load("k", loader))
+        await asyncio.sleep(0)
+
+        leader.cancel()
+        await asyncio.sleep(0)
+        release.set()
+
+        page = await waiter
+        assert leader.cancelled()
+        assert page.body == b"page"
+        assert cache.coalesced == 1
+        # Загрузка завершилась и попала в кэш, хотя инициатор был отменён
+        assert cache.get("k") is page
+
+    asyncio.run(scenario())
+
+
+def test_loader_error_reaches_leader_and_waiters():
+    async def scenario():
+        cache = ResponseCache()
+        release = asyncio.Event()
+
+        async def loader():
+            await release.wait()
+            raise ValueError("boom")
+
+        tasks = [asyncio.create_task(cache.get_or_load("k", loader)) for _ in range(2)]
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        assert all(isinstance(result, ValueError) for result in results)
+        assert cache.get("k") is None
+
+    asyncio.run(scenario())
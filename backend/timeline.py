@@ -0,0 +1,128 @@
+"""Домашние ленты: посты тех, на кого подписан пользователь.
+
+Лента материализуется при записи: id нового поста одной вставкой раскладывается
+в home_timeline всем подписчикам автора (fan-out on write) — в фоне, после ответа
+на создание поста. Чтение страницы — диапазон по ключу (user_id, post_id), O(limit).
+У авторов, у которых подписчиков не меньше TIMELINE_CELEBRITY_FOLLOWERS, рассылки нет:
+их посты подмешиваются при чтении (fan-out on read) — по limit последних с каждого.
+Лента хранит не больше TIMELINE_MAX_LENGTH последних id, лишнее подрезается
+при чтении (не чаще TIMELINE_TRIM_INTERVAL_SECONDS) и командой trim-timelines.
+"""
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, FrozenSet, List, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import AsyncSessionLocal
+from log import get_logger
+from repositories import AsyncTimelineRepository
+
+TIMELINE_MAX_LENGTH = int(os.getenv("TIMELINE_MAX_LENGTH", "800"))
+TIMELINE_CELEBRITY_FOLLOWERS = int(os.getenv("TIMELINE_CELEBRITY_FOLLOWERS", "10000"))
+# Сколько последних постов автора попадает в ленту сразу после подписки
+TIMELINE_BACKFILL_POSTS = int(os.getenv("TIMELINE_BACKFILL_POSTS", "50"))
+# Как часто перечитывается список знаменитостей (изменения других воркеров)
+TIMELINE_CELEBRITY_REFRESH_SECONDS = float(os.getenv("TIMELINE_CELEBRITY_REFRESH_SECONDS", "60"))
+TIMELINE_TRIM_INTERVAL_SECONDS = float(os.getenv("TIMELINE_TRIM_INTERVAL_SECONDS", "600"))
+
+logger = get_logger("timeline")
+
+
+class TimelineService:
+    def __init__(
+        self,
+        max_length: int = TIMELINE_MAX_LENGTH,
+        celebrity_followers: int = TIMELINE_CELEBRITY_FOLLOWERS,
+        backfill_posts: int = TIMELINE_BACKFILL_POSTS,
+        max_cached_readers: int = 10000,
+    ):
+        self.max_length = max_length
+        self.celebrity_followers = celebrity_followers
+        self.backfill_posts = backfill_posts
+        self.max_cached_readers = max_cached_readers
+        self._celebrities: FrozenSet[int] = frozenset()
+        self._celebrities_loaded_at: Optional[float] = None
+        # Читатель -> на каких знаменитостей он подписан (LRU, сбрасывается при перечитывании списка)
+        self._followed_celebrities: "OrderedDict[int, List[int]]" = OrderedDict()
+        self._trimmed_at: Dict[int, float] = {}
+
+    async def _celebrity_ids(self, db: AsyncSession) -> FrozenSet[int]:
+        now = time.monotonic()
+        if self._celebrities_loaded_at is None or now - self._celebrities_loaded_at > TIMELINE_CELEBRITY_REFRESH_SECONDS:
+            ids = await AsyncTimelineRepository(db).get_celebrity_ids(self.celebrity_followers)
+            self._celebrities = frozenset(ids)
+            self._celebrities_loaded_at = now
+            self._followed_celebrities.clear()
+        return self._celebrities
+
+    async def _followed_celebrity_ids(self, db: AsyncSession, user_id: int) -> List[int]:
+        celebrities = await self._celebrity_ids(db)
+        if not celebrities:
+            return []
+        followed = self._followed_celebrities.get(user_id)
+        if followed is None:
+            followed = await AsyncTimelineRepository(db).get_followed_among(user_id, list(celebrities))
+            self._followed_celebrities[user_id] = followed
+            while len(self._followed_celebrities) > self.max_cached_readers:
+                self._followed_celebrities.popitem(last=False)
+        else:
+            self._followed_celebrities.move_to_end(user_id)
+        return followed
+
+    async def fan_out(self, post_id: int, author_id: int):
+        # Фоновая задача после ответа на создание поста: открывает свою сессию
+        try:
+            async with AsyncSessionLocal() as db:
+                repo = AsyncTimelineRepository(db)
+                followers = await repo.get_followers_count(author_id)
+                delivered = await repo.fan_out(post_id, author_id, to_followers=followers < self.celebrity_followers)
+                logger.debug(f"Post {post_id} delivered to {delivered} timelines")
+        except Exception as e:
+            logger.error(f"Error in timeline fan-out for post {post_id}: {e}")
+
+    async def on_follow(self, db: AsyncSession, follower_id: int, followee_id: int, followers_count: int):
+        if followers_count >= self.celebrity_followers:
+            # Посты знаменитости подмешиваются при чтении, в ленту их не копируем
+            self._followed_celebrities.pop(follower_id, None)
+            return
+        await AsyncTimelineRepository(db).backfill(follower_id, followee_id, self.backfill_posts)
+
+    async def on_unfollow(self, db: AsyncSession, follower_id: int, followee_id: int):
+        self._followed_celebrities.pop(follower_id, None)
+        await AsyncTimelineRepository(db).remove_author(follower_id, followee_id)
+
+    async def page_ids(self, db: AsyncSession, user_id: int, limit: int, after_id: Optional[int] = None) -> List[int]:
+        # Материализованная часть и посты знаменитостей, по убыванию id без повторов
+        repo = AsyncTimelineRepository(db)
+        post_ids = await repo.get_page_ids(user_id, limit, after_id)
+        celebrity_ids = await self._followed_celebrity_ids(db, user_id)
+        if celebrity_ids:
+            post_ids = sorted(
+                set(post_ids) | set(await repo.get_author_post_ids(celebrity_ids, limit, after_id)),
+                reverse=True,
+            )[:limit]
+        return post_ids
+
+    async def maybe_trim(self, user_id: int):
+        # Фоновая задача после чтения ленты: подрезка не чаще раза в интервал на читателя
+        now = time.monotonic()
+        if now - self._trimmed_at.get(user_id, float("-inf")) < TIMELINE_TRIM_INTERVAL_SECONDS:
+            return
+        if len(self._trimmed_at) > self.max_cached_readers:
+            self._trimmed_at = {
+                uid: at for uid, at in self._trimmed_at.items() if now - at < TIMELINE_TRIM_INTERVAL_SECONDS
+            }
+        self._trimmed_at[user_id] = now
+        try:
+            async with AsyncSessionLocal() as db:
+                await AsyncTimelineRepository(db).trim(user_id, self.max_length)
+        except Exception as e:
+            logger.error(f"Error in timeline trim for user {user_id}: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "celebrities": len(self._celebrities),
+            "cached_readers": len(self._followed_celebrities),
+        }
@@ -0,0 +1,235 @@
+"""Популярные посты: рейтинг по скорости набора лайков с экспоненциальным затуханием.
+
+Счёт поста — сумма лайков, каждый из которых теряет половину веса за
+TRENDING_HALF_LIFE_SECONDS. Чтобы не пересчитывать все счета со временем, вес
+лайка хранится относительно опорного момента: лайк в момент t добавляет
+exp(λ·(t − epoch)), порядок постов от хода времени не меняется. Счёт обновляется
+инкрементально в like/unlike, лучшие TRENDING_TOP_SIZE постов держатся
+в отсортированном списке — страница рейтинга не требует сортировки таблицы постов.
+
+Состояние периодически сохраняется в trending_scores и читается оттуда при старте:
+post_likes не хранит время лайков, пересчитать рейтинг по нему всё равно нельзя.
+Счета локальны для процесса, как и кэш ленты: при нескольких воркерах каждый видит
+свои лайки, а снимок сохраняет тот воркер, который записал его последним.
+"""
+import asyncio
+import heapq
+import math
+import os
+import time
+from bisect import bisect_left, insort
+from typing import Dict, List, Optional, Tuple
+
+from database import AsyncSessionLocal
+from log import get_logger
+from repositories import AsyncTrendingRepository
+
+TRENDING_HALF_LIFE_SECONDS = float(os.getenv("TRENDING_HALF_LIFE_SECONDS", str(6 * 3600)))
+# Сколько лучших постов отдаёт рейтинг и сколько постов со счётом отслеживается всего
+TRENDING_TOP_SIZE = int(os.getenv("TRENDING_TOP_SIZE", "1000"))
+TRENDING_MAX_TRACKED = int(os.getenv("TRENDING_MAX_TRACKED", "100000"))
+# Посты, чей счёт затух ниже порога (в лайках), при сохранении снимка забываются
+TRENDING_MIN_SCORE = float(os.getenv("TRENDING_MIN_SCORE", "0.05"))
+TRENDING_CHECKPOINT_SECONDS = float(os.getenv("TRENDING_CHECKPOINT_SECONDS", "60"))
+
+# Опорный момент сдвигается, пока веса не стали слишком большими для float
+MAX_EXPONENT = 50.0
+
+logger = get_logger("trending")
+
+
+class TopK:
+    """Счета отслеживаемых постов и capacity лучших из них в отсортированном списке.
+
+    Рост счёта — вставка в список за O(capacity); если счёт участника списка уменьшился,
+    а вне списка есть другие посты, список пересобирается по heapq.nlargest при чтении.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._scores: Dict[int, float] = {}
+        # По возрастанию (score, post_id): первый элемент — кандидат на вытеснение
+        self._ranked: List[Tuple[float, int]] = []
+        self._members: Dict[int, float] = {}
+        self._stale = False
+
+    def __len__(self) -> int:
+        return len(self._scores)
+
+    def get(self, post_id: int) -> float:
+        return self._scores.get(post_id, 0.0)
+
+    def set(self, post_id: int, score: float):
+        self._scores[post_id] = score
+        if self._stale:
+            return
+        old = self._members.pop(post_id, None)
+        if old is not None:
+            del self._ranked[bisect_left(self._ranked, (old, post_id))]
+            if score < old and len(self._scores) > len(self._members) + 1:
+                # Пост вне списка мог обогнать уменьшившийся — пересоберём при чтении
+                self._stale = True
+                return
+        if len(self._ranked) < self.capacity:
+            self._insert(post_id, score)
+        elif (score, post_id) > self._ranked[0]:
+            _, evicted = self._ranked.pop(0)
+            del self._members[evicted]
+            self._insert(post_id, score)
+
+    def remove(self, post_id: int):
+        if self._scores.pop(post_id, None) is None:
+            return
+        old = self._members.pop(post_id, None)
+        if old is not None and not self._stale:
+            del self._ranked[bisect_left(self._ranked, (old, post_id))]
+            if len(self._scores) > len(self._members):
+                self._stale = True
+
+    def _insert(self, post_id: int, score: float):
+        insort(self._ranked, (score, post_id))
+        self._members[post_id] = score
+
+    def _rebuild(self):
+        self._ranked = sorted(heapq.nlargest(self.capacity, ((score, post_id) for post_id, score in self._scores.items())))
+        self._members = {post_id: score for score, post_id in self._ranked}
+        self._stale = False
+
+    def top(self, skip: int, limit: int) -> List[int]:
+        if self._stale:
+            self._rebuild()
+        end = len(self._ranked) - skip
+        return [post_id for _, post_id in reversed(self._ranked[max(0, end - limit):max(0, end)])]
+
+    def items(self) -> List[Tuple[int, float]]:
+        return list(self._scores.items())
+
+    def reset(self, scores: Dict[int, float]):
+        self._scores = scores
+        self._rebuild()
+
+
+class TrendingService:
+    def __init__(
+        self,
+        half_life: float = TRENDING_HALF_LIFE_SECONDS,
+        top_size: int = TRENDING_TOP_SIZE,
+        max_tracked: int = TRENDING_MAX_TRACKED,
+        min_score: float = TRENDING_MIN_SCORE,
+    ):
+        self.decay = math.log(2) / half_life
+        self.max_tracked = max_tracked
+        self.min_score = min_score
+        self.scores = TopK(top_size)
+        self._epoch = time.time()
+        self._checkpoint_task: Optional[asyncio.Task] = None
+        self.checkpoints = 0
+
+    def _weight(self, now: float) -> float:
+        exponent = self.decay * (now - self._epoch)
+        if exponent > MAX_EXPONENT:
+            self._rebase(now)
+            exponent = 0.0
+        return math.exp(exponent)
+
+    def _rebase(self, now: float):
+        # Все веса делятся на один множитель — порядок не меняется
+        factor = math.exp(-self.decay * (now - self._epoch))
+        self._epoch = now
+        self.scores.reset({post_id: score * factor for post_id, score in self.scores.items()})
+
+    def current_score(self, post_id: int, now: Optional[float] = None) -> float:
+        # Счёт в "лайках на сейчас": вес, приведённый к текущему моменту
+        now = time.time() if now is None else now
+        return self.scores.get(post_id) * math.exp(-self.decay * (now - self._epoch))
+
+    def on_likes_changed(self, post_ids: List[int], delta: int, now: Optional[float] = None):
+        # delta > 0 — лайки поставлены, < 0 — сняты. Время снятого лайка неизвестно,
+        # поэтому снимается вес свежего лайка (не ниже нуля)
+        now = time.time() if now is None else now
+        weight = self._weight(now) * delta
+        for post_id in post_ids:
+            score = self.scores.get(post_id) + weight
+            if score > 0:
+                self.scores.set(post_id, score)
+            else:
+                self.scores.remove(post_id)
+        if len(self.scores) > self.max_tracked:
+            self._prune(now)
+
+    def on_post_deleted(self, post_id: int):
+        self.scores.remove(post_id)
+
+    def page_ids(self, skip: int, limit: int) -> List[int]:
+        return self.scores.top(skip, limit)
+
+    def _prune(self, now: float):
+        # Затухшие посты забываются; если отслеживаемых всё ещё слишком много, остаются лучшие
+        # с запасом в десятую часть лимита, чтобы следующий новый пост не вызвал чистку снова
+        threshold = self.min_score * math.exp(self.decay * (now - self._epoch))
+        kept = {post_id: score for post_id, score in self.scores.items() if score >= threshold}
+        if len(kept) > self.max_tracked:
+            keep = self.max_tracked - self.max_tracked // 10
+            kept = dict(heapq.nlargest(keep, kept.items(), key=lambda item: item[1]))
+        self.scores.reset(kept)
+
+    def snapshot(self, now: Optional[float] = None) -> List[Tuple[int, float]]:
+        now = time.time() if now is None else now
+        self._prune(now)
+        factor = math.exp(-self.decay * (now - self._epoch))
+        return [(post_id, score * factor) for post_id, score in self.scores.items()]
+
+    def restore(self, rows: List[Tuple[int, float, float]], now: Optional[float] = None):
+        # Счёт из снимка приводится к опорному моменту с учётом времени, прошедшего с сохранения
+        now = time.time() if now is None else now
+        self._epoch = now
+        self.scores.reset({
+            post_id: score * math.exp(-self.decay * (now - checkpointed_at))
+            for post_id, score, checkpointed_at in rows
+        })
+        self._prune(now)
+
+    async def load(self):
+        try:
+            async with AsyncSessionLocal() as db:
+                rows = await AsyncTrendingRepository(db).load()
+            self.restore(rows)
+            logger.info(f"Trending scores restored for {len(self.scores)} posts")
+        except Exception as e:
+            logger.error(f"Error in trending restore: {e}")
+
+    async def checkpoint(self):
+        now = time.time()
+        entries = self.snapshot(now)
+        async with AsyncSessionLocal() as db:
+            await AsyncTrendingRepository(db).save(entries, now)
+        self.checkpoints += 1
+
+    async def _checkpoint_loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.checkpoint()
+            except Exception as e:
+                logger.error(f"Error in trending checkpoint: {e}")
+
+    async def start(self, interval: float = TRENDING_CHECKPOINT_SECONDS):
+        await self.load()
+        if self._checkpoint_task is None and interval > 0:
+            self._checkpoint_task = asyncio.create_task(self._checkpoint_loop(interval))
+
+    async def stop(self):
+        if self._checkpoint_task is not None:
+            self._checkpoint_task.cancel()
+            self._checkpoint_task = None
+        try:
+            await self.checkpoint()
+        except Exception as e:
+            logger.error(f"Error in trending checkpoint: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "tracked": len(self.scores),
+            "top_size": self.scores.capacity,
+            "checkpoints": self.checkpoints,
+        }
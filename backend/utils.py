@@ -1,6 +1,10 @@
 from faker import Faker
 from passlib.context import CryptContext
+import base64
+import hashlib
+import json
 import random
+from typing import Optional
 
 # Инициализация Faker с поддержкой русского и английского языков
 faker_ru = Faker('ru_RU')  # Для русских имён
@@ -9,7 +13,7 @@ faker_en = Faker('en_US')  # Для английских имён
 # Настройка хеширования паролей (совместимо с вашим token_service)
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
-def generate_random_user():
+def generate_random_user(password_hash: str = None):
     # Случайно выбираем язык (русский или английский)
     use_russian = random.choice([True, False])
     faker = faker_ru if use_russian else faker_en
@@ -22,7 +26,9 @@ def generate_random_user():
     
     # Генерируем пароль
     password = "password123"  # Простой пароль для тестов
-    password_hash = pwd_context.hash(password)
+    # Хеш можно посчитать заранее (в пуле хеширования), чтобы не делать bcrypt здесь
+    if password_hash is None:
+        password_hash = pwd_context.hash(password)
     password_salt = ""  # Оставим пустым, так как соль уже включена в bcrypt
 
     return {
@@ -31,4 +37,32 @@ def generate_random_user():
         "password": password,
         "password_hash": password_hash,
         "password_salt": password_salt
-    }
\ No newline at end of file
+    }
+
+def encode_cursor(**values) -> str:
+    # Непрозрачный курсор для keyset-пагинации: base64url от JSON с ключом сортировки
+    raw = json.dumps(values, separators=(",", ":"), ensure_ascii=False).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> dict:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+    if not isinstance(values, dict) or not isinstance(values.get("id"), int):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return values
+
+def make_etag(*parts) -> str:
+    # Сильный ETag: хеш от id и версий строк, из которых собран ответ
+    digest = hashlib.sha1("|".join(str(part) for part in parts).encode()).hexdigest()[:24]
+    return f'"{digest}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    # If-None-Match сравнивается слабо: W/"x" совпадает с "x"
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
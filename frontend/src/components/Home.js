@@ -42,6 +42,24 @@ export function Home() {
       });
   }, [setLoading]);
 
+  useEffect(() => {
+    return postService.subscribeToFeed((events) => {
+      setPosts((current) => {
+        let next = current;
+        for (const { type, post } of events) {
+          if (type === 'post_created') {
+            if (!next.some((p) => p.id === post.id)) next = [post, ...next];
+          } else if (type === 'post_deleted') {
+            next = next.filter((p) => p.id !== post.id);
+          } else {
+            next = next.map((p) => (p.id === post.id ? { ...p, ...post } : p));
+          }
+        }
+        return next;
+      });
+    });
+  }, []);
+
   if (error) return <div className="error">Ошибка: {error}</div>;
 
   return (
@@ -1,4 +1,4 @@
-import React, { useState, useContext } from 'react';
+import React, { useState, useContext, useEffect } from 'react';
 import { postService } from '../services/postService';
 import { AuthContext } from '../contexts/AuthContext';
 import { Typography, Box, Button, TextField } from '@mui/material';
@@ -11,6 +11,11 @@ export default function Post({ post }) {
   const [error, setError] = useState(null);
   const [postState, setPostState] = useState(post);
 
+  // Изменения из потока ленты (лайки, правки) приходят через props
+  useEffect(() => {
+    setPostState((current) => ({ ...current, ...post, liked_by_me: current.liked_by_me }));
+  }, [post]);
+
   const handleLike = async () => {
     try {
       if (postState.liked_by_me) {
@@ -5,8 +5,16 @@ const axiosInstance = axios.create({
   headers: {
     'Content-Type': 'application/json',
   },
+  // 304 Not Modified — не ошибка: данные берутся из etagCache
+  validateStatus: (status) => (status >= 200 && status < 300) || status === 304,
 });
 
+// Условные GET: для каждого URL храним последний ETag и тело ответа
+const ETAG_CACHE_MAX_ENTRIES = 200;
+const etagCache = new Map();
+
+const isGet = (config) => (config.method || 'get').toLowerCase() === 'get';
+
 axiosInstance.interceptors.request.use(
   (config) => {
     const token = localStorage.getItem('token');
@@ -16,6 +24,12 @@ axiosInstance.interceptors.request.use(
     } else {
       console.log('No token found in localStorage');
     }
+    if (isGet(config)) {
+      const cached = etagCache.get(axiosInstance.getUri(config));
+      if (cached) {
+        config.headers['If-None-Match'] = cached.etag;
+      }
+    }
     return config;
   },
   (error) => {
@@ -25,7 +39,28 @@ axiosInstance.interceptors.request.use(
 );
 
 axiosInstance.interceptors.response.use(
-  (response) => response,
+  (response) => {
+    if (!isGet(response.config)) {
+      return response;
+    }
+    const key = axiosInstance.getUri(response.config);
+    if (response.status === 304) {
+      const cached = etagCache.get(key);
+      if (cached) {
+        return { ...response, status: 200, data: cached.data, headers: { ...cached.headers, ...response.headers } };
+      }
+      return response;
+    }
+    const etag = response.headers.etag;
+    if (etag) {
+      etagCache.delete(key);
+      etagCache.set(key, { etag, data: response.data, headers: response.headers });
+      if (etagCache.size > ETAG_CACHE_MAX_ENTRIES) {
+        etagCache.delete(etagCache.keys().next().value);
+      }
+    }
+    return response;
+  },
   (error) => {
     console.error('Response error:', {
       message: error.message,
@@ -2,11 +2,21 @@ import axiosInstance from './axiosInstance';
 
 export const postService = {
   getPosts: () => axiosInstance.get(`/users/posts/?skip=0&limit=10`).then(response => response.data),
-  getPostsByUser: (userId) => axiosInstance.get(`/users/${userId}/posts/`).then(response => response.data),
+  getPostsByUser: (userId, limit = 20, cursor = null) => {
+    let url = `/users/${userId}/posts/?limit=${limit}`;
+    if (cursor) url += `&cursor=${encodeURIComponent(cursor)}`;
+    return axiosInstance.get(url).then(response => response.data);
+  },
   getPost: (postId) => axiosInstance.get(`/users/posts/${postId}`).then(response => response.data),
   createPost: (userId, post) => axiosInstance.post(`/users/${userId}/posts/`, post).then(response => response.data),
   updatePost: (postId, post) => axiosInstance.put(`/users/posts/${postId}`, post).then(response => response.data),
   deletePost: (postId) => axiosInstance.delete(`/users/posts/${postId}`).then(response => response.data),
   likePost: (postId) => axiosInstance.post(`/users/posts/${postId}/like`).then(response => response.data),
   unlikePost: (postId) => axiosInstance.delete(`/users/posts/${postId}/like`).then(response => response.data),
+  // Поток изменений ленты (SSE): onEvents получает массив {type, post}; возвращает функцию отписки
+  subscribeToFeed: (onEvents) => {
+    const source = new EventSource(`${process.env.REACT_APP_API_URL}/users/posts/stream`);
+    source.onmessage = (event) => onEvents(JSON.parse(event.data));
+    return () => source.close();
+  },
 };
\ No newline at end of file